@@ -1,11 +1,30 @@
 import click
 
+from .config import parameter_vars
+
 
 def split_key_val_pairs(context, parameter, args):  # pylint: disable=unused-argument
     """Split key-value pairs into a dictionary"""
     return dict(arg.split("=") for arg in args)
 
 
+def validate_parameter_names(context, parameter, args):
+    """Validate that names can be used as CloudFormation parameters"""
+    try:
+        parameter_vars(args)
+    except ValueError as error:
+        raise click.BadParameter(str(error), context, parameter)
+
+    return args
+
+
+def split_parameter_pairs(context, parameter, args):
+    """Split key-value pairs into a dictionary of CloudFormation parameters"""
+    parameters = split_key_val_pairs(context, parameter, args)
+    validate_parameter_names(context, parameter, parameters.keys())
+    return parameters
+
+
 CONFIG_OPTION = click.option(
     "--config", "config_file", type=click.File("r"), required=True
 )
@@ -17,3 +36,27 @@ VARS_OPTION = click.option(
     multiple=True,
     callback=split_key_val_pairs,
 )
+PARAMETER_VARS_OPTION = click.option(
+    "--parameter-var",
+    "parameter_names",
+    type=str,
+    required=False,
+    multiple=True,
+    callback=validate_parameter_names,
+    help="A var to render as a CloudFormation parameter instead of a value",
+)
+PARAMETERS_OPTION = click.option(
+    "--parameter",
+    "parameters",
+    type=str,
+    required=False,
+    multiple=True,
+    callback=split_parameter_pairs,
+    help="A KEY=VALUE CloudFormation parameter value, also rendered as a parameter var",
+)
+ACTION_REGION_OPTION = click.option(
+    "--action-region",
+    type=str,
+    required=False,
+    help="Generate the regional stack holding the CodeBuild projects for actions in this region",
+)
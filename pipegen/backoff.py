@@ -0,0 +1,52 @@
+import logging
+import time
+from typing import Any, Callable
+
+from botocore.exceptions import ClientError
+
+DEFAULT_WAIT_DELAY = 5
+MAX_WAIT_DELAY = 60
+THROTTLING_ERROR_CODES = frozenset(
+    {"Throttling", "ThrottlingException", "TooManyRequestsException"}
+)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def log(message: str):
+    """Logs a general message"""
+    logger.info(message)
+
+
+class SharedBackoff:
+    """A polling delay shared by many API calls, that lengthens whenever any of them is throttled"""
+
+    wait_delay: float
+    max_delay: float
+    delay: float
+
+    def __init__(
+        self, wait_delay: float = DEFAULT_WAIT_DELAY, max_delay: float = MAX_WAIT_DELAY
+    ):
+        self.wait_delay = wait_delay
+        self.max_delay = max_delay
+        self.delay = wait_delay
+
+    def call(self, method: Callable[..., Any], **kwargs) -> Any:
+        """Call an API method, retrying with a longer delay when throttled"""
+        while True:
+            try:
+                return method(**kwargs)
+            except ClientError as exception:
+                if exception.response["Error"]["Code"] not in THROTTLING_ERROR_CODES:
+                    raise exception
+
+            log(f"Throttled calling {method.__name__}, retrying in {self.delay}s")
+            time.sleep(self.delay)
+            self.delay = min(self.delay * 2, self.max_delay)
+
+    def sleep(self):
+        """Wait between polling rounds, relaxing a delay lengthened by throttling"""
+        time.sleep(self.delay)
+        self.delay = max(self.delay / 2, self.wait_delay)
@@ -1,17 +1,55 @@
 import logging
 import sys
+import time
 from io import StringIO, TextIOWrapper
-from typing import TYPE_CHECKING, Dict
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
 import boto3
 import click
 from cfn_sync import Stack
-from strictyaml.ruamel import YAML
+from cfn_sync.cloudformation import SUCCESSFUL_STACK_STATUSES
 
 from . import VERSION
-from .args import CONFIG_OPTION, VARS_OPTION
-from .config import parse_config
-from .generators import generate
+from .args import (
+    ACTION_REGION_OPTION,
+    CONFIG_OPTION,
+    PARAMETER_VARS_OPTION,
+    PARAMETERS_OPTION,
+    VARS_OPTION,
+    split_key_val_pairs,
+)
+from .concurrency import ProjectShare, allocate, format_shares, project_shares
+from .config import (
+    config_search_path,
+    parameter_vars,
+    parse_config,
+    parse_config_data,
+    pipeline_namespace,
+    render_config,
+)
+from .deployment import ChangeSetStack, Deployment, DeploymentWaiter
+from .drift import DriftDetector, format_drift, read_manifest, redeploy_changes
+from .executions import format_execution_stats, get_action_timings, get_pipeline_name
+from .generators import generate_template
+from .local import FAILED, LocalRunner
+from .model import PipelineConfig
+from .render import dump_yaml, render_files
+from .server import RenderServer
+from .stack_set import (
+    SUCCESSFUL_INSTANCE_STATUSES,
+    StackSet,
+    StackSetOperationPreferencesTypeDef,
+    operation_preferences,
+)
+from .stats import budget_failures, format_stats, template_stats
+from .tune import (
+    dump_history,
+    load_history,
+    patch_compute_types,
+    recommend,
+    record_history,
+)
+from .validate import VALIDATION_ERRORS, expand_paths, format_error, validate_files
 
 if TYPE_CHECKING:  # pragma: no cover
     from mypy_boto3_cloudformation.client import CloudFormationClient
@@ -19,13 +57,6 @@ else:
     CloudFormationClient = object
 
 
-def dump_yaml(template, output=sys.stdout):
-    """Dumps YAML out to output file"""
-    yaml = YAML()
-    yaml.indent(sequence=4, offset=2)
-    yaml.dump(template, output)
-
-
 def print_version(ctx, _, value):
     """Output the version of pipegen"""
     if not value or ctx.resilient_parsing:
@@ -46,22 +77,531 @@ def cli():
     )
 
 
+def deploy_stack_set(
+    stack_set: StackSet,
+    template: str,
+    parameters: Dict[str, str],
+    targets: Tuple[List[str], List[str]],
+    preferences: StackSetOperationPreferencesTypeDef,
+):
+    """Deploy the template as a StackSet and report on each instance"""
+    stack_set.set_capabilities(["CAPABILITY_IAM"])
+    instances = stack_set.deploy(template, parameters, targets, preferences)
+
+    failed = 0
+    for instance in instances:
+        # instances only have a detailed status once an operation has recorded one
+        status = instance.get("StackInstanceStatus", {}).get(
+            "DetailedStatus", instance["Status"]
+        )
+        message = f"{instance['Account']} {instance['Region']} - {status}"
+        if instance.get("StatusReason"):
+            message += f" - {instance['StatusReason']}"
+        click.echo(message)
+
+        if instance["Status"] not in SUCCESSFUL_INSTANCE_STATUSES:
+            failed += 1
+
+    if failed:
+        raise click.ClickException(
+            f"{failed} of {len(instances)} StackSet instances did not deploy successfully"
+        )
+
+
 @cli.command()
 @CONFIG_OPTION
 @VARS_OPTION
+@PARAMETER_VARS_OPTION
+@PARAMETERS_OPTION
+@ACTION_REGION_OPTION
 @click.option("--stack-name", type=str, required=True)
-def deploy(config_file: TextIOWrapper, var_overrides: Dict[str, str], stack_name: str):
+@click.option(
+    "--stack-set",
+    is_flag=True,
+    help="Deploy as a StackSet named --stack-name to every --account/--region",
+)
+@click.option("--account", "accounts", type=str, multiple=True)
+@click.option("--region", "regions", type=str, multiple=True)
+@click.option(
+    "--max-concurrent-percentage",
+    type=click.IntRange(1, 100),
+    default=100,
+    show_default=True,
+)
+@click.option(
+    "--failure-tolerance-percentage",
+    type=click.IntRange(0, 100),
+    default=0,
+    show_default=True,
+)
+@click.option(
+    "--region-concurrency",
+    type=click.Choice(["PARALLEL", "SEQUENTIAL"]),
+    default="PARALLEL",
+    show_default=True,
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of processes to generate CodeBuild projects with  [default: 1]",
+)
+@click.option(
+    "--no-wait",
+    is_flag=True,
+    help="Execute a change set and output its handle, for pipegen wait, without waiting",
+)
+def deploy(
+    config_file: TextIOWrapper,
+    var_overrides: Dict[str, str],
+    parameter_names: Tuple[str, ...],
+    parameters: Dict[str, str],
+    stack_name: str,
+    **options,
+):
     """Deploy CodePipeline stack"""
-    config = parse_config(config_file.read(), var_overrides)
+    if options["stack_set"] and not (options["accounts"] and options["regions"]):
+        raise click.UsageError(
+            "--stack-set requires at least one --account and one --region"
+        )
+    if options["stack_set"] and options["no_wait"]:
+        raise click.UsageError("--no-wait can't be used with --stack-set")
+
+    parameter_names = (*parameter_names, *parameters.keys())
+    config = parse_config(
+        config_file.read(),
+        {**var_overrides, **parameter_vars(parameter_names)},
+        search_path=config_search_path(config_file.name),
+    )
 
     output = StringIO()
-    dump_yaml({"Resources": generate(config)}, output)
+    dump_yaml(
+        generate_template(
+            config,
+            parameter_names,
+            var_overrides,
+            options["action_region"],
+            options["jobs"],
+        ),
+        output,
+    )
     template = output.getvalue()
 
-    cloudformation: CloudFormationClient = boto3.client("cloudformation")
+    cloudformation: CloudFormationClient = boto3.client(
+        "cloudformation", region_name=options["action_region"]
+    )
+    if options["stack_set"]:
+        targets = (
+            list(options["accounts"]),
+            list(options["regions"]),
+        )
+        deploy_stack_set(
+            StackSet(cloudformation, stack_name),
+            template,
+            parameters,
+            targets,
+            operation_preferences(
+                options["max_concurrent_percentage"],
+                options["failure_tolerance_percentage"],
+                options["region_concurrency"],
+                targets[1],
+            ),
+        )
+        return
+
+    if options["no_wait"]:
+        change_set_stack = ChangeSetStack(cloudformation, stack_name)
+        change_set_stack.set_capabilities(["CAPABILITY_IAM"])
+        deployment = change_set_stack.deploy(template, parameters)
+        if deployment:
+            click.echo(deployment.handle)
+        return
+
     stack = Stack(cloudformation, stack_name)
     stack.set_capabilities(["CAPABILITY_IAM"])
-    stack.deploy(template, {}, {})
+    stack.deploy(template, parameters, {})
+
+
+@cli.command(name="wait")
+@click.argument("handles", nargs=-1, required=True)
+def wait_for_deployments(handles: Tuple[str, ...]):
+    """Wait for deployments started with deploy --no-wait, streaming their events"""
+    try:
+        deployments = [Deployment.from_handle(handle) for handle in handles]
+    except ValueError as error:
+        raise click.BadParameter(str(error), param_hint="HANDLES") from error
+
+    clients = {
+        region: boto3.client("cloudformation", region_name=region)
+        for region in {deployment.region for deployment in deployments}
+    }
+    results = DeploymentWaiter(clients).wait(deployments)
+
+    failed = 0
+    for deployment, status in results:
+        click.echo(f"{deployment.stack_name}: {status}")
+        failed += status not in SUCCESSFUL_STACK_STATUSES
+
+    if failed:
+        raise click.ClickException(
+            f"{failed} of {len(results)} deployments did not succeed"
+        )
+
+
+@cli.command()
+@VARS_OPTION
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of processes to validate with  [default: CPU count]",
+)
+@click.argument("paths", nargs=-1, required=True)
+def validate(var_overrides: Dict[str, str], jobs: Optional[int], paths: Tuple[str]):
+    """Validate config files, accepting files and globs"""
+    results = validate_files(expand_paths(paths), var_overrides, jobs)
+
+    failures = [result for result in results if result.error]
+    for result in failures:
+        click.echo(result.error, err=True)
+
+    click.echo(f"{len(results) - len(failures)} of {len(results)} configs are valid")
+    if failures:
+        sys.exit(1)
+
+
+def read_config(
+    config_path: str, var_overrides: Dict[str, str], parameter_names: Tuple[str, ...]
+) -> PipelineConfig:
+    """Parse a config file"""
+    with open(config_path, encoding="utf-8") as config_file:
+        return parse_config(
+            config_file.read(),
+            {**var_overrides, **parameter_vars(parameter_names)},
+            label=config_path,
+            search_path=config_search_path(config_path),
+        )
+
+
+def render_resources(
+    config_path: str, var_overrides: Dict[str, str], parameter_names: Tuple[str, ...]
+) -> Dict:
+    """Render the resources of a config file's template"""
+    config = read_config(config_path, var_overrides, parameter_names)
+
+    return generate_template(config, parameter_names, var_overrides)["Resources"]
+
+
+def budget_concurrency(
+    config_paths: List[str],
+    var_overrides: Dict[str, str],
+    parameter_names: Tuple[str, ...],
+    quota: int,
+) -> List[ProjectShare]:
+    """Share an account's concurrent builds between the projects of many config files"""
+    configs = {}
+    for config_path in config_paths:
+        try:
+            configs[config_path] = read_config(
+                config_path, var_overrides, parameter_names
+            )
+        except VALIDATION_ERRORS as error:
+            raise click.ClickException(format_error(config_path, error))
+
+    try:
+        return allocate(project_shares(configs), quota)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+
+
+@cli.command()
+@click.option(
+    "--quota",
+    type=click.IntRange(min=1),
+    required=True,
+    help="The account's quota of concurrent builds",
+)
+@VARS_OPTION
+@PARAMETER_VARS_OPTION
+@click.argument("config_paths", nargs=-1, required=True)
+def concurrency(
+    quota: int,
+    var_overrides: Dict[str, str],
+    parameter_names: Tuple[str, ...],
+    config_paths: Tuple[str, ...],
+):
+    """Share an account's concurrent builds between configs' projects, by their weights"""
+    shares = budget_concurrency(
+        expand_paths(config_paths), var_overrides, parameter_names, quota
+    )
+    for line in format_shares(shares, quota):
+        click.echo(line)
+
+
+@cli.command()
+@click.option("--stack-name", "stack_names", type=str, multiple=True)
+@click.option(
+    "--manifest",
+    type=click.File("r"),
+    help="A file of stack names, one per line, each optionally followed by its config's path",
+)
+@click.option(
+    "--config",
+    "config_path",
+    type=click.Path(exists=True, dir_okay=False),
+    help="The config of every --stack-name, to show whether a redeploy changes drifted resources",
+)
+@VARS_OPTION
+@PARAMETER_VARS_OPTION
+@click.option("--region", type=str, required=False)
+def drift(
+    stack_names: Tuple[str, ...],
+    manifest: Optional[TextIOWrapper],
+    config_path: Optional[str],
+    var_overrides: Dict[str, str],
+    **options,
+):
+    """Detect drift on many stacks at once, and whether redeploying would change it"""
+    stacks = [(stack_name, config_path) for stack_name in stack_names]
+    if manifest:
+        stacks.extend(read_manifest(manifest.readlines()))
+    if not stacks:
+        raise click.UsageError("Provide at least one --stack-name, or a --manifest")
+
+    detector = DriftDetector(
+        boto3.client("cloudformation", region_name=options["region"])
+    )
+    configs = dict(stacks)
+    drifted = 0
+    for result in detector.detect([stack_name for stack_name, _ in stacks]):
+        drifted += result.status != "IN_SYNC"
+        changes = None
+        stack_config_path = configs[result.stack_name]
+        if result.resources and stack_config_path:
+            changes = redeploy_changes(
+                detector.deployed_resources(result.stack_name),
+                render_resources(
+                    stack_config_path, var_overrides, options["parameter_names"]
+                ),
+            )
+        for line in format_drift(result, changes):
+            click.echo(line)
+
+    if drifted:
+        sys.exit(1)
+
+
+@cli.command(name="stats")
+@click.option("--stack-name", type=str, required=True)
+@click.option("--region", type=str, required=False)
+@click.option(
+    "--executions",
+    type=click.IntRange(min=1),
+    default=20,
+    show_default=True,
+    help="Number of the most recent succeeded executions to report on",
+)
+@click.option(
+    "--pipeline",
+    type=str,
+    default="",
+    help="Name of the pipeline to report on, for stacks of a config's pipelines",
+)
+def execution_stats(
+    stack_name: str, region: Optional[str], executions: int, pipeline: str
+):
+    """Report where a deployed pipeline's executions spend their time"""
+    pipeline_name = get_pipeline_name(
+        boto3.client("cloudformation", region_name=region),
+        stack_name,
+        pipeline_namespace(pipeline),
+    )
+    timings = get_action_timings(
+        {
+            "codepipeline": boto3.client("codepipeline", region_name=region),
+            "codebuild": boto3.client("codebuild", region_name=region),
+        },
+        pipeline_name,
+        executions,
+    )
+    if not timings:
+        raise click.ClickException(f"{pipeline_name} has no succeeded executions")
+
+    click.echo(f"Pipeline: {pipeline_name}")
+    for line in format_execution_stats(timings):
+        click.echo(line)
+
+
+@cli.command()
+@CONFIG_OPTION
+@VARS_OPTION
+@click.option(
+    "--history",
+    "history_file",
+    type=click.File("r"),
+    help="Recorded build history to analyse, instead of --stack-name's builds",
+)
+@click.option("--stack-name", type=str, help="The stack to analyse the builds of")
+@click.option("--region", type=str, required=False)
+@click.option(
+    "--builds",
+    type=click.IntRange(1, 100),
+    default=20,
+    show_default=True,
+    help="Number of each project's most recent builds to analyse",
+)
+@click.option(
+    "--record",
+    "record_file",
+    type=click.File("w"),
+    help="Record --stack-name's build history to this file, to analyse offline",
+)
+@click.option(
+    "--write-config",
+    "patched_config_file",
+    type=click.File("w"),
+    help="Write the config with the recommended compute types to this file",
+)
+def tune(config_file: TextIOWrapper, var_overrides: Dict[str, str], **options):
+    """Recommend each action's compute type from its build history"""
+    if bool(options["history_file"]) == bool(options["stack_name"]):
+        raise click.UsageError("Provide one of --history or --stack-name")
+
+    config_text = config_file.read()
+    config = parse_config(
+        config_text, var_overrides, search_path=config_search_path(config_file.name)
+    )
+    if config.pipelines:
+        raise click.UsageError("tune only supports configs with a single pipeline")
+    if options["history_file"]:
+        history = load_history(options["history_file"])
+    else:
+        history = record_history(
+            {
+                "cloudformation": boto3.client(
+                    "cloudformation", region_name=options["region"]
+                ),
+                "codebuild": boto3.client("codebuild", region_name=options["region"]),
+                "cloudwatch": boto3.client("cloudwatch", region_name=options["region"]),
+            },
+            options["stack_name"],
+            options["builds"],
+        )
+        if options["record_file"]:
+            dump_history(history, options["record_file"])
+
+    recommendations = recommend(config, history)
+    for recommendation in recommendations:
+        change = recommendation.current
+        if recommendation.recommended != recommendation.current:
+            change += f" -> {recommendation.recommended}"
+        click.echo(f"{recommendation.action}: {change} ({recommendation.reason})")
+
+    if options["patched_config_file"]:
+        patched, unpatched = patch_compute_types(
+            config_text,
+            render_config(
+                config_text, var_overrides, config_search_path(config_file.name)
+            ),
+            {
+                recommendation.action: recommendation.recommended
+                for recommendation in recommendations
+                if recommendation.recommended != recommendation.current
+            },
+        )
+        options["patched_config_file"].write(patched)
+        for action in unpatched:
+            click.echo(
+                f"{action}: couldn't patch its compute_type, as rendering moves "
+                "or changes its lines",
+                err=True,
+            )
+
+
+@cli.command()
+@click.option("--host", type=str, default="127.0.0.1", show_default=True)
+@click.option("--port", type=click.IntRange(0, 65535), default=8080, show_default=True)
+def serve(host: str, port: int):
+    """Serve config parsing and template rendering over HTTP, keeping pipegen loaded"""
+    server = RenderServer((host, port))
+    click.echo(f"Serving on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+@cli.command(name="run-local")
+@CONFIG_OPTION
+@VARS_OPTION
+@click.option(
+    "--source",
+    "sources",
+    type=str,
+    multiple=True,
+    callback=split_key_val_pairs,
+    help="A NAME=PATH directory to use as a source  [default: the first source is .]",
+)
+@click.option(
+    "--workspace",
+    type=click.Path(file_okay=False),
+    default=".pipegen",
+    show_default=True,
+    help="Directory to build in, and to keep artifacts and logs in",
+)
+@click.option(
+    "--docker",
+    is_flag=True,
+    help="Run each action in a container of its image, rather than a subprocess",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of actions to run at once within a stage  [default: all]",
+)
+def run_local(
+    config_file: TextIOWrapper,
+    var_overrides: Dict[str, str],
+    sources: Dict[str, str],
+    **options,
+):
+    """Run the pipeline's commands actions locally, stage by stage"""
+    config = parse_config(
+        config_file.read(),
+        var_overrides,
+        search_path=config_search_path(config_file.name),
+    )
+    if config.sources:
+        sources = {config.sources[0].name: ".", **sources}
+
+    try:
+        runner = LocalRunner(
+            config,
+            options["workspace"],
+            sources,
+            docker=options["docker"],
+            jobs=options["jobs"],
+        )
+    except ValueError as error:
+        raise click.UsageError(str(error))
+
+    started = time.monotonic()
+    results = runner.run()
+    for result in results:
+        message = f"{result.stage}/{result.action}: {result.status}"
+        if result.log_path:
+            message += f" in {result.duration:.1f}s, log {result.log_path}"
+        click.echo(message)
+    click.echo(f"Ran {len(results)} actions in {time.monotonic() - started:.1f}s")
+
+    if any(result.status == FAILED for result in results):
+        sys.exit(1)
 
 
 @cli.group()
@@ -74,17 +614,147 @@ def dump():
 @VARS_OPTION
 def dump_config(config_file: TextIOWrapper, var_overrides: Dict[str, str]):
     """Dump the compiled configuration"""
-    config = parse_config(config_file.read(), var_overrides)
+    config = parse_config_data(
+        config_file.read(),
+        var_overrides,
+        search_path=config_search_path(config_file.name),
+    )
     dump_yaml(config)
 
 
 @dump.command(name="template")
-@CONFIG_OPTION
+@click.option("--config", "config_file", type=click.File("r"), required=False)
 @VARS_OPTION
-def dump_template(config_file: TextIOWrapper, var_overrides: Dict[str, str]):
+@PARAMETER_VARS_OPTION
+@ACTION_REGION_OPTION
+@click.option(
+    "--out-dir",
+    type=click.Path(file_okay=False),
+    help="Render the templates of every CONFIG into this directory",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=None,
+    help=(
+        "Number of processes to render --out-dir configs with [default: CPU count], "
+        "or to generate a --config's CodeBuild projects with [default: 1]"
+    ),
+)
+@click.option(
+    "--stats",
+    is_flag=True,
+    help="Report the template's size and resource counts against their limits",
+)
+@click.option(
+    "--budget",
+    is_flag=True,
+    help="Report --stats, and fail if any exceeds --budget-percentage of its limit",
+)
+@click.option(
+    "--budget-percentage",
+    type=click.IntRange(1, 100),
+    default=100,
+    show_default=True,
+)
+@click.option(
+    "--concurrency-quota",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Limit --out-dir configs' projects to share this many concurrent builds",
+)
+@click.argument("config_paths", nargs=-1)
+def dump_template(
+    config_file: Optional[TextIOWrapper],
+    var_overrides: Dict[str, str],
+    parameter_names: Tuple[str, ...],
+    action_region: Optional[str],
+    **options,
+):
     """Dump the compiled configuration"""
-    config = parse_config(config_file.read(), var_overrides)
-    dump_yaml({"Resources": generate(config)})
+    if options["out_dir"]:
+        if config_file or options["stats"] or options["budget"]:
+            raise click.UsageError(
+                "--out-dir renders CONFIG paths, and doesn't support --config or --stats"
+            )
+        dump_templates(
+            options["config_paths"],
+            options["out_dir"],
+            var_overrides,
+            options["jobs"],
+            parameter_names=parameter_names,
+            region=action_region,
+            concurrency_quota=options["concurrency_quota"],
+        )
+        return
+    if options["concurrency_quota"]:
+        raise click.UsageError("--concurrency-quota requires --out-dir")
+
+    if not config_file or options["config_paths"]:
+        raise click.UsageError("Provide --config, or --out-dir with CONFIG paths")
+
+    config = parse_config(
+        config_file.read(),
+        {**var_overrides, **parameter_vars(parameter_names)},
+        search_path=config_search_path(config_file.name),
+    )
+    template = generate_template(
+        config, parameter_names, var_overrides, action_region, options["jobs"]
+    )
+    if not options["stats"] and not options["budget"]:
+        dump_yaml(template)
+        return
+
+    stats = template_stats(template, config, action_region)
+    for line in format_stats(stats):
+        click.echo(line)
+
+    failures = budget_failures(stats, options["budget_percentage"])
+    if options["budget"] and failures:
+        for failure in failures:
+            click.echo(failure, err=True)
+        sys.exit(1)
+
+
+def dump_templates(
+    config_paths: Tuple[str, ...],
+    out_dir: str,
+    var_overrides: Dict[str, str],
+    jobs: Optional[int],
+    **options,
+):
+    """Render the templates of many configs into a directory"""
+    paths = expand_paths(config_paths)
+    quota = options.pop("concurrency_quota", None)
+    if quota:
+        shares = budget_concurrency(
+            paths, var_overrides, options["parameter_names"], quota
+        )
+        options["concurrency_limits"] = {
+            path: {
+                share.logical_id: share.limit for share in shares if share.path == path
+            }
+            for path in paths
+        }
+
+    try:
+        results = render_files(paths, out_dir, var_overrides, jobs, **options)
+    except ValueError as error:
+        raise click.UsageError(str(error))
+
+    failures = 0
+    for result in results:
+        if result.error:
+            failures += 1
+            click.echo(result.error, err=True)
+        elif result.changed:
+            click.echo(f"Wrote {result.output_path}")
+        else:
+            click.echo(f"Unchanged {result.output_path}")
+
+    if failures:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
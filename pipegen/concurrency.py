@@ -0,0 +1,142 @@
+from typing import Dict, List, NamedTuple, Tuple
+
+from .config import get_pipeline_configs
+from .generators import codebuild
+from .model import PipelineConfig, Stage
+
+
+class ProjectShare(NamedTuple):
+    """A generated project's share of the account's concurrent builds"""
+
+    path: str
+    logical_id: str
+    weight: int
+    limit: int = 0
+    # whether the limit was configured, rather than assigned from the budget
+    declared: bool = False
+
+
+def project_shares(configs: Dict[str, PipelineConfig]) -> List[ProjectShare]:
+    """Get the projects that count against the quota of each config's region, by config path"""
+    shares = []
+    for path, config in configs.items():
+        for pipeline_config in get_pipeline_configs(config):
+            for project_config in codebuild.get_generated_projects(pipeline_config):
+                if project_config.region:
+                    # cross-region actions count against another region's quota
+                    continue
+
+                limit = project_config.concurrent_build_limit
+                shares.append(
+                    ProjectShare(
+                        path,
+                        codebuild.generate_logical_id(
+                            project_config.name, pipeline_config.namespace
+                        ),
+                        project_config.weight,
+                        limit or 0,
+                        bool(limit),
+                    )
+                )
+
+    return shares
+
+
+def allocate(shares: List[ProjectShare], quota: int) -> List[ProjectShare]:
+    """Assign the quota left by declared limits to the other projects, in proportion to their weights"""
+    for share in shares:
+        if share.weight < 1 or (share.declared and share.limit < 1):
+            raise ValueError(
+                f"{share.logical_id} in {share.path} must have a weight and "
+                "concurrent build limit of at least 1"
+            )
+
+    declared = sum(share.limit for share in shares if share.declared)
+    budgeted = [index for index, share in enumerate(shares) if not share.declared]
+    remaining = quota - declared
+    if remaining < len(budgeted):
+        raise ValueError(
+            f"Declared limits use {declared} of the quota of {quota} concurrent builds, "
+            f"leaving {max(remaining, 0)} for {len(budgeted)} projects that need one each"
+        )
+
+    # every project gets one build, and the rest is split by weight, largest remainders first
+    spare = remaining - len(budgeted)
+    total_weight = sum(shares[index].weight for index in budgeted) or 1
+    exact = {index: spare * shares[index].weight / total_weight for index in budgeted}
+    limits = {index: 1 + int(exact[index]) for index in budgeted}
+    leftover = remaining - sum(limits.values())
+    for index in sorted(budgeted, key=lambda index: int(exact[index]) - exact[index])[
+        :leftover
+    ]:
+        limits[index] += 1
+
+    return [
+        share._replace(limit=limits[index]) if index in limits else share
+        for index, share in enumerate(shares)
+    ]
+
+
+def limit_stages(
+    stages: Tuple[Stage, ...],
+    project_logical_ids: Dict[str, str],
+    limits: Dict[str, int],
+) -> Tuple[Stage, ...]:
+    """Set the concurrent build limit of each action whose project has one, by logical ID"""
+    return tuple(
+        stage._replace(
+            actions=tuple(
+                (
+                    action._replace(
+                        concurrent_build_limit=limits[project_logical_ids[action.name]]
+                    )
+                    if project_logical_ids.get(action.name) in limits
+                    else action
+                )
+                for action in stage.actions
+            )
+        )
+        for stage in stages
+    )
+
+
+def apply_limits(config: PipelineConfig, limits: Dict[str, int]) -> PipelineConfig:
+    """Set the concurrent build limit of each action whose project has one, in every pipeline"""
+    if not config.pipelines:
+        return config._replace(
+            stages=limit_stages(
+                config.stages, codebuild.get_project_logical_ids(config), limits
+            )
+        )
+
+    return config._replace(
+        pipelines=tuple(
+            pipeline._replace(
+                stages=limit_stages(
+                    pipeline.stages,
+                    codebuild.get_project_logical_ids(pipeline_config),
+                    limits,
+                )
+            )
+            for pipeline, pipeline_config in zip(
+                config.pipelines, get_pipeline_configs(config)
+            )
+        )
+    )
+
+
+def format_shares(shares: List[ProjectShare], quota: int) -> List[str]:
+    """Format the projects' limits, and their total against the quota"""
+    lines = []
+    for path in dict.fromkeys(share.path for share in shares):
+        lines.append(path)
+        lines.extend(
+            f"  {share.logical_id}: {share.limit}"
+            + (" (declared)" if share.declared else f" (weight {share.weight})")
+            for share in shares
+            if share.path == path
+        )
+
+    total = sum(share.limit for share in shares)
+    lines.append(f"Total: {total} of {quota} concurrent builds")
+    return lines
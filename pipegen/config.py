@@ -1,10 +1,15 @@
+import json
+import os
 import re
-from typing import TYPE_CHECKING, Any, Dict, List, Tuple, Union
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple, Union
 
-from jinja2 import Environment, StrictUndefined
-from strictyaml import YAML, load
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, Template
+from strictyaml import YAML, Map, load
 
-from .schema import generate_schema
+from . import fast_yaml
+from .model import ArtifactStore, PipelineConfig, Source, Stage
+from .schema import ACTION_DEFAULT_KEYS, generate_schema
 
 if TYPE_CHECKING:  # pragma: no cover
     from typing_extensions import TypedDict
@@ -28,6 +33,21 @@ else:
     FnImportValue = object
     FnSub = object
 
+DEFAULT_LABEL = "<unicode string>"
+# parameterised vars render as a token that config text won't otherwise contain, and
+# that is delimited, so that a var rendered inside a longer value can still be found
+PARAMETER_PLACEHOLDER = "__pipegen_param_3d9f1c7e_{name}__"
+PARAMETER_PATTERN = re.compile(r"__pipegen_param_3d9f1c7e_([a-zA-Z0-9]+)__")
+PARAMETER_NAME_PATTERN = re.compile(r"^[a-zA-Z0-9]+$")
+STRICTYAML_BACKEND = "strictyaml"
+LIBYAML_BACKEND = "libyaml"
+YAML_BACKEND_VARIABLE = "PIPEGEN_YAML_BACKEND"
+INCLUDE_PATH_VARIABLE = "PIPEGEN_INCLUDE_PATH"
+CONFIG_TEMPLATE_CACHE_SIZE = 64
+JINJA_ENVIRONMENT = Environment(undefined=StrictUndefined)
+
+NAMESPACE_PATTERN = re.compile(r"[\W_]+")
+
 REPO_REGEX = (
     r"(?P<account>[\d]{12}).dkr.ecr.(?P<region>[a-z]{2}-[a-z]+-[\d]+)."
     r"amazonaws.com/(?P<repository_name>[a-z0-9\-\/]+)(?:\:(?P<tag>.+))?"
@@ -44,47 +64,288 @@ def get_stage_action_field(stages, field: str) -> List:
     return values
 
 
-def contains_codecommit_with_event(config) -> bool:
+def get_output_artifact_names(stages) -> List[str]:
+    """Get the names of the Stage[].Action[] output artifacts, including secondary artifacts"""
+    names = []
+    for stage in stages:
+        for action in stage.get("actions", []):
+            secondary_names = [
+                artifact["name"] for artifact in action.get("secondary_artifacts", [])
+            ]
+            # as output_artifact_names(), an action with only secondary artifacts
+            # doesn't output its own
+            if "artifacts" in action or not secondary_names:
+                names.append(action["name"])
+            names.extend(secondary_names)
+
+    return names
+
+
+def contains_codecommit_with_event(config: PipelineConfig) -> bool:
     """Check if the sources have a CodeCommit repo with CloudWatch events for change detection"""
-    for source in config.get("sources", []):
-        if is_codecommit_with_event_source(source):
-            return True
-    return False
+    return any(is_codecommit_with_event_source(source) for source in config.sources)
 
 
-def is_codecommit_with_event_source(source: Dict) -> bool:
+def is_codecommit_with_event_source(source: Source) -> bool:
     """Check if a source is a CodeCommit repo with CloudWatch events for change detection"""
-    return source["from"] == "CodeCommit" and source["event_for_source_changes"]
+    return source.provider == "CodeCommit" and source.event_for_source_changes
+
 
+def parameter_vars(parameters: Iterable[str]) -> Dict[str, str]:
+    """Generate placeholder vars that render as CloudFormation parameter references"""
+    placeholders = {}
+    for parameter in parameters:
+        if not PARAMETER_NAME_PATTERN.match(parameter):
+            raise ValueError(
+                f"Parameter '{parameter}' must only contain alphanumeric characters"
+            )
+        placeholders[parameter] = PARAMETER_PLACEHOLDER.format(name=parameter)
 
-def load_config(config: str, config_vars: Dict[str, str]) -> YAML:
+    return placeholders
+
+
+def config_search_path(path: Optional[str] = None) -> Tuple[str, ...]:
+    """Get the directories a config's includes load from: its own, then PIPEGEN_INCLUDE_PATH's"""
+    directory = os.getcwd()
+    if path and os.path.isfile(path):
+        directory = os.path.dirname(os.path.abspath(path))
+
+    include_path = os.environ.get(INCLUDE_PATH_VARIABLE, "")
+    return (
+        directory,
+        *[os.path.abspath(path) for path in include_path.split(os.pathsep) if path],
+    )
+
+
+@lru_cache(maxsize=None)
+def get_environment(search_path: Tuple[str, ...] = ()) -> Environment:
+    """Get the Jinja environment loading from a search path, shared so fragments compile once"""
+    if not search_path:
+        return JINJA_ENVIRONMENT
+
+    return Environment(
+        undefined=StrictUndefined, loader=FileSystemLoader(list(search_path))
+    )
+
+
+@lru_cache(maxsize=CONFIG_TEMPLATE_CACHE_SIZE)
+def compile_config(config: str, search_path: Tuple[str, ...] = ()) -> Template:
+    """Compile a config's Jinja template, reusing it when the same config is rendered again"""
+    return get_environment(search_path).from_string(config)
+
+
+def render_config(
+    config: str, config_vars: Dict[str, str], search_path: Tuple[str, ...] = ()
+) -> str:
+    """Render a config's Jinja template with its vars, including fragments from its search path"""
+    return compile_config(config, search_path).render(vars=config_vars)
+
+
+def load_config(
+    config: str,
+    config_vars: Dict[str, str],
+    label: str = DEFAULT_LABEL,
+    search_path: Tuple[str, ...] = (),
+) -> YAML:
     """Loads config and return a Dictionary of the data"""
-    environment = Environment(undefined=StrictUndefined)
-    template = environment.from_string(config)
-    rendered_config = template.render(vars=config_vars)
+    return load(
+        render_config(config, config_vars, search_path),
+        schema=generate_schema(),
+        label=label,
+    )
 
-    return load(rendered_config, schema=generate_schema())
 
+def check_pipelines(data: Dict[str, Any], label: str = DEFAULT_LABEL):
+    """Check a config has either a pipeline's sources and stages, or several pipelines"""
+    keys = [key for key in ("sources", "stages") if key in data]
+    if "pipelines" in data and keys:
+        raise ValueError(
+            f"{label}: a config with pipelines can't also have top-level {' or '.join(keys)}"
+        )
+    if "pipelines" not in data and len(keys) < 2:
+        raise KeyError(f"{label}: a config needs sources and stages, or pipelines")
 
-def parse_config(config: str, config_vars: Dict[str, str]) -> Dict[str, Any]:
+
+def revalidation_schema(data: Dict[str, Any]) -> Map:
+    """Generate the schema that adds a loaded config's stage actions and defaults"""
+    return generate_schema(
+        stage_actions=get_output_artifact_names(data.get("stages", [])),
+        action_defaults={
+            key: data["config"]["codebuild"].get(key) for key in ACTION_DEFAULT_KEYS
+        },
+        log_group_config=data["config"]["codebuild"]["log_group"],
+        artifact_regions=[
+            artifact_store["region"]
+            for artifact_store in data["config"]["artifact_stores"]
+        ],
+        pipeline_artifacts=(
+            [
+                get_output_artifact_names(pipeline["stages"])
+                for pipeline in data["pipelines"]
+            ]
+            if "pipelines" in data
+            else None
+        ),
+    )
+
+
+def parse_config_data(
+    config: str,
+    config_vars: Dict[str, str],
+    label: str = DEFAULT_LABEL,
+    backend: Optional[str] = None,
+    search_path: Tuple[str, ...] = (),
+) -> Dict[str, Any]:
     """Parse a config and return a Dictionary of the data"""
-    data = load_config(config, config_vars)
+    backend = backend or os.environ.get(YAML_BACKEND_VARIABLE, STRICTYAML_BACKEND)
+    if backend == LIBYAML_BACKEND and fast_yaml.FAST_YAML_AVAILABLE:
+        node = fast_yaml.compose_document(
+            render_config(config, config_vars, search_path), label
+        )
+        validator = fast_yaml.NodeValidator(label)
+        data = validator.validate(node, generate_schema())
+        check_pipelines(data, label)
 
-    stage_actions = get_stage_action_field(data["stages"], "name")
-    default_compute_type = str(data["config"]["codebuild"]["compute_type"])
-    default_image = str(data["config"]["codebuild"]["image"])
+        return validator.validate(node, revalidation_schema(data))
 
+    data = load_config(config, config_vars, label, search_path)
+    check_pipelines(data.data, label)
     # Revalidate to get the stage actions and add defaults
-    data.revalidate(
-        generate_schema(
-            stage_actions=stage_actions,
-            default_compute_type=default_compute_type,
-            default_image=default_image,
-            log_group_config=data["config"]["codebuild"]["log_group"].data,
+    data.revalidate(revalidation_schema(data.data))
+
+    return data.data
+
+
+def parse_config(
+    config: str,
+    config_vars: Dict[str, str],
+    label: str = DEFAULT_LABEL,
+    backend: Optional[str] = None,
+    search_path: Tuple[str, ...] = (),
+) -> PipelineConfig:
+    """Parse a config into its typed model"""
+    return PipelineConfig.from_dict(
+        parse_config_data(config, config_vars, label, backend, search_path)
+    )
+
+
+def get_artifact_store(
+    config: PipelineConfig, region: Optional[str] = None
+) -> ArtifactStore:
+    """Get the artifact bucket and key for a region, or the pipeline's own region"""
+    if not region:
+        return ArtifactStore(config.s3_bucket, config.kms_key_arn)
+
+    for artifact_store in config.artifact_stores:
+        if artifact_store.region == region:
+            return artifact_store
+
+    raise KeyError(f"No artifact store is configured for region '{region}'")
+
+
+def get_regional_config(
+    config: PipelineConfig, region: Optional[str] = None
+) -> PipelineConfig:
+    """Narrow a config to the actions and artifact store of a region"""
+    artifact_store = get_artifact_store(config, region)
+
+    return config._replace(
+        s3_bucket=artifact_store.s3_bucket,
+        kms_key_arn=artifact_store.kms_key_arn,
+        stages=get_regional_stages(config.stages, region),
+        pipelines=tuple(
+            pipeline._replace(stages=get_regional_stages(pipeline.stages, region))
+            for pipeline in config.pipelines
+        ),
+    )
+
+
+def get_regional_stages(
+    stages: Tuple[Stage, ...], region: Optional[str] = None
+) -> Tuple[Stage, ...]:
+    """Narrow stages to the actions of a region"""
+    return tuple(
+        stage._replace(
+            actions=tuple(action for action in stage.actions if action.region == region)
         )
+        for stage in stages
     )
 
-    return data.data
+
+def pipeline_namespace(name: str) -> str:
+    """Generate the prefix of the logical IDs of one of a config's pipelines"""
+    return NAMESPACE_PATTERN.sub("", name)
+
+
+def get_pipeline_configs(config: PipelineConfig) -> List[PipelineConfig]:
+    """Split a config into one per pipeline, namespacing each pipeline's logical IDs by its name"""
+    if not config.pipelines:
+        return [config]
+
+    return [
+        config._replace(
+            sources=pipeline.sources,
+            stages=pipeline.stages,
+            pipelines=(),
+            namespace=pipeline_namespace(pipeline.name),
+        )
+        for pipeline in config.pipelines
+    ]
+
+
+def get_shared_config(config: PipelineConfig) -> PipelineConfig:
+    """Gather the sources and stages of a config's pipelines, for the roles they share"""
+    if not config.pipelines:
+        return config
+
+    return config._replace(
+        sources=tuple(
+            dict.fromkeys(
+                source for pipeline in config.pipelines for source in pipeline.sources
+            )
+        ),
+        stages=tuple(
+            stage for pipeline in config.pipelines for stage in pipeline.stages
+        ),
+    )
+
+
+def substitute_parameters(
+    value: str, parameters: Optional[Iterable[str]] = None
+) -> Union[str, FnSub]:
+    """Replace parameterised vars rendered within a value with references to their parameters"""
+    names = None if parameters is None else set(parameters)
+    matches = [
+        match
+        for match in PARAMETER_PATTERN.finditer(value)
+        if names is None or match.group(1) in names
+    ]
+    if not matches:
+        return value
+
+    # escape the value's own ${...} so that only the parameters are substituted
+    substituted, end = [], 0
+    for match in matches:
+        substituted.append(value[end : match.start()].replace("${", "${!"))
+        substituted.append(f"${{{match.group(1)}}}")
+        end = match.end()
+    substituted.append(value[end:].replace("${", "${!"))
+
+    return {"Fn::Sub": "".join(substituted)}
+
+
+def check_parameters(template: Dict[str, Any], parameters: Iterable[str]) -> None:
+    """Check that no parameterised var was left where it can't reference its parameter"""
+    names = set(parameters)
+    if not names:
+        return
+
+    for match in PARAMETER_PATTERN.finditer(json.dumps(template)):
+        if match.group(1) in names:
+            raise ValueError(
+                f"Parameterised var '{match.group(1)}' is used in a value that "
+                "can't reference a CloudFormation parameter"
+            )
 
 
 def parse_value(template: str, **kwargs) -> Union[str, FnSub, Ref]:
@@ -94,16 +355,25 @@ def parse_value(template: str, **kwargs) -> Union[str, FnSub, Ref]:
         value = kwargs[key]
         # check if our template exactly matches "${Key}"
         if template == f"${{{key}}}":
-            if str(value).startswith("AWS::"):
-                return {"Ref": value}
+            parameter = PARAMETER_PATTERN.fullmatch(str(value))
+            if parameter or str(value).startswith("AWS::"):
+                # pseudo parameters are referenced as-is, vars by parameter name
+                return {"Ref": parameter.group(1) if parameter else str(value)}
             if not str(value).startswith("import:"):
-                return value
+                return substitute_parameters(value) if isinstance(value, str) else value
 
     subbed_args = {}
 
     for key, value in kwargs.items():
         if str(value).startswith("import:"):
             value = {"Fn::ImportValue": value[7:]}
+        elif isinstance(value, str):
+            parameter = PARAMETER_PATTERN.fullmatch(value)
+            value = (
+                {"Ref": parameter.group(1)}
+                if parameter
+                else substitute_parameters(value)
+            )
         subbed_args[key] = value
 
     return {"Fn::Sub": (template, subbed_args)}
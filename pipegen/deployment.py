@@ -0,0 +1,224 @@
+import logging
+import time
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from botocore.exceptions import ClientError  # type: ignore
+from cfn_sync.cloudformation import IN_PROGRESS_STACK_STATUSES
+
+from .backoff import DEFAULT_WAIT_DELAY, MAX_WAIT_DELAY, SharedBackoff
+
+if TYPE_CHECKING:  # pragma: no cover
+    from mypy_boto3_cloudformation.client import CloudFormationClient
+else:
+    CloudFormationClient = object
+
+IN_PROGRESS_CHANGE_SET_STATUSES = frozenset({"CREATE_PENDING", "CREATE_IN_PROGRESS"})
+# the reasons CloudFormation gives for change sets that would leave the stack as it is
+NO_CHANGES_REASONS = (
+    "didn't contain changes",
+    "No updates are to be performed",
+)
+HANDLE_SEPARATOR = "@"
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def log(message: str):
+    """Logs a general message"""
+    logger.info(message)
+
+
+class Deployment(NamedTuple):
+    """A stack's executed change set, that can be waited on later"""
+
+    stack_name: str
+    change_set_id: str
+
+    @property
+    def handle(self) -> str:
+        """The deployment's handle, to pass to pipegen wait"""
+        return f"{self.stack_name}{HANDLE_SEPARATOR}{self.change_set_id}"
+
+    @property
+    def region(self) -> str:
+        """The region of the deployment, from its change set's ARN"""
+        return self.change_set_id.split(":")[3]
+
+    @classmethod
+    def from_handle(cls, handle: str) -> "Deployment":
+        """Read a deployment from its handle"""
+        stack_name, _, change_set_id = handle.partition(HANDLE_SEPARATOR)
+        if not stack_name or not change_set_id.startswith("arn:"):
+            raise ValueError(
+                f"{handle} is not a deployment handle, like STACK_NAME@CHANGE_SET_ARN"
+            )
+
+        return cls(stack_name, change_set_id)
+
+
+class ChangeSetStack:
+    """A CloudFormation stack deployed through change sets, without waiting for them to execute"""
+
+    name: str
+    capabilities: Optional[List] = None
+    wait_delay: float
+
+    def __init__(
+        self,
+        cloudformation: CloudFormationClient,
+        name: str,
+        wait_delay: float = DEFAULT_WAIT_DELAY,
+    ):
+        self.cloudformation = cloudformation
+        self.name = name
+        self.wait_delay = wait_delay
+
+    def set_capabilities(self, capabilities: List):
+        """Sets the capabilities to apply to the stack's change sets"""
+        self.capabilities = capabilities
+
+    @property
+    def change_set_type(self) -> str:
+        """Whether a change set creates the stack or updates it"""
+        try:
+            stack = self.cloudformation.describe_stacks(StackName=self.name)["Stacks"][
+                0
+            ]
+        except ClientError as exception:
+            if "does not exist" in str(exception):
+                return "CREATE"
+
+            raise exception
+
+        # a stack whose first change set was never executed is still created by the next
+        return "CREATE" if stack["StackStatus"] == "REVIEW_IN_PROGRESS" else "UPDATE"
+
+    def deploy(
+        self, template_body: str, parameters: Dict[str, str]
+    ) -> Optional[Deployment]:
+        """Create and execute a change set, returning the deployment unless nothing changed"""
+        change_set_name = f"pipegen-{datetime.now(timezone.utc):%Y%m%d%H%M%S}"
+        change_set_id = self.cloudformation.create_change_set(
+            StackName=self.name,
+            ChangeSetName=change_set_name,
+            ChangeSetType=self.change_set_type,  # type: ignore
+            TemplateBody=template_body,
+            Parameters=[
+                {"ParameterKey": key, "ParameterValue": value}
+                for key, value in parameters.items()
+            ],
+            Capabilities=self.capabilities or [],
+        )["Id"]
+
+        change_set = self.wait(change_set_id)
+        if change_set["Status"] == "FAILED":
+            reason = change_set.get("StatusReason", "")
+            if not any(message in reason for message in NO_CHANGES_REASONS):
+                raise RuntimeError(
+                    f"Change set {change_set_name} for {self.name} failed: {reason}"
+                )
+
+            self.cloudformation.delete_change_set(ChangeSetName=change_set_id)
+            log(f"No changes. Stack {self.name} not updated")
+            return None
+
+        self.cloudformation.execute_change_set(ChangeSetName=change_set_id)
+        log(f"Executing change set {change_set_name} for {self.name}")
+        return Deployment(self.name, change_set_id)
+
+    def wait(self, change_set_id: str) -> Dict[str, Any]:
+        """Waits for a change set to be created, which is much quicker than executing it"""
+        while True:
+            change_set = self.cloudformation.describe_change_set(
+                ChangeSetName=change_set_id
+            )
+            if change_set["Status"] not in IN_PROGRESS_CHANGE_SET_STATUSES:
+                return change_set  # type: ignore
+
+            time.sleep(self.wait_delay)
+
+
+class DeploymentWaiter:
+    """Waits for many deployments at once, streaming their events and backing off together"""
+
+    clients: Dict[str, Any]
+    backoff: SharedBackoff
+    seen_event_ids: Set[str]
+
+    def __init__(
+        self,
+        clients: Dict[str, Any],
+        wait_delay: float = DEFAULT_WAIT_DELAY,
+        max_delay: float = MAX_WAIT_DELAY,
+    ):
+        self.clients = clients
+        self.backoff = SharedBackoff(wait_delay, max_delay)
+        self.seen_event_ids = set()
+
+    def call(self, region: str, operation: str, **kwargs) -> Dict[str, Any]:
+        """Call a region's CloudFormation operation, retrying with the shared backoff when throttled"""
+        return self.backoff.call(getattr(self.clients[region], operation), **kwargs)
+
+    def wait(self, deployments: List[Deployment]) -> List[Tuple[Deployment, str]]:
+        """Poll every pending deployment each round until they've all finished, with their statuses"""
+        started = {
+            deployment: self.call(
+                deployment.region,
+                "describe_change_set",
+                ChangeSetName=deployment.change_set_id,
+            )["CreationTime"]
+            for deployment in deployments
+        }
+        statuses: Dict[Deployment, str] = {}
+        while len(statuses) < len(started):
+            for deployment in deployments:
+                if deployment in statuses:
+                    continue
+
+                status = self.stream_events(deployment, started[deployment])
+                if status and status not in IN_PROGRESS_STACK_STATUSES:
+                    statuses[deployment] = status
+
+            if len(statuses) < len(started):
+                self.backoff.sleep()
+
+        return [(deployment, statuses[deployment]) for deployment in deployments]
+
+    def stream_events(self, deployment: Deployment, started: datetime) -> Optional[str]:
+        """Log a deployment's new events, and return its stack's latest status since it started"""
+        # events are newest first, so read pages until one reaches back to before the
+        # deployment started, as a large stack's events since then may span several
+        events: List[Dict[str, Any]] = []
+        kwargs = {"StackName": deployment.stack_name}
+        while True:
+            response = self.call(deployment.region, "describe_stack_events", **kwargs)
+            page = response["StackEvents"]
+            events.extend(event for event in page if event["Timestamp"] >= started)
+            if "NextToken" not in response or any(
+                event["Timestamp"] < started for event in page
+            ):
+                break
+
+            kwargs["NextToken"] = response["NextToken"]
+
+        for event in reversed(events):
+            if event["EventId"] in self.seen_event_ids:
+                continue
+
+            self.seen_event_ids.add(event["EventId"])
+            message = f"{deployment.stack_name}: {event['LogicalResourceId']} - {event['ResourceStatus']}"
+            if event.get("ResourceStatusReason"):
+                message += f" - {event['ResourceStatusReason']}"
+            log(message)
+
+        return next(
+            (
+                event["ResourceStatus"]
+                for event in events
+                if event["LogicalResourceId"] == deployment.stack_name
+                and event["ResourceType"] == "AWS::CloudFormation::Stack"
+            ),
+            None,
+        )
@@ -0,0 +1,178 @@
+import json
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from botocore.exceptions import ClientError
+from strictyaml.ruamel import YAML
+
+from .backoff import DEFAULT_WAIT_DELAY, MAX_WAIT_DELAY, SharedBackoff
+
+DRIFTED_RESOURCE_STATUSES = ["MODIFIED", "DELETED"]
+
+
+class ResourceDrift(NamedTuple):
+    """A resource that differs from its stack's template"""
+
+    logical_id: str
+    resource_type: str
+    status: str
+    # the paths of the properties that differ, like /Environment/ComputeType
+    property_paths: Tuple[str, ...] = ()
+
+
+class StackDrift(NamedTuple):
+    """The result of detecting a stack's drift"""
+
+    stack_name: str
+    status: str
+    resources: Tuple[ResourceDrift, ...] = ()
+    reason: Optional[str] = None
+
+
+class DriftDetector:
+    """Detects drift on many stacks at once, backing off together when throttled"""
+
+    cloudformation: Any
+    backoff: SharedBackoff
+
+    def __init__(
+        self,
+        cloudformation,
+        wait_delay: float = DEFAULT_WAIT_DELAY,
+        max_delay: float = MAX_WAIT_DELAY,
+    ):
+        self.cloudformation = cloudformation
+        self.backoff = SharedBackoff(wait_delay, max_delay)
+
+    def call(self, operation: str, **kwargs) -> Dict[str, Any]:
+        """Call a CloudFormation operation, retrying with the shared backoff when throttled"""
+        return self.backoff.call(getattr(self.cloudformation, operation), **kwargs)
+
+    def detect(self, stack_names: List[str]) -> List[StackDrift]:
+        """Start detecting drift on every stack, then wait for them all and report each"""
+        detection_ids: Dict[str, str] = {}
+        results: Dict[str, StackDrift] = {}
+        for stack_name in stack_names:
+            try:
+                detection_ids[stack_name] = self.call(
+                    "detect_stack_drift", StackName=stack_name
+                )["StackDriftDetectionId"]
+            except ClientError as exception:
+                results[stack_name] = StackDrift(
+                    stack_name, "FAILED", reason=exception.response["Error"]["Message"]
+                )
+
+        results.update(self.wait(detection_ids))
+        return [results[stack_name] for stack_name in stack_names]
+
+    def wait(self, detection_ids: Dict[str, str]) -> Dict[str, StackDrift]:
+        """Poll every pending detection each round, until they've all finished"""
+        results = {}
+        pending = dict(detection_ids)
+        while pending:
+            for stack_name, detection_id in list(pending.items()):
+                response = self.call(
+                    "describe_stack_drift_detection_status",
+                    StackDriftDetectionId=detection_id,
+                )
+                if response["DetectionStatus"] == "DETECTION_IN_PROGRESS":
+                    continue
+
+                del pending[stack_name]
+                results[stack_name] = self.result(stack_name, response)
+
+            if pending:
+                self.backoff.sleep()
+
+        return results
+
+    def result(self, stack_name: str, response: Dict[str, Any]) -> StackDrift:
+        """Report a finished detection, with the resources that drifted"""
+        status = response.get("StackDriftStatus", "UNKNOWN")
+        if response["DetectionStatus"] == "DETECTION_FAILED":
+            # drift was still detected for the resources that support it
+            return StackDrift(
+                stack_name,
+                status,
+                self.resource_drifts(stack_name) if status == "DRIFTED" else (),
+                response.get("DetectionStatusReason"),
+            )
+        if status != "DRIFTED":
+            return StackDrift(stack_name, status)
+
+        return StackDrift(stack_name, status, self.resource_drifts(stack_name))
+
+    def resource_drifts(self, stack_name: str) -> Tuple[ResourceDrift, ...]:
+        """Get a stack's modified and deleted resources"""
+        drifts: List[ResourceDrift] = []
+        kwargs = {
+            "StackName": stack_name,
+            "StackResourceDriftStatusFilters": DRIFTED_RESOURCE_STATUSES,
+        }
+        while True:
+            response = self.call("describe_stack_resource_drifts", **kwargs)
+            drifts.extend(
+                ResourceDrift(
+                    drift["LogicalResourceId"],
+                    drift["ResourceType"],
+                    drift["StackResourceDriftStatus"],
+                    tuple(
+                        difference["PropertyPath"]
+                        for difference in drift.get("PropertyDifferences", [])
+                    ),
+                )
+                for drift in response["StackResourceDrifts"]
+            )
+            if not response.get("NextToken"):
+                return tuple(drifts)
+            kwargs["NextToken"] = response["NextToken"]
+
+    def deployed_resources(self, stack_name: str) -> Dict[str, Any]:
+        """Get the resources of a stack's deployed template"""
+        template = self.call("get_template", StackName=stack_name)["TemplateBody"]
+        if isinstance(template, str):
+            template = YAML(typ="safe", pure=True).load(template)
+
+        return template.get("Resources", {})
+
+
+def redeploy_changes(
+    deployed_resources: Dict[str, Any], resources: Dict[str, Any]
+) -> Set[str]:
+    """Find the logical IDs of the resources that deploying a fresh render would change"""
+    # round trip through JSON, so that tuples compare equal to the deployed lists
+    resources = json.loads(json.dumps(resources))
+
+    return {
+        logical_id
+        for logical_id in set(deployed_resources).union(resources)
+        if deployed_resources.get(logical_id) != resources.get(logical_id)
+    }
+
+
+def read_manifest(lines: List[str]) -> List[Tuple[str, Optional[str]]]:
+    """Read a manifest of stack names, each optionally followed by its config's path"""
+    stacks: List[Tuple[str, Optional[str]]] = []
+    for line in lines:
+        fields = line.split("#", 1)[0].split()
+        if fields:
+            stacks.append((fields[0], fields[1] if len(fields) > 1 else None))
+
+    return stacks
+
+
+def format_drift(result: StackDrift, changes: Optional[Set[str]] = None) -> List[str]:
+    """Format a stack's drift as report lines, with whether a redeploy changes each resource"""
+    lines = [f"{result.stack_name}: {result.status}"]
+    if result.reason:
+        lines[0] += f" ({result.reason})"
+
+    for resource in result.resources:
+        line = f"  {resource.logical_id} ({resource.resource_type}) {resource.status}"
+        if resource.property_paths:
+            line += f": {', '.join(resource.property_paths)}"
+        if changes is not None:
+            changed = resource.logical_id in changes
+            line += f" - {'changed' if changed else 'unchanged'} by a redeploy"
+        lines.append(line)
+
+    return lines
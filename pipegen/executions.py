@@ -0,0 +1,238 @@
+import math
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .generators.codepipeline import LOGICAL_ID
+
+# the phases a build spends waiting for, rather than running on, its compute
+QUEUED_PHASES = frozenset({"SUBMITTED", "QUEUED", "PROVISIONING"})
+BATCH_GET_BUILDS_LIMIT = 100
+PERCENTILES = (50, 95)
+
+
+class ActionTiming(NamedTuple):
+    """How long an action took in one pipeline execution, and its build's phases"""
+
+    execution_id: str
+    stage: str
+    action: str
+    started: datetime
+    finished: datetime
+    # (phase type, seconds) pairs, empty when the action isn't a CodeBuild build
+    phases: Tuple[Tuple[str, float], ...] = ()
+
+    @property
+    def duration(self) -> float:
+        """Seconds from the action starting to it finishing"""
+        return (self.finished - self.started).total_seconds()
+
+    @property
+    def running(self) -> float:
+        """Seconds the action's build spent running, or the whole action if it isn't a build"""
+        if not self.phases:
+            return self.duration
+
+        return sum(
+            seconds for phase, seconds in self.phases if phase not in QUEUED_PHASES
+        )
+
+    @property
+    def queued(self) -> float:
+        """Seconds the action spent before its build started running"""
+        return max(self.duration - self.running, 0.0)
+
+
+def get_pipeline_name(cloudformation, stack_name: str, namespace: str = "") -> str:
+    """Get the name of the pipeline deployed by a stack, or of one of its pipelines"""
+    response = cloudformation.describe_stack_resource(
+        StackName=stack_name, LogicalResourceId=f"{namespace}{LOGICAL_ID}"
+    )
+    return response["StackResourceDetail"]["PhysicalResourceId"]
+
+
+def list_execution_ids(codepipeline, pipeline_name: str, count: int) -> List[str]:
+    """List the IDs of a pipeline's most recent succeeded executions"""
+    execution_ids: List[str] = []
+    paginator = codepipeline.get_paginator("list_pipeline_executions")
+    for page in paginator.paginate(pipelineName=pipeline_name):
+        for summary in page["pipelineExecutionSummaries"]:
+            if summary["status"] == "Succeeded":
+                execution_ids.append(summary["pipelineExecutionId"])
+            if len(execution_ids) == count:
+                return execution_ids
+
+    return execution_ids
+
+
+def list_action_executions(
+    codepipeline, pipeline_name: str, execution_id: str
+) -> List[Dict[str, Any]]:
+    """List the action executions of a pipeline execution"""
+    paginator = codepipeline.get_paginator("list_action_executions")
+    return [
+        detail
+        for page in paginator.paginate(
+            pipelineName=pipeline_name, filter={"pipelineExecutionId": execution_id}
+        )
+        for detail in page["actionExecutionDetails"]
+    ]
+
+
+def build_id(action_execution: Dict[str, Any]) -> Optional[str]:
+    """Get the ID of the build a CodeBuild action execution ran"""
+    provider = action_execution["input"]["actionTypeId"]["provider"]
+    if provider != "CodeBuild":
+        return None
+
+    return (
+        action_execution.get("output", {})
+        .get("executionResult", {})
+        .get("externalExecutionId")
+    )
+
+
+def get_build_phases(
+    codebuild, build_ids: Iterable[str]
+) -> Dict[str, Tuple[Tuple[str, float], ...]]:
+    """Get the phase durations of builds, by build ID"""
+    build_ids = sorted(set(build_ids))
+    phases = {}
+    for index in range(0, len(build_ids), BATCH_GET_BUILDS_LIMIT):
+        response = codebuild.batch_get_builds(
+            ids=build_ids[index : index + BATCH_GET_BUILDS_LIMIT]
+        )
+        for build in response["builds"]:
+            phases[build["id"]] = tuple(
+                (phase["phaseType"], float(phase.get("durationInSeconds", 0)))
+                for phase in build.get("phases", [])
+            )
+
+    return phases
+
+
+def get_action_timings(
+    clients: Dict[str, Any], pipeline_name: str, count: int
+) -> List[ActionTiming]:
+    """Get the timings of every action in a pipeline's most recent succeeded executions"""
+    action_executions = [
+        action_execution
+        for execution_id in list_execution_ids(
+            clients["codepipeline"], pipeline_name, count
+        )
+        for action_execution in list_action_executions(
+            clients["codepipeline"], pipeline_name, execution_id
+        )
+    ]
+    phases = get_build_phases(
+        clients["codebuild"],
+        filter(None, (build_id(execution) for execution in action_executions)),
+    )
+
+    return [
+        ActionTiming(
+            execution_id=execution["pipelineExecutionId"],
+            stage=execution["stageName"],
+            action=execution["actionName"],
+            started=execution["startTime"],
+            finished=execution["lastUpdateTime"],
+            phases=phases.get(build_id(execution) or "", ()),
+        )
+        for execution in action_executions
+    ]
+
+
+def percentile(values: List[float], rank: int) -> float:
+    """Get the nearest-rank percentile of values"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(rank / 100 * len(ordered)) - 1, 0)]
+
+
+def format_percentiles(values: List[float]) -> str:
+    """Format the p50 and p95 of durations in seconds"""
+    return " / ".join(f"{percentile(values, rank):.1f}s" for rank in PERCENTILES)
+
+
+def executions_by_stage(
+    timings: List[ActionTiming],
+) -> Dict[str, Dict[str, List[ActionTiming]]]:
+    """Group action timings by stage, in the order stages ran, then by execution"""
+    stages: Dict[str, Dict[str, List[ActionTiming]]] = defaultdict(
+        lambda: defaultdict(list)
+    )
+    for timing in sorted(timings, key=lambda timing: timing.started):
+        stages[timing.stage][timing.execution_id].append(timing)
+
+    return stages
+
+
+def stage_durations(executions: Dict[str, List[ActionTiming]]) -> List[float]:
+    """Get the seconds from a stage's first action starting to its last finishing, per execution"""
+    return [
+        (
+            max(timing.finished for timing in actions)
+            - min(timing.started for timing in actions)
+        ).total_seconds()
+        for actions in executions.values()
+    ]
+
+
+def critical_path(timings: List[ActionTiming]) -> List[Tuple[str, str, int]]:
+    """Find the action that most often finished its stage last, as (stage, action, count)"""
+    path = []
+    for stage, executions in executions_by_stage(timings).items():
+        last_actions = Counter(
+            max(actions, key=lambda timing: timing.finished).action
+            for actions in executions.values()
+        )
+        action, count = last_actions.most_common(1)[0]
+        path.append((stage, action, count))
+
+    return path
+
+
+def format_execution_stats(timings: List[ActionTiming]) -> List[str]:
+    """Format the p50/p95 of stages, actions and build phases, and the critical path, as report lines"""
+    stages = executions_by_stage(timings)
+    actions: Dict[Tuple[str, str], List[ActionTiming]] = defaultdict(list)
+    phases: Dict[str, List[float]] = defaultdict(list)
+    for timing in sorted(timings, key=lambda timing: timing.started):
+        actions[(timing.stage, timing.action)].append(timing)
+        for phase, seconds in timing.phases:
+            phases[phase].append(seconds)
+
+    lines = [
+        f"Executions: {len({timing.execution_id for timing in timings})}",
+        "Stages (p50 / p95):",
+        *[
+            f"  {stage}: {format_percentiles(stage_durations(executions))}"
+            for stage, executions in stages.items()
+        ],
+        "Actions (p50 / p95 of duration, queued and running):",
+        *[
+            f"  {stage}/{action}: "
+            f"{format_percentiles([timing.duration for timing in action_timings])}, "
+            f"queued {format_percentiles([timing.queued for timing in action_timings])}, "
+            f"running {format_percentiles([timing.running for timing in action_timings])}"
+            for (stage, action), action_timings in actions.items()
+        ],
+    ]
+    if phases:
+        lines.append("Build phases (p50 / p95):")
+        lines.extend(
+            f"  {phase}: {format_percentiles(seconds)}"
+            for phase, seconds in phases.items()
+        )
+
+    path = critical_path(timings)
+    path_p50 = sum(
+        percentile([timing.duration for timing in actions[(stage, action)]], 50)
+        for stage, action, _ in path
+    )
+    lines.append(f"Critical path (p50 {path_p50:.1f}s):")
+    lines.extend(
+        f"  {stage}/{action}: last to finish in {count} of {len(stages[stage])} executions"
+        for stage, action, count in path
+    )
+
+    return lines
@@ -0,0 +1,297 @@
+# strictyaml doesn't expose its validators' structure, so read it from their attributes
+# pylint: disable=protected-access
+import copy
+from typing import Any, Dict, List
+
+from strictyaml import (
+    Bool,
+    EmptyDict,
+    EmptyList,
+    Enum,
+    FixedSeq,
+    Int,
+    Map,
+    MapPattern,
+    Seq,
+    Str,
+    YAMLError,
+)
+from strictyaml import constants as strictyaml_constants
+from strictyaml.utils import is_integer
+from strictyaml.validators import OrValidator, Validator
+
+from .schema import BoundedInt, UniqueStr
+
+try:
+    from yaml import (
+        AliasToken,
+        AnchorToken,
+        CBaseLoader,
+        FlowMappingStartToken,
+        FlowSequenceStartToken,
+        MappingNode,
+        MarkedYAMLError,
+        Node,
+        ScalarNode,
+        SequenceNode,
+        TagToken,
+        compose,
+        scan,
+    )
+
+    DISALLOWED_TOKENS = {
+        AliasToken: "found an alias (disallowed)",
+        AnchorToken: "found an anchor (disallowed)",
+        TagToken: "found a tag (disallowed)",
+        FlowMappingStartToken: "found flow style (disallowed, use block style instead)",
+        FlowSequenceStartToken: "found flow style (disallowed, use block style instead)",
+    }
+except ImportError:  # pragma: no cover
+    CBaseLoader = None
+
+FAST_YAML_AVAILABLE = CBaseLoader is not None
+
+BOOL_VALUES = {
+    **{value: True for value in strictyaml_constants.TRUE_VALUES},
+    **{value: False for value in strictyaml_constants.FALSE_VALUES},
+}
+
+
+class ConfigValidationError(YAMLError):
+    """A config failed to parse or validate, with the line that caused it"""
+
+    def __init__(self, context: str, problem: str, label: str, mark):
+        super().__init__(context, problem)
+        self.context = context
+        self.problem = problem
+        self.label = label
+        self.line = mark.line + 1 if mark else None
+        self.column = mark.column + 1 if mark else None
+
+    def __str__(self) -> str:
+        location = f'  in "{self.label}"'
+        if self.line is not None:
+            location += f", line {self.line}, column {self.column}"
+
+        return f"{self.context}\n{self.problem}\n{location}"
+
+
+def compose_document(text: str, label: str) -> "Node":
+    """Parse a YAML document into nodes with the libyaml C loader, without implicit typing"""
+    try:
+        check_tokens(text, label)
+        node = compose(text, Loader=CBaseLoader)
+    except MarkedYAMLError as error:
+        raise ConfigValidationError(
+            error.context or "while parsing YAML",
+            error.problem or "found invalid YAML",
+            label,
+            error.problem_mark,
+        ) from error
+
+    if node is None:
+        raise ConfigValidationError(
+            "while parsing a document", "found an empty document", label, None
+        )
+
+    return node
+
+
+def check_tokens(text: str, label: str):
+    """Disallow the YAML features that strictyaml disallows: anchors, aliases, tags and flow style"""
+    for token in scan(text, Loader=CBaseLoader):
+        problem = DISALLOWED_TOKENS.get(type(token))
+        if problem:
+            raise ConfigValidationError(
+                "while scanning", problem, label, token.start_mark
+            )
+
+
+class NodeValidator:
+    """Validates libyaml nodes against a strictyaml schema, producing the same data as strictyaml"""
+
+    def __init__(self, label: str):
+        self.label = label
+        # strictyaml keeps the defaults added by an earlier validation ahead of
+        # the document's own keys when revalidating, so remember them to match
+        self.defaulted_keys: Dict[int, List[str]] = {}
+
+    def fail(self, node: "Node", context: str, problem: str):
+        """Raise a validation error for a node"""
+        raise ConfigValidationError(context, problem, self.label, node.start_mark)
+
+    def validate(self, node: "Node", validator: Validator) -> Any:
+        """Validate a node and convert it to data"""
+        validate = self.validate_scalar
+        if isinstance(validator, OrValidator):
+            validate = self.validate_or
+        elif isinstance(validator, (Map, MapPattern)):
+            validate = self.validate_mapping
+        elif isinstance(validator, Seq):
+            validate = self.validate_sequence
+        elif isinstance(validator, FixedSeq):
+            validate = self.validate_fixed_sequence
+
+        return validate(node, validator)
+
+    def validate_or(self, node: "Node", validator: OrValidator) -> Any:
+        """Validate a node against the first of two validators that it's valid for"""
+        try:
+            return self.validate(node, validator._validator_a)
+        except ConfigValidationError:
+            return self.validate(node, validator._validator_b)
+
+    def mapping_items(self, node: "Node") -> List:
+        """Get a mapping node's (key, value) pairs, disallowing duplicate keys"""
+        if not isinstance(node, MappingNode):
+            self.fail(node, "when expecting a mapping", "found non-mapping")
+
+        keys = set()
+        for key_node, _ in node.value:
+            if not isinstance(key_node, ScalarNode):
+                self.fail(key_node, "while parsing a mapping", "found non-scalar key")
+            if key_node.value in keys:
+                self.fail(
+                    key_node,
+                    "while parsing a mapping",
+                    f"found duplicate key '{key_node.value}' (disallowed)",
+                )
+            keys.add(key_node.value)
+
+        return node.value
+
+    def validate_mapping(self, node: "Node", validator: Validator) -> Dict:
+        """Validate a mapping node against a Map or MapPattern"""
+        items = self.mapping_items(node)
+        if isinstance(validator, MapPattern):
+            return {
+                self.validate(key, validator._key_validator): self.validate(
+                    value, validator._value_validator
+                )
+                for key, value in items
+            }
+
+        data = {}
+        for key_node, value_node in items:
+            if key_node.value not in validator._validator_dict:
+                self.fail(
+                    key_node,
+                    "while parsing a mapping",
+                    f"unexpected key not in schema '{key_node.value}'",
+                )
+            data[key_node.value] = self.validate(
+                value_node, validator._validator_dict[key_node.value]
+            )
+
+        missing_keys = set(validator._required_keys).difference(data)
+        if missing_keys:
+            self.fail(
+                node,
+                "while parsing a mapping",
+                f"required key(s) '{', '.join(sorted(missing_keys))}' not found",
+            )
+
+        document_keys = set(data)
+        add_defaults(validator, data)
+        earlier_keys = self.defaulted_keys.setdefault(
+            id(node), [key for key in data if key not in document_keys]
+        )
+
+        return {**{key: data[key] for key in earlier_keys if key in data}, **data}
+
+    def validate_sequence(self, node: "Node", validator: Seq) -> List:
+        """Validate a sequence node against a Seq"""
+        if not isinstance(node, SequenceNode):
+            self.fail(node, "when expecting a sequence", "found non-sequence")
+
+        return [self.validate(item, validator._validator) for item in node.value]
+
+    def validate_fixed_sequence(self, node: "Node", validator: FixedSeq) -> List:
+        """Validate a sequence node against a FixedSeq, with a validator per item"""
+        expecting = (
+            f"when expecting a sequence of {len(validator._validators)} elements"
+        )
+        if not isinstance(node, SequenceNode):
+            self.fail(node, expecting, "found non-sequence")
+        if len(node.value) != len(validator._validators):
+            self.fail(
+                node, expecting, f"found a sequence of {len(node.value)} elements"
+            )
+
+        return [
+            self.validate(item, item_validator)
+            for item, item_validator in zip(node.value, validator._validators)
+        ]
+
+    def validate_scalar(self, node: "Node", validator: Validator) -> Any:
+        """Validate a scalar node, and convert it to the validator's type"""
+        if not isinstance(node, ScalarNode):
+            self.fail(
+                node,
+                f"when expecting a {type(validator).__name__}",
+                "found a non-scalar",
+            )
+
+        value: Any
+        if isinstance(validator, (EmptyList, EmptyDict)):
+            if node.value != "":
+                self.fail(node, "when expecting an empty value", "found a value")
+            value = [] if isinstance(validator, EmptyList) else {}
+        elif isinstance(validator, Bool):
+            if node.value.lower() not in BOOL_VALUES:
+                self.fail(
+                    node, "when expecting a boolean value", "found arbitrary text"
+                )
+            value = BOOL_VALUES[node.value.lower()]
+        elif isinstance(validator, Int):
+            if not is_integer(node.value):
+                self.fail(node, "when expecting an integer", "found arbitrary text")
+            value = int(node.value.replace("_", ""))
+            if isinstance(validator, BoundedInt) and not validator.in_bounds(value):
+                self.fail(
+                    node,
+                    f"when expecting {validator.bounds_description}",
+                    f"found {node.value}",
+                )
+        else:
+            value = self.validate_string(node, validator)
+
+        return value
+
+    def validate_string(self, node: "Node", validator: Validator) -> str:
+        """Validate a string scalar node against a Str, UniqueStr or Enum"""
+        if isinstance(validator, Enum) and node.value not in validator._restricted_to:
+            self.fail(
+                node,
+                f"when expecting one of: {', '.join(validator._restricted_to)}",
+                f"found '{node.value}'",
+            )
+        if isinstance(validator, UniqueStr):
+            if node.value in validator.existing_items:
+                self.fail(node, "while parsing a set of strings", "duplicate found")
+            validator.existing_items.add(node.value)
+        elif not isinstance(validator, (Str, Enum)):
+            raise NotImplementedError(f"{validator!r} is not supported by libyaml")
+
+        return node.value
+
+
+def add_defaults(validator: Map, data: Dict) -> Dict:
+    """Add a Map's optional key defaults that are missing from its data"""
+    for key, default in validator._defaults.items():
+        if key not in data:
+            value = copy.deepcopy(default)
+            value_validator = validator._validator_dict[key]
+            if isinstance(value_validator, Map) and isinstance(value, dict):
+                # strictyaml serialises a Map default through its schema, in schema order
+                value = add_defaults(
+                    value_validator,
+                    {
+                        schema_key: value[schema_key]
+                        for schema_key in value_validator._validator_dict
+                        if schema_key in value
+                    },
+                )
+            data[key] = value
+
+    return data
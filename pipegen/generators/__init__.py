@@ -1,55 +1,119 @@
-from pipegen.config import contains_codecommit_with_event
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from pipegen.config import (
+    check_parameters,
+    contains_codecommit_with_event,
+    get_pipeline_configs,
+    get_regional_config,
+    get_shared_config,
+)
+from pipegen.model import PipelineConfig
 
 from . import codebuild, codepipeline, iam, logs
 
 
-def generate(config):
-    """Generate all config elements"""
+def iter_resources(
+    config: PipelineConfig, region: Optional[str] = None, jobs: Optional[int] = None
+) -> Iterator[Dict[str, Any]]:
+    """Generate config elements one at a time, or the CodeBuild elements for actions in another region"""
 
-    resources = {}
+    regional_config = get_regional_config(config, region)
 
-    log_group = logs.log_group(config)
+    # the log group and roles are shared by every pipeline in the config
+    log_group = logs.log_group(regional_config)
     log_group_logical_id = None
     if log_group:
-        resources.update(log_group.definition)
+        yield log_group.definition
         log_group_logical_id = log_group.logical_id
 
     definition, codebuild_role_logical_name = iam.codebuild_role(
-        config, log_group_logical_id
+        get_shared_config(regional_config), log_group_logical_id
     )
-    resources.update(definition)
-
-    codebuild_projects = codebuild.get_codebuild_projects(config)
-    codebuild_logical_ids = []
-    for codebuild_project in codebuild_projects:
-        definition, codebuild_project_logical_name = codebuild.project(
-            codebuild_project,
-            config.get("config", {}),
+    yield definition
+
+    codebuild_project_logical_ids = []
+    for pipeline_config in get_pipeline_configs(regional_config):
+        for definition, logical_id in codebuild.generate_projects(
+            codebuild.get_generated_projects(pipeline_config),
+            pipeline_config,
             codebuild_role_logical_name,
             log_group_logical_id,
-        )
+            jobs,
+        ):
+            yield definition
+            codebuild_project_logical_ids.append(logical_id)
 
-        resources.update(definition)
-        codebuild_logical_ids.append(codebuild_project_logical_name)
+    if region:
+        return
 
     definition, codepipeline_role_logical_name = iam.codepipeline_role(
-        config, codebuild_logical_ids
+        get_shared_config(config), codebuild_project_logical_ids
     )
-    resources.update(definition)
+    yield definition
 
-    definition, codepipeline_logical_id = codepipeline.pipeline(
-        config, codepipeline_role_logical_name
-    )
-    resources.update(definition)
+    event_pipelines = []
+    for pipeline_config in get_pipeline_configs(config):
+        definition, codepipeline_logical_id = codepipeline.pipeline(
+            pipeline_config, codepipeline_role_logical_name
+        )
+        yield definition
+        if contains_codecommit_with_event(pipeline_config):
+            event_pipelines.append((pipeline_config, codepipeline_logical_id))
 
-    if contains_codecommit_with_event(config):
+    if event_pipelines:
         definition, cloudwatch_event_role = iam.cloud_watch_event_role(
-            codepipeline_logical_id
-        )
-        resources.update(definition)
-        definition, _ = codepipeline.cloudwatch_events(
-            config, cloudwatch_event_role, codepipeline_logical_id
+            [codepipeline_logical_id for _, codepipeline_logical_id in event_pipelines]
         )
+        yield definition
+        for pipeline_config, codepipeline_logical_id in event_pipelines:
+            definition, _ = codepipeline.cloudwatch_events(
+                pipeline_config, cloudwatch_event_role, codepipeline_logical_id
+            )
+            yield definition
+
+
+def generate(
+    config: PipelineConfig, region: Optional[str] = None, jobs: Optional[int] = None
+):
+    """Generate all config elements, or the CodeBuild elements for actions in another region"""
+
+    resources = {}
+    for definition in iter_resources(config, region, jobs):
         resources.update(definition)
 
     return resources
+
+
+def generate_parameters(
+    parameters: Iterable[str], parameter_defaults: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
+    """Generate CloudFormation parameters for parameterised vars"""
+    parameter_defaults = parameter_defaults or {}
+
+    definitions: Dict[str, Any] = {}
+    for parameter in sorted(set(parameters)):
+        definitions[parameter] = {"Type": "String"}
+        if parameter in parameter_defaults:
+            definitions[parameter]["Default"] = parameter_defaults[parameter]
+
+    return definitions
+
+
+def generate_template(
+    config: PipelineConfig,
+    parameters: Iterable[str] = (),
+    parameter_defaults: Optional[Dict[str, str]] = None,
+    region: Optional[str] = None,
+    jobs: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Generate a CloudFormation template, with parameters for parameterised vars"""
+    template: Dict[str, Any] = {}
+    if parameters:
+        template["Parameters"] = generate_parameters(parameters, parameter_defaults)
+
+    template["Resources"] = generate(
+        config._replace(parameters=tuple(parameters)), region, jobs
+    )
+    check_parameters(template, parameters)
+
+    return template
@@ -1,15 +1,50 @@
 import re
-from functools import reduce
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial, reduce
 from io import StringIO
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from strictyaml.ruamel import YAML
 
-from pipegen.config import get_ecr_arn, parse_value
+from pipegen.config import (
+    FnSub,
+    get_ecr_arn,
+    get_pipeline_configs,
+    parse_value,
+    substitute_parameters,
+)
+from pipegen.model import Action, Artifact, DockerConfig, PipelineConfig, Stage
 
 from .interfaces import ResourceOutput
+from .logs import s3_logs_value
 
 PROJECT_LOGICAL_ID_PATTERN = re.compile(r"[\W_]+")
+ARTIFACT_NAME_PATTERN = re.compile(r"[\W_]+")
+DOCKER_REPOSITORY_VARIABLES = {
+    "DOCKER_REPOSITORY": "repository",
+    "DOCKER_CACHE_REPOSITORY": "cache_repository",
+}
+# an expr(1) pattern capturing the region of an ECR registry host
+ECR_REGION_PATTERN = r"'[0-9]*\.dkr\.ecr\.\([a-z0-9-]*\)\.amazonaws\.com'"
+# the revision of the primary source being built, passed from its source action's variables
+SOURCE_REVISION_VARIABLE = "PIPEGEN_SOURCE_REVISION"
+SKIP_BUILD_VARIABLE = "PIPEGEN_SKIP_BUILD"
+# CodePipeline lists this many of its recent executions per page, newest first
+PIPELINE_EXECUTIONS_PAGE_SIZE = 100
+SHARED_PROJECT_KEYS = (
+    "buildspec",
+    "commands",
+    "artifacts",
+    "secondary_artifacts",
+    "paths",
+    "compute_type",
+    "image",
+    "docker",
+    "region",
+    "concurrent_build_limit",
+    "queued_timeout",
+    "weight",
+)
 
 
 def convert_to_yaml(template) -> str:
@@ -21,49 +56,302 @@ def convert_to_yaml(template) -> str:
     return output.getvalue()
 
 
-def generate_source_config(project_config) -> Dict[str, Any]:
-    """Generate a source config entry for a project config"""
+def docker_login_commands(docker_config: Optional[DockerConfig]) -> List[str]:
+    """Generate the commands to log in to a docker block's ECR registries"""
+    if not docker_config:
+        return []
+
+    # each registry is logged in to in its own region, read from its
+    # <account>.dkr.ecr.<region>.amazonaws.com host, falling back to the build's region
+    # for bare repository names
+    return [
+        f'ecr_region="$(expr "${{{variable}%%/*}}" : {ECR_REGION_PATTERN})"; '
+        'aws ecr get-login-password --region "${ecr_region:-$AWS_REGION}" | docker login '
+        f'--username AWS --password-stdin "${{{variable}%%/*}}"'
+        for variable, key in DOCKER_REPOSITORY_VARIABLES.items()
+        if getattr(docker_config, key)
+    ]
+
+
+def docker_environment_variables(
+    docker_config: Optional[DockerConfig],
+) -> Dict[str, Any]:
+    """Generate the environment variables for a docker block"""
+    if not docker_config:
+        return {}
+
+    variables: Dict[str, Any] = {"DOCKER_BUILDKIT": "1"}
+    for variable, key in DOCKER_REPOSITORY_VARIABLES.items():
+        if getattr(docker_config, key):
+            variables[variable] = getattr(docker_config, key)
+
+    cache_repository = docker_config.cache_repository
+    if cache_repository:
+        cache_ref = f"type=registry,ref=${{CacheRepository}}:{docker_config.cache_tag}"
+        variables["DOCKER_CACHE_FROM"] = parse_value(
+            cache_ref, CacheRepository=cache_repository
+        )
+        variables["DOCKER_CACHE_TO"] = parse_value(
+            f"{cache_ref},mode=max,image-manifest=true,oci-mediatypes=true",
+            CacheRepository=cache_repository,
+        )
+
+    return variables
+
+
+def changed_paths_command(source_name: str, paths: Tuple[str, ...]) -> str:
+    """Generate a command that skips the build unless files matching paths changed since the
+    pipeline last succeeded, running it in full whenever that can't be worked out"""
+    pathspecs = " ".join(f"':(glob){path}'" for path in paths)
+    query = (
+        "pipelineExecutionSummaries[?status=='Succeeded'] | [0]"
+        f".sourceRevisions[?actionName=='{source_name}'] | [0].revisionId"
+    )
+
+    return "\n".join(
+        [
+            'PIPEGEN_LAST_REVISION="$(aws codepipeline list-pipeline-executions '
+            '--pipeline-name "${CODEBUILD_INITIATOR#codepipeline/}" '
+            f'--max-items {PIPELINE_EXECUTIONS_PAGE_SIZE} --query "{query}" '
+            '--output text || true)"',
+            'if [ -n "$PIPEGEN_LAST_REVISION" ] && [ "$PIPEGEN_LAST_REVISION" != None ] \\',
+            '  && { git cat-file -e "$PIPEGEN_LAST_REVISION^{commit}" '
+            '|| git fetch --quiet --depth=1 origin "$PIPEGEN_LAST_REVISION"; } \\',
+            '  && PIPEGEN_CHANGED_PATHS="$(git diff --name-only "$PIPEGEN_LAST_REVISION" '
+            f'"${SOURCE_REVISION_VARIABLE}" -- {pathspecs})" \\',
+            '  && [ -z "$PIPEGEN_CHANGED_PATHS" ]; then',
+            f"  export {SKIP_BUILD_VARIABLE}=1",
+            '  echo "No paths changed since $PIPEGEN_LAST_REVISION, skipping the build"',
+            "fi",
+        ]
+    )
+
+
+def skippable_command(command: str) -> str:
+    """Wrap a build command so that it doesn't run when the build is skipped"""
+    return f'if [ "${SKIP_BUILD_VARIABLE}" != 1 ]; then\n{command}\nfi'
+
+
+def sanitise_artifact_name(name: str) -> str:
+    """Sanitise the input/output artifact name"""
+    return ARTIFACT_NAME_PATTERN.sub("", name)
+
+
+def output_artifact_names(project_config: Action) -> List[str]:
+    """Get an action's output artifact names, its own unless it only has secondary artifacts"""
+    names = [artifact.name or "" for artifact in project_config.secondary_artifacts]
+    if project_config.artifacts or not names:
+        names.insert(0, project_config.name)
+
+    return [sanitise_artifact_name(name) for name in names]
+
+
+def artifact_buildspec(artifact: Artifact) -> Dict[str, Any]:
+    """Generate a buildspec artifact, with its packaging settings"""
+    buildspec: Dict[str, Any] = {"files": list(artifact.files)}
+    if artifact.base_directory:
+        buildspec["base-directory"] = artifact.base_directory
+    if artifact.discard_paths:
+        buildspec["discard-paths"] = "yes"
+    if artifact.exclude_paths:
+        buildspec["exclude-paths"] = list(artifact.exclude_paths)
+
+    return buildspec
+
+
+def generate_artifacts_config(project_config: Action) -> Dict[str, Any]:
+    """Generate a buildspec's artifacts, one per output artifact"""
+    if not project_config.secondary_artifacts:
+        if not project_config.artifacts:
+            return {}
+
+        return artifact_buildspec(project_config.artifacts)
+
+    # CodePipeline uploads each of several output artifacts from the secondary
+    # artifact whose identifier matches its name
+    artifacts = [project_config.artifacts, *project_config.secondary_artifacts]
+    return {
+        "secondary-artifacts": {
+            name: artifact_buildspec(artifact)
+            for name, artifact in zip(
+                output_artifact_names(project_config),
+                [artifact for artifact in artifacts if artifact],
+            )
+        }
+    }
+
+
+def generate_source_config(
+    project_config: Action,
+    source_name: Optional[str] = None,
+    parameters: Iterable[str] = (),
+) -> Dict[str, Any]:
+    """Generate a source config entry for a project config, built from a primary source"""
 
     source: Dict[str, Any] = {"Type": "CODEPIPELINE"}
 
-    if project_config.get("buildspec"):
+    if project_config.buildspec:
         source["BuildSpec"] = parse_value(
-            "${BuildSpec}", BuildSpec=project_config["buildspec"]
+            "${BuildSpec}", BuildSpec=project_config.buildspec
         )
-    elif project_config.get("commands"):
-        template = {
+    elif project_config.commands:
+        template: Dict[str, Any] = {
             "version": 0.2,
-            "phases": {"build": {"commands": project_config["commands"]}},
+            "phases": {"build": {"commands": list(project_config.commands)}},
         }
 
-        artifacts = project_config.get("artifacts")
+        pre_build_commands = docker_login_commands(project_config.docker)
+        if project_config.paths and source_name:
+            pre_build_commands.append(
+                changed_paths_command(source_name, project_config.paths)
+            )
+            template["phases"]["build"]["commands"] = [
+                skippable_command(command) for command in project_config.commands
+            ]
+        if pre_build_commands:
+            template["phases"] = {
+                "pre_build": {"commands": pre_build_commands},
+                **template["phases"],
+            }
+
+        artifacts = generate_artifacts_config(project_config)
         if artifacts:
-            template.update({"artifacts": {"files": artifacts}})
+            template["artifacts"] = artifacts
 
-        source["BuildSpec"] = convert_to_yaml(template)
+        source["BuildSpec"] = substitute_parameters(
+            convert_to_yaml(template), parameters
+        )
 
     return source
 
 
-def generate_logical_id(name: str) -> str:
-    """Generate CodeBuild logical resource ID"""
-    return f"CodeBuild{PROJECT_LOGICAL_ID_PATTERN.sub('', name)}"
+def generate_clone_config(config: PipelineConfig) -> Dict[str, Any]:
+    """Generate a project's git clone settings, if CodeBuild clones its primary source"""
+    if not config.sources or not config.sources[0].clone_ref:
+        return {}
+
+    source = config.sources[0]
+    clone_config: Dict[str, Any] = {"GitCloneDepth": source.git_clone_depth}
+    if source.fetch_submodules:
+        clone_config["GitSubmodulesConfig"] = {"FetchSubmodules": True}
+
+    return clone_config
+
+
+def generate_logical_id(name: str, namespace: str = "") -> str:
+    """Generate CodeBuild logical resource ID, prefixed by its pipeline's namespace"""
+    return f"{namespace}CodeBuild{PROJECT_LOGICAL_ID_PATTERN.sub('', name)}"
+
 
+def regional_project_name(logical_id: str) -> FnSub:
+    """Generate the name of a project deployed to another region's stack"""
+    return {"Fn::Sub": f"${{AWS::StackName}}-{logical_id}"}
 
-def get_codebuild_projects(config):
+
+def regional_project_arn(logical_id: str, region: str) -> FnSub:
+    """Generate the ARN of a project deployed to another region's stack"""
+    return {
+        "Fn::Sub": f"arn:aws:codebuild:{region}:${{AWS::AccountId}}:project/${{AWS::StackName}}-{logical_id}"
+    }
+
+
+def get_codebuild_projects(config: PipelineConfig) -> List[Action]:
     """Get all the codebuild projects required"""
 
-    def project_reducer(existing, stage: dict):
+    def project_reducer(existing: List[Action], stage: Stage) -> List[Action]:
         """The reducer"""
-        if stage.get("enabled"):
-            existing.extend(stage["actions"])
+        if stage.enabled:
+            existing.extend(stage.actions)
         return existing
 
-    projects = list(reduce(project_reducer, config["stages"], []))
+    projects: List[Action] = reduce(project_reducer, config.stages, [])
+
+    return projects
+
+
+def has_path_filters(config: PipelineConfig) -> bool:
+    """Whether any action skips builds by the paths that changed"""
+    return any(
+        project_config.paths for project_config in get_codebuild_projects(config)
+    )
+
+
+def project_group_key(project_config: Action) -> Tuple:
+    """Generate a key identifying the build config of a project"""
+    return tuple(getattr(project_config, key) for key in SHARED_PROJECT_KEYS)
+
+
+def group_codebuild_projects(
+    projects: List[Action], namespace: str = ""
+) -> Dict[str, List[Action]]:
+    """Group projects with identical build config by their shared logical ID"""
+    logical_ids: Dict[Tuple, str] = {}
+    groups: Dict[str, List[Action]] = {}
+    for project_config in projects:
+        logical_id = logical_ids.setdefault(
+            project_group_key(project_config),
+            generate_logical_id(project_config.name, namespace),
+        )
+        groups.setdefault(logical_id, []).append(project_config)
+
+    return groups
+
+
+def get_shared_codebuild_projects(projects: List[Action]) -> List[Action]:
+    """Reduce projects to one per group, with the per-action environment removed"""
+    return [
+        actions[0]._replace(environment=())
+        for actions in group_codebuild_projects(projects).values()
+    ]
+
+
+def get_generated_projects(config: PipelineConfig) -> List[Action]:
+    """Get the configs of the projects to generate, with one per group if sharing"""
+    projects = get_codebuild_projects(config)
+    if config.codebuild.share_projects:
+        projects = get_shared_codebuild_projects(projects)
 
     return projects
 
 
+def get_project_logical_ids(config: PipelineConfig) -> Dict[str, str]:
+    """Map each action's name to the logical ID of the project that runs it"""
+    projects = get_codebuild_projects(config)
+    if not config.codebuild.share_projects:
+        return {
+            project_config.name: generate_logical_id(
+                project_config.name, config.namespace
+            )
+            for project_config in projects
+        }
+
+    return {
+        project_config.name: logical_id
+        for logical_id, actions in group_codebuild_projects(
+            projects, config.namespace
+        ).items()
+        for project_config in actions
+    }
+
+
+def get_regional_project_arns(config: PipelineConfig) -> List[FnSub]:
+    """Get the ARNs of projects for actions that run in another region, in any of its pipelines"""
+    arns: List[FnSub] = []
+    for pipeline_config in get_pipeline_configs(config):
+        project_logical_ids = get_project_logical_ids(pipeline_config)
+        for project_config in get_codebuild_projects(pipeline_config):
+            if not project_config.region:
+                continue
+
+            arn = regional_project_arn(
+                project_logical_ids[project_config.name], project_config.region
+            )
+            if arn not in arns:
+                arns.append(arn)
+
+    return arns
+
+
 def is_ecr(image: str) -> bool:
     """Determines if the image is from ECR or not"""
     try:
@@ -73,71 +361,126 @@ def is_ecr(image: str) -> bool:
         return False
 
 
+def path_filter_source(project_config: Action, config: PipelineConfig) -> Optional[str]:
+    """Get the name of the source whose changes an action with paths is filtered by"""
+    if not project_config.paths:
+        return None
+    if (
+        not project_config.commands
+        or project_config.artifacts
+        or project_config.secondary_artifacts
+    ):
+        raise RuntimeError(
+            f"Action {project_config.name} has paths, which are only supported by "
+            "commands actions without artifacts, as a skipped build has no artifacts"
+        )
+    if not config.sources or not config.sources[0].clone_ref:
+        raise RuntimeError(
+            f"Action {project_config.name} has paths, which need the first source to "
+            "use output_artifact_format: CODEBUILD_CLONE_REF, to diff its git history"
+        )
+
+    return config.sources[0].name
+
+
+def generate_logs_config(
+    config: PipelineConfig, log_group_logical_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Generate a project's CloudWatch and S3 logs config"""
+    log_group = config.codebuild.log_group
+    if log_group.enabled:
+        log_group_name = parse_value("${GroupName}", GroupName=log_group.name)
+        if log_group_logical_id:
+            log_group_name = {"Ref": log_group_logical_id}
+
+        logs_config: Dict[str, Any] = {
+            "CloudWatchLogs": {
+                "GroupName": log_group_name,
+                "Status": "ENABLED",
+            }
+        }
+    else:
+        logs_config = {
+            "CloudWatchLogs": {
+                "Status": "DISABLED",
+            }
+        }
+
+    s3_logs = config.codebuild.s3_logs
+    if s3_logs.enabled:
+        logs_config["S3Logs"] = {
+            "Status": "ENABLED",
+            "Location": s3_logs_value(config, "${BucketName}/${Prefix}"),
+            "EncryptionDisabled": not s3_logs.encrypted,
+        }
+
+    return logs_config
+
+
 def project(
-    project_config,
-    sub_config: dict,
+    project_config: Action,
+    config: PipelineConfig,
     role_logical_id: str,
     log_group_logical_id: Optional[str] = None,
 ) -> ResourceOutput:
     """Generate a CodeBuild project resource"""
-    logical_id = generate_logical_id(project_config["name"])
+    logical_id = generate_logical_id(project_config.name, config.namespace)
 
-    environment_variables = project_config.get("environment", {})
-    environment_variables.setdefault("AWS_DEFAULT_REGION", "AWS::Region")
-    environment_variables.setdefault("AWS_REGION", "AWS::Region")
+    docker_config = project_config.docker
+    # copy the configured variables, so that adding defaults leaves the action untouched
+    environment_variables: Dict[str, Any] = dict(project_config.environment)
+    default_variables = {
+        "AWS_DEFAULT_REGION": "AWS::Region",
+        "AWS_REGION": "AWS::Region",
+        **docker_environment_variables(docker_config),
+    }
+    for key, value in default_variables.items():
+        environment_variables.setdefault(key, value)
 
     image_credential_type = (
-        "SERVICE_ROLE" if is_ecr(project_config["image"]) else "CODEBUILD"
+        "SERVICE_ROLE" if is_ecr(project_config.image) else "CODEBUILD"
     )
 
     resource_properties = {
         "Artifacts": {"Type": "CODEPIPELINE"},
         "Environment": {
             "ComputeType": parse_value(
-                "${ComputeType}", ComputeType=project_config["compute_type"]
+                "${ComputeType}", ComputeType=project_config.compute_type
             ),
-            "Image": parse_value("${Image}", Image=project_config["image"]),
+            "Image": parse_value("${Image}", Image=project_config.image),
             "ImagePullCredentialsType": image_credential_type,
             "EnvironmentVariables": [
                 {"Name": key, "Value": parse_value("${Value}", Value=value)}
                 for key, value in environment_variables.items()
             ],
-            "PrivilegedMode": False,
+            "PrivilegedMode": bool(docker_config and docker_config.privileged),
             "Type": "LINUX_CONTAINER",
         },
         "ServiceRole": {"Fn::GetAtt": [role_logical_id, "Arn"]},
-        "Source": generate_source_config(project_config),
-        "EncryptionKey": parse_value(
-            "${KmsKeyArn}", KmsKeyArn=sub_config["kms_key_arn"]
-        ),
+        "Source": {
+            **generate_source_config(
+                project_config,
+                path_filter_source(project_config, config),
+                config.parameters,
+            ),
+            **generate_clone_config(config),
+        },
+        "EncryptionKey": parse_value("${KmsKeyArn}", KmsKeyArn=config.kms_key_arn),
     }
 
-    log_group = sub_config.get("codebuild", {}).get("log_group", {})
-    if log_group.get("enabled"):
-        log_group_name = parse_value("${GroupName}", GroupName=log_group.get("name"))
-        if log_group_logical_id:
-            log_group_name = {"Ref": log_group_logical_id}
-
-        resource_properties.update(
-            {
-                "LogsConfig": {
-                    "CloudWatchLogs": {
-                        "GroupName": log_group_name,
-                        "Status": "ENABLED",
-                    }
-                }
-            }
-        )
-    else:
-        resource_properties.update(
-            {
-                "LogsConfig": {
-                    "CloudWatchLogs": {
-                        "Status": "DISABLED",
-                    }
-                }
-            }
+    if project_config.concurrent_build_limit:
+        resource_properties["ConcurrentBuildLimit"] = (
+            project_config.concurrent_build_limit
         )
+    if project_config.queued_timeout:
+        resource_properties["QueuedTimeoutInMinutes"] = project_config.queued_timeout
+
+    if project_config.region or config.compact_policies:
+        resource_properties["Name"] = regional_project_name(logical_id)
+
+    resource_properties["LogsConfig"] = generate_logs_config(
+        config, log_group_logical_id
+    )
 
     return ResourceOutput(
         definition={
@@ -148,3 +491,28 @@ def project(
         },
         logical_id=logical_id,
     )
+
+
+def generate_projects(
+    project_configs: List[Action],
+    config: PipelineConfig,
+    role_logical_id: str,
+    log_group_logical_id: Optional[str] = None,
+    jobs: Optional[int] = None,
+) -> Iterator[ResourceOutput]:
+    """Generate CodeBuild project resources in order, across a process pool if jobs > 1"""
+    generate_project = partial(
+        project,
+        config=config,
+        role_logical_id=role_logical_id,
+        log_group_logical_id=log_group_logical_id,
+    )
+    jobs = min(jobs or 1, len(project_configs) or 1)
+    if jobs == 1:
+        yield from map(generate_project, project_configs)
+        return
+
+    chunksize = max(1, len(project_configs) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        # map returns results in the order of project_configs, whichever finishes first
+        yield from executor.map(generate_project, project_configs, chunksize=chunksize)
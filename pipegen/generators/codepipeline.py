@@ -1,15 +1,23 @@
+import json
 import re
-from typing import TYPE_CHECKING, Any, Dict, List
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
 
-from pipegen.config import is_codecommit_with_event_source, parse_value
+from pipegen.config import FnSub, is_codecommit_with_event_source, parse_value
+from pipegen.model import Action, PipelineConfig, Source
 
-from .codebuild import generate_logical_id
+from .codebuild import (
+    SOURCE_REVISION_VARIABLE,
+    generate_logical_id,
+    get_project_logical_ids,
+    has_path_filters,
+    output_artifact_names,
+    regional_project_name,
+    sanitise_artifact_name,
+)
 from .interfaces import ResourceOutput
 
 LOGICAL_ID = "CodePipeline"
 
-ARTIFACT_NAME_PATTERN = re.compile(r"[\W_]+")
-
 if TYPE_CHECKING:  # pragma: no cover
     from typing_extensions import TypedDict
 
@@ -18,8 +26,8 @@ if TYPE_CHECKING:  # pragma: no cover
         {"Category": str, "Owner": str, "Provider": str, "Version": int},
     )
     OutputArtifact = TypedDict("OutputArtifact", {"Name": str})
-    SourceDefinition = TypedDict(
-        "SourceDefinition",
+    RequiredSourceDefinition = TypedDict(
+        "RequiredSourceDefinition",
         {
             "Name": str,
             "ActionTypeId": ActionTypeId,
@@ -27,19 +35,27 @@ if TYPE_CHECKING:  # pragma: no cover
             "OutputArtifacts": List[OutputArtifact],
         },
     )
+
+    class SourceDefinition(RequiredSourceDefinition, total=False):
+        """A source action definition, with the namespace of its variables if it has one"""
+
+        Namespace: str
+
 else:
     SourceDefinition = object
 
 
-def sanitise_artifact_name(name: str) -> str:
-    """Sanitise the input/output artifact name"""
-    return ARTIFACT_NAME_PATTERN.sub("", name)
+def source_namespace(name: str) -> str:
+    """Generate the namespace of a source action's variables, like CommitId"""
+    return f"{sanitise_artifact_name(name)}Variables"
 
 
-def source_action_definition(source: Dict[str, str]) -> SourceDefinition:
-    """Get a Source's CodePipeline Action definition"""
+def source_action_definition(
+    source: Source, namespace: bool = False
+) -> SourceDefinition:
+    """Get a Source's CodePipeline Action definition, optionally exposing its variables"""
     definition: SourceDefinition = {
-        "Name": source["name"],
+        "Name": source.name,
         "ActionTypeId": {
             "Category": "Source",
             "Owner": "AWS",
@@ -47,127 +63,214 @@ def source_action_definition(source: Dict[str, str]) -> SourceDefinition:
             "Version": 1,
         },
         "Configuration": {
-            "BranchName": parse_value("${BranchName}", BranchName=source["branch"]),
+            "BranchName": parse_value("${BranchName}", BranchName=source.branch),
         },
-        "OutputArtifacts": [{"Name": sanitise_artifact_name(source["name"])}],
+        "OutputArtifacts": [{"Name": sanitise_artifact_name(source.name)}],
     }
 
-    repository = parse_value("${RepositoryName}", RepositoryName=source["repository"])
+    repository = parse_value("${RepositoryName}", RepositoryName=source.repository)
 
-    if source["from"] == "CodeCommit":
+    if source.provider == "CodeCommit":
         definition["Configuration"].update(
             {
                 "RepositoryName": repository,
-                "PollForSourceChanges": source.get("poll_for_source_changes"),
+                "PollForSourceChanges": source.poll_for_source_changes,
             }
         )
-    if source["from"] == "CodeStarConnection":
+    if source.provider == "CodeStarConnection":
         definition["ActionTypeId"].update({"Provider": "CodeStarSourceConnection"})
         definition["Configuration"].update(
             {
                 "ConnectionArn": parse_value(
-                    "${ConnectionArn}", ConnectionArn=source.get("connection_arn")
+                    "${ConnectionArn}", ConnectionArn=source.connection_arn
                 ),
                 "FullRepositoryId": repository,
             }
         )
+    if namespace:
+        definition["Namespace"] = source_namespace(source.name)
+    if source.output_artifact_format:
+        definition["Configuration"][
+            "OutputArtifactFormat"
+        ] = source.output_artifact_format
 
     return definition
 
 
-def codebuild_action_definition(action, source_names) -> dict:
+def environment_variables_configuration(
+    environment: Dict[str, str],
+) -> Union[str, FnSub]:
+    """Generate a CodeBuild action's EnvironmentVariables configuration"""
+    parsed_values = [
+        (key, parse_value("${Value}", Value=value))
+        for key, value in environment.items()
+    ]
+    needs_substitution = any(not isinstance(value, str) for _, value in parsed_values)
+
+    variables = []
+    substitutions: Dict[str, Any] = {}
+    for index, (key, value) in enumerate(parsed_values):
+        if not isinstance(value, str):
+            substitutions[f"Value{index}"] = value
+            value = f"${{Value{index}}}"
+        elif needs_substitution:
+            # escape literal values so Fn::Sub leaves them untouched
+            value = value.replace("${", "${!")
+
+        variables.append({"name": key, "value": value, "type": "PLAINTEXT"})
+
+    configuration = json.dumps(variables)
+    if not substitutions:
+        return configuration
+
+    return {"Fn::Sub": (configuration, substitutions)}
+
+
+def codebuild_action_definition(
+    action: Action,
+    source_names: List[str],
+    project_logical_id: Optional[str] = None,
+    environment_variables: bool = False,
+) -> dict:
     """Generate a CodeBuild CodePipeline action definition"""
     primary_source = source_names[0]
 
-    return {
-        "Name": action["name"],
+    project_logical_id = project_logical_id or generate_logical_id(action.name)
+    configuration: Dict[str, Any] = {
+        "ProjectName": {"Ref": project_logical_id},
+        "PrimarySource": sanitise_artifact_name(primary_source),
+    }
+    if action.region:
+        configuration["ProjectName"] = regional_project_name(project_logical_id)
+    variables = dict(action.environment) if environment_variables else {}
+    if action.paths:
+        variables[SOURCE_REVISION_VARIABLE] = (
+            f"#{{{source_namespace(primary_source)}.CommitId}}"
+        )
+    if variables:
+        configuration["EnvironmentVariables"] = environment_variables_configuration(
+            variables
+        )
+
+    definition = {
+        "Name": action.name,
         "ActionTypeId": {
-            "Category": action["category"],
+            "Category": action.category,
             "Owner": "AWS",
             "Provider": "CodeBuild",
             "Version": 1,
         },
-        "Configuration": {
-            "ProjectName": {"Ref": generate_logical_id(action["name"])},
-            "PrimarySource": sanitise_artifact_name(primary_source),
-        },
+        "Configuration": configuration,
         "InputArtifacts": [
             *[{"Name": sanitise_artifact_name(source)} for source in source_names],
             *[
                 {"Name": sanitise_artifact_name(input_artifact)}
-                for input_artifact in action.get("input_artifacts", [])
+                for input_artifact in action.input_artifacts
             ],
         ],
-        "OutputArtifacts": [{"Name": sanitise_artifact_name(action["name"])}],
+        "OutputArtifacts": [{"Name": name} for name in output_artifact_names(action)],
+    }
+    if action.region:
+        definition["Region"] = action.region
+
+    return definition
+
+
+def artifact_store(bucket: str, kms_key_arn: str) -> Dict[str, Any]:
+    """Generate a CodePipeline artifact store"""
+    return {
+        "EncryptionKey": {
+            "Id": parse_value("${KmsKeyArn}", KmsKeyArn=kms_key_arn),
+            "Type": "KMS",
+        },
+        "Location": parse_value("${BucketName}", BucketName=bucket),
+        "Type": "S3",
     }
 
 
-def pipeline(config, role_logical_id: str) -> ResourceOutput:
-    """Generate a CodePipeline Pipeline resource"""
-    sub_config = config.get("config", {})
+def artifact_stores(config: PipelineConfig) -> Dict[str, Any]:
+    """Generate the pipeline's artifact store, or one per region if it has regional stores"""
+    primary = artifact_store(config.s3_bucket, config.kms_key_arn)
+    if not config.artifact_stores:
+        return {"ArtifactStore": primary}
 
-    sources = config.get("sources", [])
+    return {
+        "ArtifactStores": [
+            {"Region": {"Ref": "AWS::Region"}, "ArtifactStore": primary},
+            *[
+                {
+                    "Region": store.region,
+                    "ArtifactStore": artifact_store(store.s3_bucket, store.kms_key_arn),
+                }
+                for store in config.artifact_stores
+            ],
+        ]
+    }
+
+
+def pipeline(config: PipelineConfig, role_logical_id: str) -> ResourceOutput:
+    """Generate a CodePipeline Pipeline resource"""
+    sources = config.sources
     if not sources:
         raise KeyError("At least one source must be supplied")
 
-    source_names = [source["name"] for source in sources]
-    if not all(sources):
-        raise KeyError("All sources must have a name key + value")
+    source_names = [source.name for source in sources]
 
+    project_logical_ids = get_project_logical_ids(config)
     codebuild_stages = [
         {
-            "Name": stage["name"],
+            "Name": stage.name,
             "Actions": [
-                codebuild_action_definition(action, source_names)
-                for action in stage.get("actions", [])
+                codebuild_action_definition(
+                    action,
+                    source_names,
+                    project_logical_ids[action.name],
+                    config.codebuild.share_projects,
+                )
+                for action in stage.actions
             ],
         }
-        for stage in filter(
-            lambda stage: stage.get("enabled"), config.get("stages", [])
-        )
+        for stage in config.stages
+        if stage.enabled
     ]
 
     resource_properties = {
-        "ArtifactStore": {
-            "EncryptionKey": {
-                "Id": parse_value("${KmsKeyArn}", KmsKeyArn=sub_config["kms_key_arn"]),
-                "Type": "KMS",
-            },
-            "Location": parse_value(
-                "${BucketName}",
-                BucketName=sub_config["s3_bucket"],
-            ),
-            "Type": "S3",
-        },
-        "RestartExecutionOnUpdate": sub_config.get("codepipeline", {}).get(
-            "restart_execution_on_update"
-        ),
+        **artifact_stores(config),
+        "RestartExecutionOnUpdate": config.restart_execution_on_update,
         "RoleArn": {"Fn::GetAtt": [role_logical_id, "Arn"]},
         "Stages": [
             {
                 "Name": "Source",
-                "Actions": [source_action_definition(source) for source in sources],
+                "Actions": [
+                    source_action_definition(
+                        source, index == 0 and has_path_filters(config)
+                    )
+                    for index, source in enumerate(sources)
+                ],
             },
             *codebuild_stages,
         ],
     }
 
+    logical_id = f"{config.namespace}{LOGICAL_ID}"
     return ResourceOutput(
         definition={
-            LOGICAL_ID: {
+            logical_id: {
                 "Type": "AWS::CodePipeline::Pipeline",
                 "Properties": resource_properties,
             }
         },
-        logical_id=LOGICAL_ID,
+        logical_id=logical_id,
     )
 
 
 def cloudwatch_events(
-    config, cloudwatch_events_role_logical_id: str, codepipeline_logical_id: str
+    config: PipelineConfig,
+    cloudwatch_events_role_logical_id: str,
+    codepipeline_logical_id: str,
 ) -> ResourceOutput:
     """Generate a CloudWatch Event to detect source changes"""
-    sources = config.get("sources", [])
+    sources = config.sources
 
     source_pattern = re.compile(r"[\W_]+")
 
@@ -178,7 +281,9 @@ def cloudwatch_events(
             continue
 
         # Generate a CFN event
-        logical_id = f"{source_pattern.sub('', source['name'])}PushEventRule"
+        logical_id = (
+            f"{config.namespace}{source_pattern.sub('', source.name)}PushEventRule"
+        )
 
         resources[logical_id] = {
             "Type": "AWS::Events::Rule",
@@ -189,14 +294,14 @@ def cloudwatch_events(
                     "resources": [
                         parse_value(
                             "arn:aws:codecommit:${AWS::Region}:${AWS::AccountId}:${Repository}",
-                            Repository=source["repository"],
+                            Repository=source.repository,
                         )
                     ],
                     "detail": {
                         "event": ["referenceCreated", "referenceUpdated"],
                         "referenceType": ["branch"],
                         "referenceName": [
-                            parse_value("${BranchName}", BranchName=source["branch"])
+                            parse_value("${BranchName}", BranchName=source.branch)
                         ],
                     },
                 },
@@ -1,15 +1,37 @@
+import json
+import logging
+import re
 from copy import copy
-from typing import TYPE_CHECKING, Iterable, List, Optional, Set, Union
-
-from pipegen.config import FnGetAtt, FnSub, Ref, get_ecr_arn, parse_value
-
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from pipegen.config import (
+    FnGetAtt,
+    FnSub,
+    Ref,
+    get_artifact_store,
+    get_ecr_arn,
+    parse_value,
+)
+from pipegen.model import PipelineConfig
+
+from .codebuild import get_regional_project_arns, has_path_filters, regional_project_arn
 from .interfaces import ResourceOutput
+from .logs import s3_logs_value
 
 if TYPE_CHECKING:  # pragma: no cover
     from typing_extensions import TypedDict
 else:
     TypedDict = object
 
+MANAGED_POLICY_SIZE_LIMIT = 6144
+# the size assumed for each value CloudFormation substitutes into a policy, longer
+# than the ARNs and names that generated policies reference
+SUBSTITUTED_VALUE_SIZE = 128
+SUB_VARIABLE_PATTERN = re.compile(r"\$\{(?!!)[^}]*\}")
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
 S3_BUCKET_PERMISSIONS = [
     "s3:GetObject*",
     "s3:GetBucket*",
@@ -25,6 +47,19 @@ KMS_KEY_PERMISSIONS = [
     "kms:GenerateDataKey*",
     "kms:ReEncrypt*",
 ]
+ECR_PULL_PERMISSIONS = [
+    "ecr:BatchGetImage",
+    "ecr:GetDownloadUrlForLayer",
+]
+ECR_PUSH_PERMISSIONS = [
+    "ecr:BatchCheckLayerAvailability",
+    "ecr:BatchGetImage",
+    "ecr:CompleteLayerUpload",
+    "ecr:GetDownloadUrlForLayer",
+    "ecr:InitiateLayerUpload",
+    "ecr:PutImage",
+    "ecr:UploadLayerPart",
+]
 CODEPIPELINE_CODEBUILD_PERMISSIONS = [
     "codebuild:BatchGetBuilds",
     "codebuild:StartBuild",
@@ -73,6 +108,117 @@ def generate_managed_policy(resource_name: str, permissions):
     }
 
 
+def substitute_worst_case(value: Any) -> Any:
+    """Replace a value's intrinsic functions with values as long as they could resolve to"""
+    substituted = value
+    if isinstance(value, (list, tuple)):
+        substituted = [substitute_worst_case(item) for item in value]
+    elif isinstance(value, dict) and "Fn::Sub" in value:
+        template = value["Fn::Sub"]
+        substituted = SUB_VARIABLE_PATTERN.sub(
+            "x" * SUBSTITUTED_VALUE_SIZE,
+            template if isinstance(template, str) else template[0],
+        )
+    elif (
+        isinstance(value, dict)
+        and len(value) == 1
+        and any(key == "Ref" or key.startswith("Fn::") for key in value)
+    ):
+        substituted = "x" * SUBSTITUTED_VALUE_SIZE
+    elif isinstance(value, dict):
+        substituted = {key: substitute_worst_case(item) for key, item in value.items()}
+
+    return substituted
+
+
+def policy_size(permissions) -> int:
+    """Estimate a policy document's size once deployed, which IAM counts excluding whitespace"""
+    return len(
+        json.dumps(
+            {"Version": "2012-10-17", "Statement": substitute_worst_case(permissions)},
+            separators=(",", ":"),
+        )
+    )
+
+
+def merge_permissions(permissions) -> List[IAMPermissionDict]:
+    """Merge statements with identical effects and actions, deduplicating their resources"""
+    merged: Dict[str, Any] = {}
+    for permission in permissions:
+        key = json.dumps(
+            [permission.get("Effect", "Allow"), sorted(permission["Action"])]
+        )
+        statement = merged.setdefault(
+            key, {**permission, "Resource": [], "_resources": set()}
+        )
+        for resource in permission["Resource"]:
+            resource_key = json.dumps(resource, sort_keys=True)
+            if resource_key not in statement["_resources"]:
+                statement["_resources"].add(resource_key)
+                statement["Resource"].append(resource)
+
+    statements = []
+    for statement in merged.values():
+        del statement["_resources"]
+        if "*" in statement["Resource"]:
+            statement["Resource"] = ["*"]
+        statements.append(statement)
+
+    return statements
+
+
+def split_permission(permission) -> List[IAMPermissionDict]:
+    """Split a statement's resources until each statement fits in a managed policy"""
+    resources = permission["Resource"]
+    if policy_size([permission]) <= MANAGED_POLICY_SIZE_LIMIT or len(resources) < 2:
+        return [permission]
+
+    middle = len(resources) // 2
+    return [
+        *split_permission({**permission, "Resource": resources[:middle]}),
+        *split_permission({**permission, "Resource": resources[middle:]}),
+    ]
+
+
+def split_permissions(permissions) -> List[List[IAMPermissionDict]]:
+    """Pack statements into as few managed policies as fit under the size limit"""
+    policies: List[List[IAMPermissionDict]] = [[]]
+    for permission in permissions:
+        for statement in split_permission(permission):
+            if policies[-1] and (
+                policy_size([*policies[-1], statement]) > MANAGED_POLICY_SIZE_LIMIT
+            ):
+                policies.append([])
+            policies[-1].append(statement)
+
+    return policies
+
+
+def generate_managed_policies(
+    resource_name: str, permissions, compact: bool = False
+) -> Tuple[Dict[str, Any], List[str]]:
+    """Generate IAM Managed Policy resources, optionally compacted and split to fit IAM's size limit"""
+    if not compact:
+        return generate_managed_policy(resource_name, permissions), [resource_name]
+
+    policies = split_permissions(merge_permissions(permissions))
+    names = [
+        resource_name if index == 0 else f"{resource_name}{index + 1}"
+        for index in range(len(policies))
+    ]
+    message = (
+        f"{resource_name}: compacted {policy_size(permissions)} characters to "
+        f"{sum(policy_size(policy) for policy in policies)} in {len(names)} policies"
+    )
+    logger.info(message)
+
+    definition: Dict[str, Any] = {}
+    for name, policy in zip(names, policies):
+        definition.update(generate_managed_policy(name, policy))
+
+    return definition, names
+
+
 def generate_role(resource_name: str, service: str, managed_policies: List[str]):
     """Generate an IAM Role resource"""
     return {
@@ -95,21 +241,39 @@ def generate_role(resource_name: str, service: str, managed_policies: List[str])
     }
 
 
-def codepipeline_role(config, codebuild_projects: List[str]) -> ResourceOutput:
+def codebuild_project_arns(
+    config: PipelineConfig, codebuild_projects: List[str]
+) -> List[Union[str, FnSub, FnGetAtt, Ref]]:
+    """Get the ARNs of the pipeline's CodeBuild projects, as a stack-scoped wildcard if compacting"""
+    regional_arns = get_regional_project_arns(config)
+    if config.compact_policies:
+        # compacted policies name every project "${AWS::StackName}-<LogicalId>"
+        return [regional_project_arn("*", "*" if regional_arns else "${AWS::Region}")]
+
+    arns: List[Union[str, FnSub, FnGetAtt, Ref]] = [
+        {"Fn::GetAtt": [codebuild_project, "Arn"]}
+        for codebuild_project in codebuild_projects
+    ]
+    arns.extend(regional_arns)
+
+    return arns
+
+
+def codepipeline_role(
+    config: PipelineConfig, codebuild_projects: List[str]
+) -> ResourceOutput:
     """Generate a CodePipeline role + policy resources"""
-    sub_config = config.get("config", {})
+    artifact_stores = [get_artifact_store(config), *config.artifact_stores]
     permissions = [
         iam_permission(
             copy(S3_BUCKET_PERMISSIONS),
             [
-                parse_value(
+                parse_value(template, BucketName=str(store.s3_bucket))
+                for store in artifact_stores
+                for template in [
                     "arn:aws:s3:::${BucketName}",
-                    BucketName=str(sub_config["s3_bucket"]),
-                ),
-                parse_value(
                     "arn:aws:s3:::${BucketName}/*",
-                    BucketName=str(sub_config["s3_bucket"]),
-                ),
+                ]
             ],
         ),
         iam_permission(
@@ -117,39 +281,37 @@ def codepipeline_role(config, codebuild_projects: List[str]) -> ResourceOutput:
             [
                 parse_value(
                     "${KmsKeyArn}",
-                    KmsKeyArn=sub_config["kms_key_arn"],
+                    KmsKeyArn=store.kms_key_arn,
                 )
+                for store in artifact_stores
             ],
         ),
         iam_permission(
             copy(CODEPIPELINE_CODEBUILD_PERMISSIONS),
-            [
-                {"Fn::GetAtt": [codebuild_project, "Arn"]}
-                for codebuild_project in codebuild_projects
-            ],
+            codebuild_project_arns(config, codebuild_projects),
         ),
     ]
 
     # Add Source perms
     codecommit_projects: List[Union[str, FnSub, FnGetAtt, Ref]] = []
     codestar_connection_arns: Set[str] = set()
-    for source in config.get("sources", []):
-        if source["from"] == "CodeCommit":
+    for source in config.sources:
+        if source.provider == "CodeCommit":
             codecommit_projects.append(
                 parse_value(
                     "arn:aws:codecommit:${AWS::Region}:${AWS::AccountId}:${RepositoryName}",
-                    RepositoryName=source["repository"],
+                    RepositoryName=source.repository,
                 )
             )
-        elif source["from"] == "CodeStarConnection":
-            if not source.get("connection_arn"):
+        elif source.provider == "CodeStarConnection":
+            if not source.connection_arn:
                 raise RuntimeError(
-                    f"Source {source['name']} uses CodeStar Connections, but does not specify a connection_arn"
+                    f"Source {source.name} uses CodeStar Connections, but does not specify a connection_arn"
                 )
-            codestar_connection_arns.add(source.get("connection_arn"))
+            codestar_connection_arns.add(source.connection_arn)
         else:
             raise NotImplementedError(
-                f"Source type '{source['from']}' is not supported yet"
+                f"Source type '{source.provider}' is not supported yet"
             )
 
     if codecommit_projects:
@@ -181,30 +343,116 @@ def codepipeline_role(config, codebuild_projects: List[str]) -> ResourceOutput:
             )
         )
 
+    policies, policy_names = generate_managed_policies(
+        "CodePipelinePolicy", permissions, config.compact_policies
+    )
+
     return ResourceOutput(
         definition={
             **generate_role(
-                "CodePipelineRole", "codepipeline.amazonaws.com", ["CodePipelinePolicy"]
+                "CodePipelineRole", "codepipeline.amazonaws.com", policy_names
             ),
-            **generate_managed_policy("CodePipelinePolicy", permissions),
+            **policies,
         },
         logical_id="CodePipelineRole",
     )
 
 
+def ecr_permissions(config: PipelineConfig) -> List[IAMPermissionDict]:
+    """Generate ECR permissions to pull build images and push docker images"""
+    images = set()
+    docker_repositories = set()
+    for stage in config.stages:
+        for action in stage.actions:
+            images.add(action.image)
+
+            if action.docker:
+                for repository in (
+                    action.docker.repository,
+                    action.docker.cache_repository,
+                ):
+                    if repository:
+                        docker_repositories.add(repository)
+
+    permissions = []
+    image_arns = sorted(list(get_ecr_arns(list(images))))
+    docker_arns = sorted(list(get_ecr_arns(list(docker_repositories))))
+    if image_arns or docker_arns:
+        permissions.append(iam_permission(["ecr:GetAuthorizationToken"], ["*"]))
+    if image_arns:
+        permissions.append(
+            iam_permission(copy(ECR_PULL_PERMISSIONS), image_arns)  # type: ignore
+        )
+    if docker_arns:
+        permissions.append(
+            iam_permission(copy(ECR_PUSH_PERMISSIONS), docker_arns)  # type: ignore
+        )
+
+    return permissions
+
+
+def clone_ref_permissions(config: PipelineConfig) -> List[IAMPermissionDict]:
+    """Generate permissions for CodeBuild to clone the sources that it fetches itself"""
+    repositories: List[Union[str, FnSub, FnGetAtt, Ref]] = []
+    connection_arns: List[Union[str, FnSub, FnGetAtt, Ref]] = []
+    for source in config.sources:
+        if not source.clone_ref:
+            continue
+
+        if source.provider == "CodeCommit":
+            repository = parse_value(
+                "arn:aws:codecommit:${AWS::Region}:${AWS::AccountId}:${RepositoryName}",
+                RepositoryName=source.repository,
+            )
+            if repository not in repositories:
+                repositories.append(repository)
+        elif source.connection_arn:
+            connection_arn = parse_value(
+                "${ConnectionArn}", ConnectionArn=source.connection_arn
+            )
+            if connection_arn not in connection_arns:
+                connection_arns.append(connection_arn)
+
+    permissions = []
+    if repositories:
+        permissions.append(iam_permission(["codecommit:GitPull"], repositories))
+    if connection_arns:
+        permissions.append(
+            iam_permission(["codestar-connections:UseConnection"], connection_arns)
+        )
+
+    return permissions
+
+
+def s3_logs_permissions(config: PipelineConfig) -> List[IAMPermissionDict]:
+    """Generate permissions for CodeBuild to write its logs under the S3 logs prefix only"""
+    if not config.codebuild.s3_logs.enabled:
+        return []
+
+    return [
+        iam_permission(
+            ["s3:GetBucketAcl", "s3:GetBucketLocation"],
+            [s3_logs_value(config, "arn:aws:s3:::${BucketName}")],
+        ),
+        iam_permission(
+            ["s3:PutObject"],
+            [s3_logs_value(config, "arn:aws:s3:::${BucketName}/${Prefix}/*")],
+        ),
+    ]
+
+
 def codebuild_role(
-    config, log_group_logical_id: Optional[str] = None
+    config: PipelineConfig, log_group_logical_id: Optional[str] = None
 ) -> ResourceOutput:
     """Generate a CodeBuild role + policy resources"""
-    sub_config = config.get("config", {})
     permissions = []
 
     # Add CW Logs perms
-    log_group = sub_config.get("codebuild", {}).get("log_group", {})
-    if log_group.get("enabled"):
+    log_group = config.codebuild.log_group
+    if log_group.enabled:
         log_group_arn: Union[str, FnSub, Ref, FnGetAtt] = parse_value(
             "arn:aws:logs:${AWS::Region}:${AWS::AccountId}:log-group:${LogGroupName}:*",
-            LogGroupName=log_group.get("name"),
+            LogGroupName=log_group.name,
         )
         if log_group_logical_id:
             log_group_arn = {"Fn::GetAtt": [log_group_logical_id, "Arn"]}
@@ -216,21 +464,7 @@ def codebuild_role(
             )
         )
 
-    images = set()
-    for stage in config.get("stages", []):
-        for action in stage.get("actions", []):
-            images.add(action["image"])
-
-    image_arns = sorted(list(get_ecr_arns(list(images))))
-    if image_arns:
-        permissions.extend(
-            [
-                iam_permission(["ecr:GetAuthorizationToken"], ["*"]),
-                iam_permission(
-                    ["ecr:BatchGetImage", "ecr:GetDownloadUrlForLayer"], image_arns  # type: ignore
-                ),
-            ]
-        )
+    permissions.extend(ecr_permissions(config))
 
     # Add S3 and KMS perms
     permissions.extend(
@@ -240,11 +474,11 @@ def codebuild_role(
                 [
                     parse_value(
                         "arn:aws:s3:::${BucketName}",
-                        BucketName=sub_config["s3_bucket"],
+                        BucketName=config.s3_bucket,
                     ),
                     parse_value(
                         "arn:aws:s3:::${BucketName}/*",
-                        BucketName=sub_config["s3_bucket"],
+                        BucketName=config.s3_bucket,
                     ),
                 ],
             ),
@@ -253,30 +487,53 @@ def codebuild_role(
                 [
                     parse_value(
                         "${KmsKeyArn}",
-                        KmsKeyArn=sub_config["kms_key_arn"],
+                        KmsKeyArn=config.kms_key_arn,
                     )
                 ],
             ),
         ]
     )
 
+    permissions.extend(s3_logs_permissions(config))
+    permissions.extend(clone_ref_permissions(config))
+    if has_path_filters(config):
+        # the pipeline's name is generated from the stack's, and referring to the
+        # pipeline here would be circular, as it refers to the projects using this role
+        permissions.append(
+            iam_permission(
+                ["codepipeline:ListPipelineExecutions"],
+                [
+                    {
+                        "Fn::Sub": "arn:aws:codepipeline:${AWS::Region}:${AWS::AccountId}:${AWS::StackName}-*"
+                    }
+                ],
+            )
+        )
+
     # Add any additionally specified IAM perms
-    iam = sub_config.get("iam")
-    if iam:
-        permissions.extend(iam)
+    permissions.extend(
+        {
+            "Effect": statement.effect,
+            "Action": list(statement.action),
+            "Resource": list(statement.resource),
+        }
+        for statement in config.iam
+    )
+
+    policies, policy_names = generate_managed_policies(
+        "CodeBuildPolicy", permissions, config.compact_policies
+    )
 
     return ResourceOutput(
         definition={
-            **generate_role(
-                "CodeBuildRole", "codebuild.amazonaws.com", ["CodeBuildPolicy"]
-            ),
-            **generate_managed_policy("CodeBuildPolicy", permissions),
+            **generate_role("CodeBuildRole", "codebuild.amazonaws.com", policy_names),
+            **policies,
         },
         logical_id="CodeBuildRole",
     )
 
 
-def cloud_watch_event_role(codepipeline_logical_id: str) -> ResourceOutput:
+def cloud_watch_event_role(codepipeline_logical_ids: List[str]) -> ResourceOutput:
     """Generate a CloudWatch event role to kick off CodePipelines"""
     permissions = [
         iam_permission(
@@ -285,6 +542,7 @@ def cloud_watch_event_role(codepipeline_logical_id: str) -> ResourceOutput:
                 {
                     "Fn::Sub": f"arn:aws:codepipeline:${{AWS::Region}}:${{AWS::AccountId}}:${{{codepipeline_logical_id}}}"
                 }
+                for codepipeline_logical_id in codepipeline_logical_ids
             ],
         )
     ]
@@ -1,27 +1,34 @@
-from typing import Optional
+from typing import Optional, Union
 
-from pipegen.config import parse_value
+from pipegen.config import FnSub, Ref, parse_value
+from pipegen.model import PipelineConfig
 
 from .interfaces import ResourceOutput
 
 LOGICAL_ID = "LogGroup"
+# scoped to the stack, so that pipelines sharing an artifact bucket keep their logs apart
+DEFAULT_S3_LOGS_PREFIX = "${AWS::StackName}/codebuild-logs"
 
 
-def log_group(config) -> Optional[ResourceOutput]:
+def log_group(config: PipelineConfig) -> Optional[ResourceOutput]:
     """Generate a CodePipeline Pipeline resource"""
-    sub_config = config.get("config", {})
-    log_group_config = sub_config.get("codebuild", {}).get("log_group", {})
+    log_group_config = config.codebuild.log_group
 
-    if not log_group_config.get("enabled") or not log_group_config.get("create"):
+    if not log_group_config.enabled or not log_group_config.create:
         return None
 
     resource_properties = {
-        "KmsKeyId": parse_value("${KmsKeyArn}", KmsKeyArn=sub_config["kms_key_arn"]),
+        "KmsKeyId": parse_value("${KmsKeyArn}", KmsKeyArn=config.kms_key_arn),
         "LogGroupName": parse_value(
-            "${LogGroupName}", LogGroupName=log_group_config.get("name", "AWS::NoValue")
+            "${LogGroupName}", LogGroupName=log_group_config.name or "AWS::NoValue"
         ),
         "RetentionInDays": parse_value(
-            "${Retention}", Retention=log_group_config.get("retention", "AWS::NoValue")
+            "${Retention}",
+            Retention=(
+                "AWS::NoValue"
+                if log_group_config.retention is None
+                else log_group_config.retention
+            ),
         ),
     }
 
@@ -34,3 +41,19 @@ def log_group(config) -> Optional[ResourceOutput]:
         },
         logical_id=LOGICAL_ID,
     )
+
+
+def s3_logs_value(config: PipelineConfig, template: str) -> Union[str, FnSub, Ref]:
+    """Generate a value from a template of the S3 logs' ${BucketName} and ${Prefix}"""
+    s3_logs_config = config.codebuild.s3_logs
+    values = {
+        "BucketName": s3_logs_config.bucket or config.s3_bucket,
+        "Prefix": s3_logs_config.prefix,
+    }
+    if s3_logs_config.prefix is None:
+        template = template.replace("${Prefix}", DEFAULT_S3_LOGS_PREFIX)
+
+    return parse_value(
+        template,
+        **{key: value for key, value in values.items() if f"${{{key}}}" in template},
+    )
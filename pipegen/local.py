@@ -0,0 +1,225 @@
+import glob
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+
+from .generators.codebuild import output_artifact_names
+from .generators.codepipeline import sanitise_artifact_name
+from .model import Action, Artifact, PipelineConfig, Stage
+
+SOURCE_DIRECTORY_VARIABLE = "CODEBUILD_SRC_DIR"
+CONTAINER_DIRECTORY = "/codebuild/output"
+SUCCEEDED = "Succeeded"
+FAILED = "Failed"
+SKIPPED = "Skipped"
+
+
+class ActionResult(NamedTuple):
+    """The result of running an action locally"""
+
+    stage: str
+    action: str
+    status: str
+    duration: float = 0.0
+    log_path: Optional[str] = None
+
+
+class LocalRunner:
+    """Runs a pipeline's commands actions locally, as subprocesses or docker containers"""
+
+    config: PipelineConfig
+    workspace: str
+    sources: Dict[str, str]
+    docker: bool
+    jobs: Optional[int]
+
+    def __init__(
+        self,
+        config: PipelineConfig,
+        workspace: str,
+        sources: Dict[str, str],
+        docker: bool = False,
+        jobs: Optional[int] = None,
+    ):
+        if config.pipelines:
+            raise ValueError("Only configs with a single pipeline can be run locally")
+
+        missing_sources = [
+            source.name for source in config.sources if source.name not in sources
+        ]
+        if missing_sources:
+            raise ValueError(
+                f"No local directory was given for source(s) {', '.join(missing_sources)}"
+            )
+
+        self.config = config
+        self.workspace = os.path.abspath(workspace)
+        self.sources = {
+            sanitise_artifact_name(name): os.path.abspath(path)
+            for name, path in sources.items()
+        }
+        self.docker = docker
+        self.jobs = jobs
+
+    def run(self) -> List[ActionResult]:
+        """Run each enabled stage in order, until a stage has a failed action"""
+        results: List[ActionResult] = []
+        for stage in self.config.stages:
+            if not stage.enabled:
+                continue
+
+            stage_results = self.run_stage(stage)
+            results.extend(stage_results)
+            if any(result.status == FAILED for result in stage_results):
+                break
+
+        return results
+
+    def run_stage(self, stage: Stage) -> List[ActionResult]:
+        """Run a stage's actions concurrently"""
+        if not stage.actions:
+            return []
+
+        with ThreadPoolExecutor(max_workers=self.jobs or len(stage.actions)) as pool:
+            return list(
+                pool.map(lambda action: self.run_action(stage, action), stage.actions)
+            )
+
+    def artifact_path(self, name: str) -> str:
+        """Get the directory holding an action's output artifact, or a source"""
+        artifact_name = sanitise_artifact_name(name)
+        if artifact_name in self.sources:
+            return self.sources[artifact_name]
+
+        return os.path.join(self.workspace, "artifacts", artifact_name)
+
+    def input_artifacts(self, action: Action) -> Dict[str, str]:
+        """Get the directories of an action's secondary sources and input artifacts, by name"""
+        names = [source.name for source in self.config.sources[1:]]
+        names.extend(action.input_artifacts)
+
+        return {
+            sanitise_artifact_name(name): self.artifact_path(name) for name in names
+        }
+
+    def run_action(self, stage: Stage, action: Action) -> ActionResult:
+        """Run an action's build commands in a copy of the primary source"""
+        if not action.commands:
+            return ActionResult(stage.name, action.name, SKIPPED)
+
+        build_path = os.path.join(
+            self.workspace, "builds", sanitise_artifact_name(action.name)
+        )
+        log_path = os.path.join(
+            self.workspace, "logs", f"{sanitise_artifact_name(action.name)}.log"
+        )
+        shutil.rmtree(build_path, ignore_errors=True)
+        shutil.copytree(
+            self.artifact_path(self.config.sources[0].name),
+            build_path,
+            symlinks=True,
+            ignore=self.ignore_paths,
+        )
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+
+        started = time.monotonic()
+        with open(log_path, "w", encoding="utf-8") as log_file:
+            returncode = subprocess.call(
+                self.command(action, build_path),
+                cwd=build_path,
+                env={**os.environ, **self.environment(action, build_path)},
+                stdout=log_file,
+                stderr=subprocess.STDOUT,
+            )
+        duration = time.monotonic() - started
+
+        if returncode:
+            return ActionResult(stage.name, action.name, FAILED, duration, log_path)
+
+        self.collect_artifacts(action, build_path)
+        return ActionResult(stage.name, action.name, SUCCEEDED, duration, log_path)
+
+    def ignore_paths(self, path: str, names: List[str]) -> List[str]:
+        """Ignore the .git directory, as CodeBuild does, and the workspace when it's in the source"""
+        return [
+            name
+            for name in names
+            if name == ".git" or os.path.join(path, name) == self.workspace
+        ]
+
+    def environment(self, action: Action, build_path: str) -> Dict[str, str]:
+        """Get an action's environment variables, with CodeBuild's source directories"""
+        environment = dict(action.environment)
+        environment[SOURCE_DIRECTORY_VARIABLE] = build_path
+        for name, path in self.input_artifacts(action).items():
+            environment[f"{SOURCE_DIRECTORY_VARIABLE}_{name}"] = path
+
+        if not self.docker:
+            return environment
+
+        # directories are mounted into the container, under CodeBuild's paths
+        environment[SOURCE_DIRECTORY_VARIABLE] = f"{CONTAINER_DIRECTORY}/src"
+        for name in self.input_artifacts(action):
+            environment[f"{SOURCE_DIRECTORY_VARIABLE}_{name}"] = (
+                f"{CONTAINER_DIRECTORY}/{name}"
+            )
+
+        return environment
+
+    def command(self, action: Action, build_path: str) -> List[str]:
+        """Get the command that runs an action's build commands"""
+        shell = ["sh", "-e", "-c", "\n".join(action.commands)]
+        if not self.docker:
+            return shell
+
+        command = ["docker", "run", "--rm", "--workdir", f"{CONTAINER_DIRECTORY}/src"]
+        command.extend(["--volume", f"{build_path}:{CONTAINER_DIRECTORY}/src"])
+        for name, path in self.input_artifacts(action).items():
+            command.extend(["--volume", f"{path}:{CONTAINER_DIRECTORY}/{name}:ro"])
+        for key, value in self.environment(action, build_path).items():
+            command.extend(["--env", f"{key}={value}"])
+
+        return [*command, action.image, *shell]
+
+    def collect_artifacts(self, action: Action, build_path: str):
+        """Copy the files matching each of an action's artifacts into its output artifacts"""
+        artifacts = [
+            artifact
+            for artifact in (action.artifacts, *action.secondary_artifacts)
+            if artifact
+        ]
+        for name, artifact in zip(
+            output_artifact_names(action), artifacts or [Artifact()]
+        ):
+            self.collect_artifact(name, artifact, build_path)
+
+    def collect_artifact(self, name: str, artifact: Artifact, build_path: str):
+        """Copy the files matching an artifact into it, packaged as CodeBuild would"""
+        artifact_path = self.artifact_path(name)
+        shutil.rmtree(artifact_path, ignore_errors=True)
+        os.makedirs(artifact_path)
+
+        base_path = os.path.join(build_path, artifact.base_directory or "")
+        excluded = {
+            path
+            for pattern in artifact.exclude_paths
+            for path in glob.glob(os.path.join(base_path, pattern), recursive=True)
+        }
+        for pattern in artifact.files:
+            for path in glob.glob(os.path.join(base_path, pattern), recursive=True):
+                if not os.path.isfile(path) or path in excluded:
+                    continue
+
+                destination = os.path.join(
+                    artifact_path,
+                    (
+                        os.path.basename(path)
+                        if artifact.discard_paths
+                        else os.path.relpath(path, base_path)
+                    ),
+                )
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                shutil.copy2(path, destination)
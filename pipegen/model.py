@@ -0,0 +1,332 @@
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from .schema import (
+    CODEBUILD_DEFAULTS,
+    CODEPIPELINE_DEFAULTS,
+    DOCKER_DEFAULTS,
+    SOURCE_DEFAULTS,
+)
+
+
+class LogGroupConfig(NamedTuple):
+    """The CloudWatch log group that CodeBuild projects log to"""
+
+    enabled: bool = CODEBUILD_DEFAULTS["log_group"]["enabled"]
+    create: bool = CODEBUILD_DEFAULTS["log_group"]["create"]
+    name: Optional[str] = None
+    retention: Optional[int] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LogGroupConfig":
+        """Build a log group config from parsed config data"""
+        return cls(
+            enabled=data["enabled"],
+            create=data["create"],
+            name=data.get("name"),
+            retention=data.get("retention"),
+        )
+
+
+class S3LogsConfig(NamedTuple):
+    """The S3 bucket and prefix that CodeBuild projects write their logs to"""
+
+    enabled: bool = CODEBUILD_DEFAULTS["s3_logs"]["enabled"]
+    # defaults to the artifact bucket
+    bucket: Optional[str] = None
+    # defaults to ${AWS::StackName}/codebuild-logs
+    prefix: Optional[str] = None
+    encrypted: bool = CODEBUILD_DEFAULTS["s3_logs"]["encrypted"]
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "S3LogsConfig":
+        """Build an S3 logs config from parsed config data"""
+        return cls(
+            enabled=data["enabled"],
+            bucket=data.get("bucket"),
+            prefix=data.get("prefix"),
+            encrypted=data["encrypted"],
+        )
+
+
+class CodeBuildConfig(NamedTuple):
+    """Defaults and settings shared by every CodeBuild project"""
+
+    compute_type: str = CODEBUILD_DEFAULTS["compute_type"]
+    image: str = CODEBUILD_DEFAULTS["image"]
+    log_group: LogGroupConfig = LogGroupConfig()
+    share_projects: bool = CODEBUILD_DEFAULTS["share_projects"]
+    concurrent_build_limit: Optional[int] = None
+    queued_timeout: Optional[int] = None
+    weight: int = CODEBUILD_DEFAULTS["weight"]
+    s3_logs: S3LogsConfig = S3LogsConfig()
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CodeBuildConfig":
+        """Build a CodeBuild config from parsed config data"""
+        return cls(
+            compute_type=data["compute_type"],
+            image=data["image"],
+            log_group=LogGroupConfig.from_dict(data["log_group"]),
+            share_projects=data["share_projects"],
+            concurrent_build_limit=data.get("concurrent_build_limit"),
+            queued_timeout=data.get("queued_timeout"),
+            weight=data["weight"],
+            s3_logs=S3LogsConfig.from_dict(data["s3_logs"]),
+        )
+
+
+class ArtifactStore(NamedTuple):
+    """An S3 bucket and KMS key that stores artifacts, in the pipeline's or another region"""
+
+    s3_bucket: str
+    kms_key_arn: str
+    region: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ArtifactStore":
+        """Build an artifact store from parsed config data"""
+        return cls(
+            s3_bucket=data["s3_bucket"],
+            kms_key_arn=data["kms_key_arn"],
+            region=data.get("region"),
+        )
+
+
+class PolicyStatement(NamedTuple):
+    """An additional IAM statement granted to CodeBuild"""
+
+    action: Tuple[str, ...]
+    resource: Tuple[str, ...]
+    effect: str = "Allow"
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PolicyStatement":
+        """Build an IAM statement from parsed config data"""
+        return cls(
+            action=tuple(data["Action"]),
+            resource=tuple(data["Resource"]),
+            effect=data["Effect"],
+        )
+
+
+class DockerConfig(NamedTuple):
+    """The docker image an action builds"""
+
+    privileged: bool = DOCKER_DEFAULTS["privileged"]
+    repository: Optional[str] = None
+    cache_repository: Optional[str] = None
+    cache_tag: str = DOCKER_DEFAULTS["cache_tag"]
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DockerConfig":
+        """Build a docker config from parsed config data"""
+        return cls(
+            privileged=data["privileged"],
+            repository=data.get("repository"),
+            cache_repository=data.get("cache_repository"),
+            cache_tag=data["cache_tag"],
+        )
+
+
+class Source(NamedTuple):
+    """A repository and branch that the pipeline builds"""
+
+    name: str
+    provider: str
+    repository: str
+    branch: str
+    poll_for_source_changes: bool = False
+    event_for_source_changes: bool = True
+    connection_arn: Optional[str] = None
+    # CODEBUILD_CLONE_REF has CodeBuild clone the repository, rather than unzip an artifact
+    output_artifact_format: Optional[str] = None
+    git_clone_depth: int = SOURCE_DEFAULTS["git_clone_depth"]
+    fetch_submodules: bool = SOURCE_DEFAULTS["fetch_submodules"]
+
+    @property
+    def clone_ref(self) -> bool:
+        """Whether CodeBuild clones the source's repository itself"""
+        return self.output_artifact_format == "CODEBUILD_CLONE_REF"
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Source":
+        """Build a source from parsed config data"""
+        return cls(
+            name=data["name"],
+            provider=data["from"],
+            repository=data["repository"],
+            branch=data["branch"],
+            poll_for_source_changes=data["poll_for_source_changes"],
+            event_for_source_changes=data["event_for_source_changes"],
+            connection_arn=data.get("connection_arn"),
+            output_artifact_format=data.get("output_artifact_format"),
+            git_clone_depth=data["git_clone_depth"],
+            fetch_submodules=data["fetch_submodules"],
+        )
+
+
+class Artifact(NamedTuple):
+    """An action's output artifact, and how CodeBuild packages its files"""
+
+    files: Tuple[str, ...] = ()
+    # secondary artifacts are named, so that input_artifacts can refer to them
+    name: Optional[str] = None
+    # the directory that files and exclude_paths are relative to
+    base_directory: Optional[str] = None
+    # whether files are packaged without their directories
+    discard_paths: bool = False
+    exclude_paths: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_dict(cls, data: Union[List[str], Dict[str, Any]]) -> "Artifact":
+        """Build an artifact from parsed config data, or a list of its files"""
+        if isinstance(data, list):
+            return cls(files=tuple(data))
+
+        return cls(
+            files=tuple(data["files"]),
+            name=data.get("name"),
+            base_directory=data.get("base_directory"),
+            discard_paths=data.get("discard_paths", False),
+            exclude_paths=tuple(data.get("exclude_paths", ())),
+        )
+
+
+class Action(NamedTuple):
+    """A CodeBuild action within a stage"""
+
+    name: str
+    compute_type: str = CODEBUILD_DEFAULTS["compute_type"]
+    image: str = CODEBUILD_DEFAULTS["image"]
+    category: str = "Build"
+    provider: str = "CodeBuild"
+    buildspec: Optional[str] = None
+    commands: Tuple[str, ...] = ()
+    artifacts: Optional[Artifact] = None
+    secondary_artifacts: Tuple[Artifact, ...] = ()
+    # (name, value) pairs, in the order they were configured
+    environment: Tuple[Tuple[str, str], ...] = ()
+    input_artifacts: Tuple[str, ...] = ()
+    docker: Optional[DockerConfig] = None
+    region: Optional[str] = None
+    concurrent_build_limit: Optional[int] = None
+    # minutes a build can wait in the queue before CodeBuild times it out
+    queued_timeout: Optional[int] = None
+    # the action's share of the account's builds, when budgeting a fleet of configs
+    weight: int = CODEBUILD_DEFAULTS["weight"]
+    # globs of the primary source's files that the action builds, when it skips other changes
+    paths: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Action":
+        """Build an action from parsed config data"""
+        docker = data.get("docker")
+        artifacts = data.get("artifacts")
+
+        return cls(
+            name=data["name"],
+            compute_type=data["compute_type"],
+            image=data["image"],
+            category=data["category"],
+            provider=data["provider"],
+            buildspec=data.get("buildspec"),
+            commands=tuple(data.get("commands", ())),
+            artifacts=Artifact.from_dict(artifacts) if artifacts else None,
+            secondary_artifacts=tuple(
+                Artifact.from_dict(artifact)
+                for artifact in data.get("secondary_artifacts", ())
+            ),
+            environment=tuple(data["environment"].items()),
+            input_artifacts=tuple(data["input_artifacts"]),
+            docker=DockerConfig.from_dict(docker) if docker else None,
+            region=data.get("region"),
+            concurrent_build_limit=data.get("concurrent_build_limit"),
+            queued_timeout=data.get("queued_timeout"),
+            weight=data["weight"],
+            paths=tuple(data.get("paths", ())),
+        )
+
+
+class Stage(NamedTuple):
+    """A pipeline stage and its actions"""
+
+    name: str
+    actions: Tuple[Action, ...] = ()
+    enabled: bool = True
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Stage":
+        """Build a stage from parsed config data"""
+        return cls(
+            name=data["name"],
+            actions=tuple(Action.from_dict(action) for action in data["actions"]),
+            enabled=data["enabled"],
+        )
+
+
+class Pipeline(NamedTuple):
+    """One of a config's pipelines, generated into the same stack as the others"""
+
+    name: str
+    sources: Tuple[Source, ...] = ()
+    stages: Tuple[Stage, ...] = ()
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Pipeline":
+        """Build a pipeline from parsed config data"""
+        return cls(
+            name=data["name"],
+            sources=tuple(Source.from_dict(source) for source in data["sources"]),
+            stages=tuple(Stage.from_dict(stage) for stage in data["stages"]),
+        )
+
+
+class PipelineConfig(NamedTuple):
+    """A pipeline's sources, stages and settings"""
+
+    s3_bucket: str
+    kms_key_arn: str
+    sources: Tuple[Source, ...] = ()
+    stages: Tuple[Stage, ...] = ()
+    restart_execution_on_update: bool = CODEPIPELINE_DEFAULTS[
+        "restart_execution_on_update"
+    ]
+    codebuild: CodeBuildConfig = CodeBuildConfig()
+    compact_policies: bool = False
+    artifact_stores: Tuple[ArtifactStore, ...] = ()
+    iam: Tuple[PolicyStatement, ...] = ()
+    # several pipelines, instead of sources and stages, that share roles and logs
+    pipelines: Tuple[Pipeline, ...] = ()
+    # the prefix of logical IDs, when generating one of several pipelines
+    namespace: str = ""
+    # the names of the parameterised vars the config was rendered with
+    parameters: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PipelineConfig":
+        """Build a pipeline config from parsed config data"""
+        sub_config = data["config"]
+
+        return cls(
+            s3_bucket=sub_config["s3_bucket"],
+            kms_key_arn=sub_config["kms_key_arn"],
+            sources=tuple(
+                Source.from_dict(source) for source in data.get("sources", ())
+            ),
+            stages=tuple(Stage.from_dict(stage) for stage in data.get("stages", ())),
+            restart_execution_on_update=sub_config["codepipeline"][
+                "restart_execution_on_update"
+            ],
+            codebuild=CodeBuildConfig.from_dict(sub_config["codebuild"]),
+            compact_policies=sub_config["compact_policies"],
+            artifact_stores=tuple(
+                ArtifactStore.from_dict(store)
+                for store in sub_config["artifact_stores"]
+            ),
+            iam=tuple(
+                PolicyStatement.from_dict(statement) for statement in sub_config["iam"]
+            ),
+            pipelines=tuple(
+                Pipeline.from_dict(pipeline) for pipeline in data.get("pipelines", ())
+            ),
+        )
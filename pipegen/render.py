@@ -0,0 +1,181 @@
+import hashlib
+import os
+import stat
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from io import StringIO
+from typing import IO, Dict, Iterable, List, NamedTuple, Optional
+
+from strictyaml.ruamel import YAML
+
+from .concurrency import apply_limits
+from .config import check_parameters, config_search_path, parameter_vars, parse_config
+from .generators import generate_parameters, iter_resources
+from .validate import VALIDATION_ERRORS, format_error
+
+HASH_CHUNK_SIZE = 65536
+
+
+class RenderResult(NamedTuple):
+    """The result of rendering a config file's template"""
+
+    path: str
+    output_path: str
+    changed: bool = False
+    error: Optional[str] = None
+
+
+class HashingWriter:
+    """Writes to a file while hashing what was written"""
+
+    def __init__(self, output: IO[str]):
+        self.output = output
+        self.hash = hashlib.sha256()
+
+    def write(self, data: str):
+        """Write and hash data"""
+        self.hash.update(data.encode("utf-8"))
+        self.output.write(data)
+
+
+def create_yaml() -> YAML:
+    """Create a YAML dumper with pipegen's formatting"""
+    yaml = YAML()
+    yaml.indent(sequence=4, offset=2)
+    return yaml
+
+
+def dump_yaml(template, output=sys.stdout):
+    """Dumps YAML out to output file"""
+    create_yaml().dump(template, output)
+
+
+def stream_template(
+    resources: Iterable[Dict],
+    output,
+    parameters: Optional[Dict] = None,
+):
+    """Write a template's resources to output as each one is generated"""
+    yaml = create_yaml()
+    if parameters:
+        yaml.dump({"Parameters": parameters}, output)
+
+    output.write("Resources:\n")
+    for definition in resources:
+        check_parameters(definition, parameters or {})
+        # dump within the Resources key, so that indentation and line folding
+        # match dumping the whole template at once
+        buffer = StringIO()
+        yaml.dump({"Resources": definition}, buffer)
+        output.write(buffer.getvalue().split("\n", 1)[1])
+
+
+def file_hash(path: str) -> Optional[str]:
+    """Hash a file's contents, or None if it doesn't exist"""
+    if not os.path.exists(path):
+        return None
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as existing_file:
+        for chunk in iter(lambda: existing_file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def file_mode(path: str) -> int:
+    """Get a file's permissions, or the umask's default permissions if it doesn't exist"""
+    if os.path.exists(path):
+        return stat.S_IMODE(os.stat(path).st_mode)
+
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def output_path(path: str, out_dir: str) -> str:
+    """Get the path a config's template is rendered to"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(out_dir, f"{name}.yml")
+
+
+def render_file(
+    path: str,
+    out_dir: str,
+    config_vars: Dict[str, str],
+    **options,
+) -> RenderResult:
+    """Render a config's template into out_dir, only replacing the file if its content changed"""
+    parameter_names: Iterable[str] = options.get("parameter_names", ())
+    region: Optional[str] = options.get("region")
+    template_path = output_path(path, out_dir)
+    parameters = generate_parameters(parameter_names, config_vars)
+
+    temporary_path = None
+    try:
+        with open(path, encoding="utf-8") as config_file:
+            config = parse_config(
+                config_file.read(),
+                {**config_vars, **parameter_vars(parameter_names)},
+                label=path,
+                search_path=config_search_path(path),
+            )
+        config = config._replace(parameters=tuple(parameter_names))
+        if options.get("concurrency_limits", {}).get(path):
+            config = apply_limits(config, options["concurrency_limits"][path])
+
+        with tempfile.NamedTemporaryFile(
+            "w", dir=out_dir, suffix=".tmp", delete=False, encoding="utf-8"
+        ) as temporary_file:
+            temporary_path = temporary_file.name
+            writer = HashingWriter(temporary_file)
+            stream_template(iter_resources(config, region), writer, parameters)
+
+        changed = writer.hash.hexdigest() != file_hash(template_path)
+        if changed:
+            # temporary files are only readable by their owner
+            os.chmod(temporary_path, file_mode(template_path))
+            os.replace(temporary_path, template_path)
+            temporary_path = None
+    except VALIDATION_ERRORS as error:
+        return RenderResult(path, template_path, error=format_error(path, error))
+    finally:
+        if temporary_path:
+            os.remove(temporary_path)
+
+    return RenderResult(path, template_path, changed=changed)
+
+
+def render_files(
+    paths: List[str],
+    out_dir: str,
+    config_vars: Dict[str, str],
+    jobs: Optional[int] = None,
+    **options,
+) -> List[RenderResult]:
+    """Render config files' templates into out_dir across a process pool"""
+    template_paths = [output_path(path, out_dir) for path in paths]
+    duplicates = {path for path in template_paths if template_paths.count(path) > 1}
+    if duplicates:
+        raise ValueError(
+            f"Multiple configs would render to {', '.join(sorted(duplicates))}"
+        )
+
+    os.makedirs(out_dir, exist_ok=True)
+    render = partial(
+        render_file,
+        out_dir=out_dir,
+        config_vars=config_vars,
+        parameter_names=options.get("parameter_names", ()),
+        region=options.get("region"),
+        concurrency_limits=options.get("concurrency_limits", {}),
+    )
+    jobs = min(jobs or os.cpu_count() or 1, len(paths) or 1)
+    if jobs == 1:
+        return [render(path) for path in paths]
+
+    chunksize = max(1, len(paths) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(render, paths, chunksize=chunksize))
@@ -7,6 +7,7 @@ from strictyaml import (
     EmptyDict,
     EmptyList,
     Enum,
+    FixedSeq,
     Int,
     Map,
     MapPattern,
@@ -14,6 +15,7 @@ from strictyaml import (
     Seq,
     Str,
 )
+from strictyaml.validators import Validator
 
 CODEPIPELINE_DEFAULTS: Dict = {
     "restart_execution_on_update": False,
@@ -22,7 +24,29 @@ CODEBUILD_DEFAULTS: Dict = {
     "compute_type": "BUILD_GENERAL1_SMALL",
     "image": "aws/codebuild/amazonlinux2-x86_64-standard:3.0",
     "log_group": {"enabled": True, "create": True},
+    "share_projects": False,
+    "weight": 1,
+    "s3_logs": {"enabled": False, "encrypted": True},
 }
+# the config.codebuild keys that are defaults for each action's key of the same name
+ACTION_DEFAULT_KEYS = (
+    "compute_type",
+    "image",
+    "concurrent_build_limit",
+    "queued_timeout",
+    "weight",
+)
+DOCKER_DEFAULTS: Dict = {
+    "privileged": True,
+    "cache_tag": "cache",
+}
+SOURCE_DEFAULTS: Dict = {
+    "git_clone_depth": 1,
+    "fetch_submodules": False,
+}
+OUTPUT_ARTIFACT_FORMATS = ["CODE_ZIP", "CODEBUILD_CLONE_REF"]
+# the minutes CodeBuild allows a build to queue for
+QUEUED_TIMEOUT_RANGE = (5, 480)
 
 
 class UniqueStr(Str):
@@ -39,17 +63,190 @@ class UniqueStr(Str):
         return super().validate_scalar(chunk)
 
 
-def generate_schema(
+class BoundedInt(Int):
+    """Ensure that an integer is within an inclusive range"""
+
+    def __init__(self, minimum: int, maximum: OptionalType[int] = None):
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @property
+    def bounds_description(self) -> str:
+        """Describe the range of valid integers"""
+        if self.maximum is None:
+            return f"an integer of at least {self.minimum}"
+
+        return f"an integer from {self.minimum} to {self.maximum}"
+
+    def in_bounds(self, value: int) -> bool:
+        """Check if an integer is within the range"""
+        return value >= self.minimum and (self.maximum is None or value <= self.maximum)
+
+    def validate_scalar(self, chunk):
+        value = super().validate_scalar(chunk)
+        if not self.in_bounds(value):
+            chunk.expecting_but_found(f"when expecting {self.bounds_description}")
+
+        return value
+
+
+def pipeline_validators(
     stage_actions: OptionalType[List[str]] = None,
-    default_compute_type: OptionalType[str] = None,
-    default_image: OptionalType[str] = None,
-    log_group_config: OptionalType[Dict] = None,
-) -> Map:
-    """Generate a schema"""
+    action_defaults: OptionalType[Dict] = None,
+    artifact_regions: OptionalType[List[str]] = None,
+    unique_names: bool = True,
+) -> Dict:
+    """Generate the validators of a pipeline's sources and stages"""
+    action_defaults = action_defaults or {}
+    name_validator = UniqueStr if unique_names else Str
     input_artifact_validator = Str()
     if stage_actions:
         input_artifact_validator = Enum(stage_actions)
 
+    region_validator = Str()
+    if artifact_regions is not None:
+        region_validator = Enum(artifact_regions)
+
+    docker_validator = Map(
+        {
+            Optional("privileged", default=DOCKER_DEFAULTS["privileged"]): Bool(),
+            Optional("repository"): Str(),
+            Optional("cache_repository"): Str(),
+            Optional("cache_tag", default=DOCKER_DEFAULTS["cache_tag"]): Str(),
+        }
+    )
+
+    # action names and secondary artifact names are both output artifact names
+    artifact_name_validator = name_validator()
+    artifact_options = {
+        Optional("base_directory"): Str(),
+        Optional("discard_paths"): Bool(),
+        Optional("exclude_paths"): Seq(Str()),
+    }
+
+    return {
+        "sources": Seq(
+            Map(
+                {
+                    "name": name_validator(),
+                    "from": Enum(["CodeCommit", "CodeStarConnection"]),
+                    "repository": Str(),
+                    "branch": Str(),
+                    Optional("poll_for_source_changes", default=False): Bool(),
+                    Optional("event_for_source_changes", default=True): Bool(),
+                    Optional("connection_arn"): Str(),
+                    Optional("output_artifact_format"): Enum(OUTPUT_ARTIFACT_FORMATS),
+                    Optional(
+                        "git_clone_depth",
+                        default=SOURCE_DEFAULTS["git_clone_depth"],
+                    ): Int(),
+                    Optional(
+                        "fetch_submodules",
+                        default=SOURCE_DEFAULTS["fetch_submodules"],
+                    ): Bool(),
+                }
+            )
+        ),
+        "stages": Seq(
+            Map(
+                {
+                    "name": name_validator(),
+                    Optional("enabled", default=True): Bool(),
+                    "actions": Seq(
+                        Map(
+                            {
+                                "name": artifact_name_validator,
+                                Optional("category", default="Build"): Enum(
+                                    ["Build", "Test", "Deploy"]
+                                ),
+                                Optional("provider", default="CodeBuild"): Enum(
+                                    ["CodeBuild"]
+                                ),
+                                Optional("buildspec"): Str(),
+                                Optional("commands"): Seq(Str()),
+                                Optional("artifacts"): Seq(Str())
+                                | Map({"files": Seq(Str()), **artifact_options}),
+                                Optional("secondary_artifacts"): Seq(
+                                    Map(
+                                        {
+                                            "name": artifact_name_validator,
+                                            "files": Seq(Str()),
+                                            **artifact_options,
+                                        }
+                                    )
+                                ),
+                                Optional("paths"): Seq(Str()),
+                                Optional(
+                                    "compute_type",
+                                    default=action_defaults.get("compute_type"),
+                                ): Str(),
+                                Optional(
+                                    "image", default=action_defaults.get("image")
+                                ): Str(),
+                                Optional(
+                                    "concurrent_build_limit",
+                                    default=action_defaults.get(
+                                        "concurrent_build_limit"
+                                    ),
+                                ): BoundedInt(1),
+                                Optional(
+                                    "queued_timeout",
+                                    default=action_defaults.get("queued_timeout"),
+                                ): BoundedInt(*QUEUED_TIMEOUT_RANGE),
+                                Optional(
+                                    "weight", default=action_defaults.get("weight")
+                                ): BoundedInt(1),
+                                Optional("environment", default={}): EmptyDict()
+                                | MapPattern(Str(), Str()),
+                                Optional("input_artifacts", default=[]): EmptyList()
+                                | Seq(input_artifact_validator),
+                                Optional("docker"): docker_validator,
+                                Optional("region"): region_validator,
+                            }
+                        )
+                    ),
+                }
+            )
+        ),
+    }
+
+
+def generate_schema(
+    stage_actions: OptionalType[List[str]] = None,
+    action_defaults: OptionalType[Dict] = None,
+    log_group_config: OptionalType[Dict] = None,
+    artifact_regions: OptionalType[List[str]] = None,
+    pipeline_artifacts: OptionalType[List[List[str]]] = None,
+) -> Map:
+    """Generate a schema"""
+    action_defaults = action_defaults or {}
+    pipeline = pipeline_validators(stage_actions, action_defaults, artifact_regions)
+    if pipeline_artifacts is None:
+        # names are checked for duplicates within each pipeline when revalidating
+        pipelines_validator: Validator = Seq(
+            Map(
+                {
+                    "name": UniqueStr(),
+                    **pipeline_validators(
+                        None, action_defaults, artifact_regions, unique_names=False
+                    ),
+                }
+            )
+        )
+    else:
+        pipelines_validator = FixedSeq(
+            [
+                Map(
+                    {
+                        "name": UniqueStr(),
+                        **pipeline_validators(
+                            artifact_names, action_defaults, artifact_regions
+                        ),
+                    }
+                )
+                for artifact_names in pipeline_artifacts
+            ]
+        )
     name_validation_key = Optional("name")
     if (
         log_group_config
@@ -74,6 +271,9 @@ def generate_schema(
 
     return Map(
         {
+            Optional("sources"): pipeline["sources"],
+            Optional("stages"): pipeline["stages"],
+            Optional("pipelines"): pipelines_validator,
             "config": Map(
                 {
                     "s3_bucket": Str(),
@@ -105,8 +305,52 @@ def generate_schema(
                                 "log_group",
                                 default=CODEBUILD_DEFAULTS["log_group"],
                             ): Map(log_group_validator),
+                            Optional(
+                                "share_projects",
+                                default=CODEBUILD_DEFAULTS["share_projects"],
+                            ): Bool(),
+                            Optional(
+                                "s3_logs",
+                                default=CODEBUILD_DEFAULTS["s3_logs"],
+                            ): Map(
+                                {
+                                    Optional(
+                                        "enabled",
+                                        default=CODEBUILD_DEFAULTS["s3_logs"][
+                                            "enabled"
+                                        ],
+                                    ): Bool(),
+                                    Optional("bucket"): Str(),
+                                    Optional("prefix"): Str(),
+                                    Optional(
+                                        "encrypted",
+                                        default=CODEBUILD_DEFAULTS["s3_logs"][
+                                            "encrypted"
+                                        ],
+                                    ): Bool(),
+                                }
+                            ),
+                            Optional("concurrent_build_limit"): BoundedInt(1),
+                            Optional("queued_timeout"): BoundedInt(
+                                *QUEUED_TIMEOUT_RANGE
+                            ),
+                            Optional(
+                                "weight",
+                                default=CODEBUILD_DEFAULTS["weight"],
+                            ): BoundedInt(1),
                         }
                     ),
+                    Optional("compact_policies", default=False): Bool(),
+                    Optional("artifact_stores", default=[]): EmptyList()
+                    | Seq(
+                        Map(
+                            {
+                                "region": UniqueStr(),
+                                "s3_bucket": Str(),
+                                "kms_key_arn": Str(),
+                            }
+                        )
+                    ),
                     Optional("iam", default=[]): EmptyList()
                     | Seq(
                         Map(
@@ -121,51 +365,5 @@ def generate_schema(
                     ),
                 }
             ),
-            "sources": Seq(
-                Map(
-                    {
-                        "name": UniqueStr(),
-                        "from": Enum(["CodeCommit", "CodeStarConnection"]),
-                        "repository": Str(),
-                        "branch": Str(),
-                        Optional("poll_for_source_changes", default=False): Bool(),
-                        Optional("event_for_source_changes", default=True): Bool(),
-                        Optional("connection_arn"): Str(),
-                    }
-                )
-            ),
-            "stages": Seq(
-                Map(
-                    {
-                        "name": UniqueStr(),
-                        Optional("enabled", default=True): Bool(),
-                        "actions": Seq(
-                            Map(
-                                {
-                                    "name": UniqueStr(),
-                                    Optional("category", default="Build"): Enum(
-                                        ["Build", "Test", "Deploy"]
-                                    ),
-                                    Optional("provider", default="CodeBuild"): Enum(
-                                        ["CodeBuild"]
-                                    ),
-                                    Optional("buildspec"): Str(),
-                                    Optional("commands"): Seq(Str()),
-                                    Optional("artifacts"): Seq(Str()),
-                                    Optional(
-                                        "compute_type",
-                                        default=default_compute_type,
-                                    ): Str(),
-                                    Optional("image", default=default_image): Str(),
-                                    Optional("environment", default={}): EmptyDict()
-                                    | MapPattern(Str(), Str()),
-                                    Optional("input_artifacts", default=[]): EmptyList()
-                                    | Seq(input_artifact_validator),
-                                }
-                            )
-                        ),
-                    }
-                )
-            ),
         }
     )
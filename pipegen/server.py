@@ -0,0 +1,264 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from jinja2 import TemplateSyntaxError
+from strictyaml.ruamel.error import MarkedYAMLError
+
+from .config import (
+    PARAMETER_NAME_PATTERN,
+    compile_config,
+    config_search_path,
+    parameter_vars,
+    parse_config,
+    parse_config_data,
+)
+from .executions import percentile
+from .fast_yaml import ConfigValidationError
+from .generators import generate_template
+from .render import dump_yaml
+from .validate import VALIDATION_ERRORS, format_error
+
+RESPONSE_CACHE_SIZE = 256
+LATENCY_SAMPLES = 1024
+MAX_REQUEST_SIZE = 10 * 1024 * 1024
+LABEL = "<request>"
+# configs loading fragments from disk can render differently for the same request
+INCLUDE_PATTERN = re.compile(r"{%-?\s*(?:include|import|from|extends)\s")
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def log(message: str):
+    """Logs a general message"""
+    logger.info(message)
+
+
+class RequestError(Exception):
+    """A request that can't be handled, and the status to respond with"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class Metrics:
+    """Counts requests and errors, and keeps recent latencies, by path"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.latencies: Dict[str, Deque[float]] = {}
+
+    def record(self, path: str, milliseconds: float, error: bool = False):
+        """Record a request's latency, and whether it failed"""
+        with self.lock:
+            self.counts[path] = self.counts.get(path, 0) + 1
+            self.errors[path] = self.errors.get(path, 0) + int(error)
+            self.latencies.setdefault(path, deque(maxlen=LATENCY_SAMPLES)).append(
+                milliseconds
+            )
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Get each path's request and error counts, and p50/p95/max latency in milliseconds"""
+        with self.lock:
+            paths = {
+                path: {
+                    "requests": self.counts[path],
+                    "errors": self.errors[path],
+                    "p50_ms": round(percentile(list(latencies), 50), 3),
+                    "p95_ms": round(percentile(list(latencies), 95), 3),
+                    "max_ms": round(max(latencies), 3),
+                }
+                for path, latencies in self.latencies.items()
+            }
+
+        return {
+            "paths": paths,
+            # pylint: disable-next=no-value-for-parameter
+            "response_cache": render.cache_info()._asdict(),
+            "template_cache": compile_config.cache_info()._asdict(),
+        }
+
+
+def error_location(error: Exception) -> Tuple[Optional[int], Optional[int]]:
+    """Get the 1-based line and column that caused a config error, where known"""
+    location: Tuple[Optional[int], Optional[int]] = (None, None)
+    if isinstance(error, ConfigValidationError):
+        location = (error.line, error.column)
+    elif isinstance(error, TemplateSyntaxError):
+        location = (error.lineno, None)
+    elif isinstance(error, MarkedYAMLError) and error.problem_mark:
+        location = (error.problem_mark.line + 1, error.problem_mark.column + 1)
+
+    return location
+
+
+@lru_cache(maxsize=RESPONSE_CACHE_SIZE)
+def render(path: str, config: str, options: Tuple) -> str:
+    """Render a config for a path, caching the responses of repeated requests"""
+    var_overrides, parameter_names, region, output_format = options
+    var_overrides = dict(var_overrides)
+    if path == "/config":
+        return json.dumps(
+            {
+                "config": parse_config_data(
+                    config, var_overrides, LABEL, search_path=config_search_path()
+                )
+            }
+        )
+
+    response: Dict[str, Any] = {"valid": True}
+    template = generate_template(
+        parse_config(
+            config,
+            {**var_overrides, **parameter_vars(parameter_names)},
+            LABEL,
+            search_path=config_search_path(),
+        ),
+        parameter_names,
+        var_overrides,
+        region,
+    )
+    if path == "/template" and output_format == "yaml":
+        output = StringIO()
+        dump_yaml(template, output)
+        response = {"template": output.getvalue()}
+    elif path == "/template":
+        response = {"template": template}
+
+    return json.dumps(response)
+
+
+def render_response(path: str, config: str, options: Tuple) -> str:
+    """Render a config for a path, from the response cache unless it loads fragments"""
+    if INCLUDE_PATTERN.search(config):
+        return render.__wrapped__(path, config, options)
+
+    return render(path, config, options)
+
+
+def request_options(request: Dict[str, Any]) -> Tuple:
+    """Get a request's render options, as a hashable tuple"""
+    output_format = request.get("format", "json")
+    if output_format not in ("json", "yaml"):
+        raise RequestError(400, "format must be json or yaml")
+    config_vars = request.get("vars", {})
+    if not isinstance(config_vars, dict) or not all(
+        isinstance(value, str) for value in config_vars.values()
+    ):
+        raise RequestError(400, "vars must be an object of strings")
+    parameter_names = request.get("parameter_vars", [])
+    if not isinstance(parameter_names, list) or not all(
+        isinstance(name, str) and PARAMETER_NAME_PATTERN.match(name)
+        for name in parameter_names
+    ):
+        raise RequestError(
+            400, "parameter_vars must be a list of alphanumeric parameter names"
+        )
+    region = request.get("action_region")
+    if region is not None and not isinstance(region, str):
+        raise RequestError(400, "action_region must be a string")
+
+    return (
+        tuple(sorted(config_vars.items())),
+        tuple(parameter_names),
+        region,
+        output_format,
+    )
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    """Handles render requests, with JSON bodies"""
+
+    server: "RenderServer"
+    protocol_version = "HTTP/1.1"
+
+    def respond(self, status: int, body: str):
+        """Send a JSON response"""
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_request(self) -> Dict[str, Any]:
+        """Read the request's JSON body"""
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_REQUEST_SIZE:
+            raise RequestError(413, "request is too large")
+
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as error:
+            raise RequestError(400, f"request is not JSON: {error}") from error
+        if not isinstance(request, dict) or not isinstance(request.get("config"), str):
+            raise RequestError(400, "request must be an object with a config string")
+
+        return request
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Report metrics, or that the server is up"""
+        if self.path == "/metrics":
+            self.respond(200, json.dumps(self.server.metrics.snapshot()))
+        elif self.path == "/health":
+            self.respond(200, json.dumps({"status": "ok"}))
+        else:
+            self.respond(404, json.dumps({"error": f"{self.path} not found"}))
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Parse, render or validate a config"""
+        started = time.perf_counter()
+        status, body = 200, ""
+        try:
+            if self.path not in ("/config", "/template", "/validate"):
+                raise RequestError(404, f"{self.path} not found")
+            request = self.read_request()
+            body = render_response(
+                self.path, request["config"], request_options(request)
+            )
+        except RequestError as error:
+            status, body = error.status, json.dumps({"error": str(error)})
+        except VALIDATION_ERRORS as error:
+            line, column = error_location(error)
+            status, body = 400, json.dumps(
+                {
+                    "error": format_error(LABEL, error),
+                    "line": line,
+                    "column": column,
+                }
+            )
+        except Exception as error:  # pylint: disable=broad-except
+            # respond to, and count, every request, even if pipegen fails on it
+            logger.exception("Failed to handle a request")
+            status, body = 500, json.dumps({"error": f"internal error: {error}"})
+
+        # recorded before responding, so clients see their request in the metrics
+        self.server.metrics.record(
+            self.path, (time.perf_counter() - started) * 1000, status != 200
+        )
+        self.respond(status, body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Log requests through logging, rather than to stderr"""
+        log(format % args)
+
+
+class RenderServer(ThreadingHTTPServer):
+    """A threaded HTTP server that renders configs, keeping pipegen loaded between requests"""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int]):
+        super().__init__(address, RenderHandler)
+        self.metrics = Metrics()
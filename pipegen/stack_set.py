@@ -0,0 +1,175 @@
+import logging
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+from botocore.exceptions import ClientError
+
+if TYPE_CHECKING:  # pragma: no cover
+    from mypy_boto3_cloudformation.client import CloudFormationClient
+    from mypy_boto3_cloudformation.type_defs import (
+        ParameterTypeDef,
+        StackInstanceSummaryTypeDef,
+        StackSetOperationPreferencesTypeDef,
+    )
+else:
+    CloudFormationClient = object
+    ParameterTypeDef = dict
+    StackInstanceSummaryTypeDef = dict
+    StackSetOperationPreferencesTypeDef = dict
+
+IN_PROGRESS_OPERATION_STATUSES = frozenset({"RUNNING", "QUEUED", "STOPPING"})
+SUCCESSFUL_INSTANCE_STATUSES = frozenset({"CURRENT"})
+DEFAULT_WAIT_DELAY = 10
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def log(message: str):
+    """Logs a general message"""
+    logger.info(message)
+
+
+def operation_preferences(
+    max_concurrent_percentage: int,
+    failure_tolerance_percentage: int,
+    region_concurrency: str,
+    regions: List[str],
+) -> StackSetOperationPreferencesTypeDef:
+    """Generate StackSet operation preferences"""
+    return {
+        "RegionConcurrencyType": region_concurrency,  # type: ignore
+        "RegionOrder": regions,
+        "MaxConcurrentPercentage": max_concurrent_percentage,
+        "FailureTolerancePercentage": failure_tolerance_percentage,
+    }
+
+
+class StackSet:
+    """Class that holds information about a CloudFormation StackSet, and can deploy it to many targets"""
+
+    name: str
+    capabilities: Optional[List] = None
+    wait_delay: int
+
+    def __init__(
+        self,
+        cloudformation: CloudFormationClient,
+        name: str,
+        wait_delay: int = DEFAULT_WAIT_DELAY,
+    ):
+        self.cloudformation = cloudformation
+        self.name = name
+        self.wait_delay = wait_delay
+
+    @property
+    def exists(self) -> bool:
+        """Checks if the StackSet currently exists or not"""
+        try:
+            self.cloudformation.describe_stack_set(StackSetName=self.name)
+
+            return True
+        except ClientError as exception:
+            if exception.response["Error"]["Code"] == "StackSetNotFoundException":
+                return False
+
+            raise exception
+
+    def set_capabilities(self, capabilities: List):
+        """Sets the capabilities to apply to the StackSet during deploy [create/update] actions"""
+        self.capabilities = capabilities
+
+    def deploy(
+        self,
+        template_body: str,
+        parameters: Dict[str, str],
+        targets: Tuple[List[str], List[str]],
+        preferences: StackSetOperationPreferencesTypeDef,
+    ) -> List[StackInstanceSummaryTypeDef]:
+        """Create/update the StackSet and its instances for every account/region target, then wait"""
+        accounts, regions = targets
+        stack_parameters: List[ParameterTypeDef] = [
+            {"ParameterKey": key, "ParameterValue": value}
+            for key, value in parameters.items()
+        ]
+
+        if self.exists:
+            log(f"Updating StackSet {self.name}")
+            response = self.cloudformation.update_stack_set(
+                StackSetName=self.name,
+                TemplateBody=template_body,
+                Parameters=stack_parameters,
+                Capabilities=self.capabilities or [],
+                OperationPreferences=preferences,
+            )
+            self.wait(response["OperationId"])
+        else:
+            log(f"Creating StackSet {self.name}")
+            self.cloudformation.create_stack_set(
+                StackSetName=self.name,
+                TemplateBody=template_body,
+                Parameters=stack_parameters,
+                Capabilities=self.capabilities or [],
+            )
+
+        existing = {
+            (instance["Account"], instance["Region"]) for instance in self.instances()
+        }
+        # one operation creates every missing region for a set of accounts, so
+        # accounts missing the same regions are created together, and a new
+        # StackSet takes a single operation
+        missing_accounts: Dict[Tuple[str, ...], List[str]] = {}
+        for account in accounts:
+            missing_regions = tuple(
+                region for region in regions if (account, region) not in existing
+            )
+            if missing_regions:
+                missing_accounts.setdefault(missing_regions, []).append(account)
+
+        for missing_regions, region_accounts in missing_accounts.items():
+            log(
+                f"Creating {len(region_accounts) * len(missing_regions)} StackSet "
+                f"instance(s) in {', '.join(missing_regions)}"
+            )
+            response = self.cloudformation.create_stack_instances(
+                StackSetName=self.name,
+                Accounts=region_accounts,
+                Regions=list(missing_regions),
+                OperationPreferences=preferences,
+            )
+            self.wait(response["OperationId"])
+
+        return self.instances(set(accounts), set(regions))
+
+    def wait(self, operation_id: str) -> str:
+        """Waits for a StackSet operation to complete"""
+        while True:
+            operation = self.cloudformation.describe_stack_set_operation(
+                StackSetName=self.name, OperationId=operation_id
+            )["StackSetOperation"]
+            status = operation["Status"]
+            if status not in IN_PROGRESS_OPERATION_STATUSES:
+                break
+
+            time.sleep(self.wait_delay)
+
+        log(f"StackSet {self.name} operation {operation_id} - {status}")
+        return status
+
+    def instances(
+        self,
+        accounts: Optional[Set[str]] = None,
+        regions: Optional[Set[str]] = None,
+    ) -> List[StackInstanceSummaryTypeDef]:
+        """Get the StackSet's instances, optionally limited to the given accounts and regions"""
+        paginator = self.cloudformation.get_paginator("list_stack_instances")
+        instances = []
+        for page in paginator.paginate(StackSetName=self.name):
+            for instance in page["Summaries"]:
+                if accounts and instance["Account"] not in accounts:
+                    continue
+                if regions and instance["Region"] not in regions:
+                    continue
+                instances.append(instance)
+
+        return instances
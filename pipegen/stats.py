@@ -0,0 +1,142 @@
+import json
+from io import StringIO
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from .config import get_pipeline_configs, get_regional_config
+from .generators import codebuild
+from .generators.iam import MANAGED_POLICY_SIZE_LIMIT, policy_size
+from .model import PipelineConfig
+from .render import dump_yaml
+
+# the largest template CloudFormation accepts as a TemplateBody, which deploy uses
+TEMPLATE_BODY_SIZE_LIMIT = 51200
+RESOURCE_LIMIT = 500
+LARGEST_COUNT = 10
+
+
+class TemplateStats(NamedTuple):
+    """Sizes of a template and its resources, largest first"""
+
+    yaml_size: int
+    json_size: int
+    resource_count: int
+    resource_sizes: List[Tuple[str, int]]
+    policy_sizes: List[Tuple[str, int]]
+    buildspec_sizes: List[Tuple[str, int]]
+
+
+def serialized_size(value: Any) -> int:
+    """Get the size in bytes of a value serialized as compact JSON"""
+    return len(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+
+
+def largest(sizes: Dict[str, int]) -> List[Tuple[str, int]]:
+    """Sort sizes largest first, then by name"""
+    return sorted(sizes.items(), key=lambda item: (-item[1], item[0]))
+
+
+def buildspec_sizes(
+    config: PipelineConfig, region: Optional[str] = None
+) -> Dict[str, int]:
+    """Get the size of each generated project's inline buildspec"""
+    regional_config = get_regional_config(config, region)
+
+    sizes = {}
+    for pipeline_config in get_pipeline_configs(regional_config):
+        for project_config in codebuild.get_generated_projects(pipeline_config):
+            if project_config.buildspec or not project_config.commands:
+                continue
+
+            buildspec = codebuild.generate_source_config(
+                project_config,
+                codebuild.path_filter_source(project_config, pipeline_config),
+                pipeline_config.parameters,
+            )["BuildSpec"]
+            if isinstance(buildspec, dict):
+                # buildspecs that reference parameters are substituted by CloudFormation
+                buildspec = buildspec["Fn::Sub"]
+            logical_id = codebuild.generate_logical_id(
+                project_config.name, pipeline_config.namespace
+            )
+            sizes[logical_id] = len(buildspec.encode("utf-8"))
+
+    return sizes
+
+
+def template_stats(
+    template: Dict[str, Any], config: PipelineConfig, region: Optional[str] = None
+) -> TemplateStats:
+    """Measure a generated template against CloudFormation and IAM's limits"""
+    output = StringIO()
+    dump_yaml(template, output)
+    resources = template["Resources"]
+
+    return TemplateStats(
+        yaml_size=len(output.getvalue().encode("utf-8")),
+        json_size=serialized_size(template),
+        resource_count=len(resources),
+        resource_sizes=largest(
+            {
+                logical_id: serialized_size(resource)
+                for logical_id, resource in resources.items()
+            }
+        ),
+        policy_sizes=largest(
+            {
+                logical_id: policy_size(
+                    resource["Properties"]["PolicyDocument"]["Statement"]
+                )
+                for logical_id, resource in resources.items()
+                if resource["Type"] == "AWS::IAM::ManagedPolicy"
+            }
+        ),
+        buildspec_sizes=largest(buildspec_sizes(config, region)),
+    )
+
+
+def format_stats(stats: TemplateStats) -> List[str]:
+    """Format template stats as report lines"""
+    lines = [
+        f"Template size: {stats.yaml_size:,} bytes as YAML, {stats.json_size:,} bytes "
+        f"as JSON (limit {TEMPLATE_BODY_SIZE_LIMIT:,} bytes)",
+        f"Resources: {stats.resource_count:,} of {RESOURCE_LIMIT:,}",
+        "Largest resources (bytes as JSON):",
+        *[f"  {name}: {size:,}" for name, size in stats.resource_sizes[:LARGEST_COUNT]],
+        "Managed policies (characters, excluding whitespace):",
+        *[
+            f"  {name}: {size:,} of {MANAGED_POLICY_SIZE_LIMIT:,}"
+            for name, size in stats.policy_sizes
+        ],
+    ]
+    if stats.buildspec_sizes:
+        lines.append("Largest inline buildspecs (bytes):")
+        lines.extend(
+            f"  {name}: {size:,}"
+            for name, size in stats.buildspec_sizes[:LARGEST_COUNT]
+        )
+
+    return lines
+
+
+def budget_failures(stats: TemplateStats, percentage: int = 100) -> List[str]:
+    """Report every measure that exceeds the percentage of its limit"""
+    measures = [
+        ("Template YAML size", stats.yaml_size, TEMPLATE_BODY_SIZE_LIMIT),
+        ("Template JSON size", stats.json_size, TEMPLATE_BODY_SIZE_LIMIT),
+        ("Resource count", stats.resource_count, RESOURCE_LIMIT),
+        *[
+            (f"{name} policy size", size, MANAGED_POLICY_SIZE_LIMIT)
+            for name, size in stats.policy_sizes
+        ],
+    ]
+
+    failures = []
+    for name, value, limit in measures:
+        budget = limit * percentage // 100
+        if value > budget:
+            failures.append(
+                f"{name} of {value:,} exceeds its budget of {budget:,} "
+                f"({percentage}% of {limit:,})"
+            )
+
+    return failures
@@ -0,0 +1,279 @@
+import json
+from typing import Any, Dict, List, NamedTuple, Optional, TextIO, Tuple
+
+from strictyaml import load
+
+from .executions import BATCH_GET_BUILDS_LIMIT, percentile
+from .generators import codebuild
+from .model import PipelineConfig
+
+# general compute types, smallest first, that actions are moved between
+COMPUTE_TYPES = (
+    "BUILD_GENERAL1_SMALL",
+    "BUILD_GENERAL1_MEDIUM",
+    "BUILD_GENERAL1_LARGE",
+)
+MIN_BUILDS = 3
+UPSIZE_UTILIZATION = 80.0
+DOWNSIZE_CPU_UTILIZATION = 30.0
+DOWNSIZE_MEMORY_UTILIZATION = 40.0
+# without utilization metrics, a build phase this slow is assumed to be CPU-starved
+SLOW_BUILD_SECONDS = 600.0
+METRIC_NAMES = {"cpu": "CPUUtilizedPercent", "memory": "MemoryUtilizedPercent"}
+
+
+class BuildRecord(NamedTuple):
+    """A build's phase durations, and its peak utilization where CloudWatch has it"""
+
+    # (phase type, seconds) pairs
+    phases: Tuple[Tuple[str, float], ...]
+    cpu_percent: Optional[float] = None
+    memory_percent: Optional[float] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BuildRecord":
+        """Build a build record from recorded history"""
+        return cls(
+            phases=tuple(data["phases"].items()),
+            cpu_percent=data.get("cpu_percent"),
+            memory_percent=data.get("memory_percent"),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert a build record to recordable history"""
+        return {
+            "phases": dict(self.phases),
+            "cpu_percent": self.cpu_percent,
+            "memory_percent": self.memory_percent,
+        }
+
+    def phase_seconds(self, phase: str) -> float:
+        """Get the seconds the build spent in a phase"""
+        return sum(
+            seconds for phase_type, seconds in self.phases if phase_type == phase
+        )
+
+
+class Recommendation(NamedTuple):
+    """A recommended compute type for an action, and why"""
+
+    action: str
+    current: str
+    recommended: str
+    reason: str
+
+
+History = Dict[str, List[BuildRecord]]
+
+
+def load_history(history_file: TextIO) -> History:
+    """Load recorded build history, by project logical ID"""
+    data = json.load(history_file)
+    return {
+        logical_id: [BuildRecord.from_dict(build) for build in builds]
+        for logical_id, builds in data["projects"].items()
+    }
+
+
+def dump_history(history: History, history_file: TextIO):
+    """Record build history, by project logical ID"""
+    json.dump(
+        {
+            "projects": {
+                logical_id: [build.to_dict() for build in builds]
+                for logical_id, builds in history.items()
+            }
+        },
+        history_file,
+        indent=2,
+    )
+    history_file.write("\n")
+
+
+def get_project_names(cloudformation, stack_name: str) -> Dict[str, str]:
+    """Get the names of a stack's CodeBuild projects, by logical ID"""
+    paginator = cloudformation.get_paginator("list_stack_resources")
+    return {
+        resource["LogicalResourceId"]: resource["PhysicalResourceId"]
+        for page in paginator.paginate(StackName=stack_name)
+        for resource in page["StackResourceSummaries"]
+        if resource["ResourceType"] == "AWS::CodeBuild::Project"
+    }
+
+
+def peak_utilization(cloudwatch, build: Dict[str, Any]) -> Dict[str, Optional[float]]:
+    """Get the peak CPU and memory utilization of a build, where CloudWatch has it"""
+    response = cloudwatch.get_metric_data(
+        MetricDataQueries=[
+            {
+                "Id": key,
+                "MetricStat": {
+                    "Metric": {
+                        "Namespace": "AWS/CodeBuild",
+                        "MetricName": metric_name,
+                        "Dimensions": [{"Name": "BuildId", "Value": build["id"]}],
+                    },
+                    "Period": 60,
+                    "Stat": "Maximum",
+                },
+            }
+            for key, metric_name in METRIC_NAMES.items()
+        ],
+        StartTime=build["startTime"],
+        EndTime=build["endTime"],
+    )
+
+    return {
+        f"{result['Id']}_percent": max(result["Values"], default=None)
+        for result in response["MetricDataResults"]
+    }
+
+
+def record_history(clients: Dict[str, Any], stack_name: str, count: int) -> History:
+    """Record the phases and utilization of each of a stack's projects' recent builds"""
+    history = {}
+    for logical_id, project_name in get_project_names(
+        clients["cloudformation"], stack_name
+    ).items():
+        build_ids = clients["codebuild"].list_builds_for_project(
+            projectName=project_name, sortOrder="DESCENDING"
+        )["ids"][: min(count, BATCH_GET_BUILDS_LIMIT)]
+        if not build_ids:
+            continue
+
+        builds = clients["codebuild"].batch_get_builds(ids=build_ids)["builds"]
+        history[logical_id] = [
+            BuildRecord(
+                phases=tuple(
+                    (phase["phaseType"], float(phase.get("durationInSeconds", 0)))
+                    for phase in build.get("phases", [])
+                ),
+                **peak_utilization(clients["cloudwatch"], build),
+            )
+            for build in builds
+            if build["buildStatus"] == "SUCCEEDED"
+        ]
+
+    return history
+
+
+def resize_step(builds: List[BuildRecord]) -> Tuple[int, str]:
+    """Decide whether builds need a larger (1) or smaller (-1) compute type, and why"""
+    build_seconds = percentile([build.phase_seconds("BUILD") for build in builds], 50)
+    cpu = [build.cpu_percent for build in builds if build.cpu_percent is not None]
+    memory = [
+        build.memory_percent for build in builds if build.memory_percent is not None
+    ]
+    if not cpu or not memory:
+        step = 1 if build_seconds >= SLOW_BUILD_SECONDS else 0
+        return step, f"BUILD phase p50 is {build_seconds:.0f}s"
+
+    # the typical peak of each build, so that one outlier doesn't resize an action
+    cpu_peak, memory_peak = percentile(cpu, 50), percentile(memory, 50)
+    step = 0
+    if max(cpu_peak, memory_peak) >= UPSIZE_UTILIZATION:
+        step = 1
+    elif (
+        cpu_peak <= DOWNSIZE_CPU_UTILIZATION
+        and memory_peak <= DOWNSIZE_MEMORY_UTILIZATION
+    ):
+        step = -1
+
+    return (
+        step,
+        f"peak CPU p50 is {cpu_peak:.0f}%, peak memory p50 is {memory_peak:.0f}%",
+    )
+
+
+def recommend_compute_type(
+    compute_type: str, builds: List[BuildRecord]
+) -> Tuple[str, str]:
+    """Recommend a compute type for a project from its builds, and the reason"""
+    if compute_type not in COMPUTE_TYPES:
+        return compute_type, f"{compute_type} is not a general compute type"
+    if len(builds) < MIN_BUILDS:
+        return compute_type, f"only {len(builds)} builds, of {MIN_BUILDS} needed"
+
+    step, reason = resize_step(builds)
+    index = COMPUTE_TYPES.index(compute_type) + step
+
+    return COMPUTE_TYPES[min(max(index, 0), len(COMPUTE_TYPES) - 1)], reason
+
+
+def recommend(config: PipelineConfig, history: History) -> List[Recommendation]:
+    """Recommend a compute type for every CodeBuild action, from its project's builds"""
+    project_logical_ids = codebuild.get_project_logical_ids(config)
+
+    recommendations = []
+    for project_config in codebuild.get_codebuild_projects(config):
+        recommended, reason = recommend_compute_type(
+            project_config.compute_type,
+            history.get(project_logical_ids[project_config.name], []),
+        )
+        recommendations.append(
+            Recommendation(
+                project_config.name, project_config.compute_type, recommended, reason
+            )
+        )
+
+    return recommendations
+
+
+def action_positions(rendered: str) -> Dict[str, Tuple[int, int, Optional[int]]]:
+    """Find the 0-based line and column of each action's name, and its compute_type's line"""
+    positions = {}
+    for stage in load(rendered).as_marked_up().get("stages", []):
+        for action in stage.get("actions", []):
+            line, column = action.lc.key("name")
+            positions[action["name"]] = (
+                line,
+                column,
+                action.lc.key("compute_type")[0] if "compute_type" in action else None,
+            )
+
+    return positions
+
+
+def apply_patches(lines: List[str], patches: Dict[int, Tuple[bool, str]]) -> str:
+    """Replace lines, or add a line after them, by index"""
+    patched = []
+    for index, line in enumerate(lines):
+        replace, patch = patches.get(index, (False, ""))
+        if replace:
+            patched.append(patch)
+        elif patch:
+            patched.append(line if line.endswith("\n") else f"{line}\n")
+            patched.append(patch)
+        else:
+            patched.append(line)
+
+    return "".join(patched)
+
+
+def patch_compute_types(
+    text: str, rendered: str, compute_types: Dict[str, str]
+) -> Tuple[str, List[str]]:
+    """Set the compute_type of actions in a config's text, returning any it couldn't patch"""
+    lines = text.splitlines(keepends=True)
+    rendered_lines = rendered.rstrip("\r\n").splitlines()
+    # actions are found in the rendered config, so only the lines that rendering
+    # left in place can be patched
+    aligned = len(text.rstrip("\r\n").splitlines()) == len(rendered_lines)
+
+    patches: Dict[int, Tuple[bool, str]] = {}
+    unpatched = []
+    for name, (name_line, indent, compute_type_line) in action_positions(
+        rendered
+    ).items():
+        if name not in compute_types:
+            continue
+
+        index = name_line if compute_type_line is None else compute_type_line
+        if not aligned or lines[index].rstrip("\r\n") != rendered_lines[index]:
+            unpatched.append(name)
+            continue
+
+        patch = f"{' ' * indent}compute_type: {compute_types[name]}\n"
+        patches[index] = (compute_type_line is not None, patch)
+
+    return apply_patches(lines, patches), unpatched
@@ -0,0 +1,86 @@
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from jinja2 import TemplateError, TemplateSyntaxError
+from strictyaml import YAMLError
+
+from .config import config_search_path, parse_config
+from .generators import generate
+
+VALIDATION_ERRORS = (
+    YAMLError,
+    TemplateError,
+    KeyError,
+    NotImplementedError,
+    OSError,
+    RuntimeError,
+    ValueError,
+)
+
+
+class ValidationResult(NamedTuple):
+    """The result of validating a config file"""
+
+    path: str
+    error: Optional[str] = None
+
+
+def expand_paths(paths: Iterable[str]) -> List[str]:
+    """Expand files and globs into a sorted list of unique file paths"""
+    expanded = set()
+    for path in paths:
+        matches = glob.glob(path, recursive=True)
+        # keep unmatched paths, so that missing files are reported as errors
+        expanded.update(matches or [path])
+
+    return sorted(expanded)
+
+
+def format_error(path: str, error: Exception) -> str:
+    """Format a validation error with its file and line context"""
+    if isinstance(error, TemplateSyntaxError):
+        return f"{path}:{error.lineno}: {error.message}"
+    if isinstance(error, YAMLError):
+        # strictyaml errors already reference the file (as its label) and line
+        return str(error)
+
+    return f"{path}: {type(error).__name__}: {error}"
+
+
+def validate_file(path: str, config_vars: Dict[str, str]) -> ValidationResult:
+    """Validate a config file by parsing it and generating its resources"""
+    try:
+        with open(path, encoding="utf-8") as config_file:
+            config = parse_config(
+                config_file.read(),
+                config_vars,
+                label=path,
+                search_path=config_search_path(path),
+            )
+            generate(config)
+    except VALIDATION_ERRORS as error:
+        return ValidationResult(path, format_error(path, error))
+    except Exception as error:  # pylint: disable=broad-except
+        # report a failure in pipegen itself against the file, and carry on with the others
+        return ValidationResult(
+            path, f"{path}: internal error: {type(error).__name__}: {error}"
+        )
+
+    return ValidationResult(path)
+
+
+def validate_files(
+    paths: List[str], config_vars: Dict[str, str], jobs: Optional[int] = None
+) -> List[ValidationResult]:
+    """Validate config files across a process pool"""
+    validate = partial(validate_file, config_vars=config_vars)
+    jobs = min(jobs or os.cpu_count() or 1, len(paths) or 1)
+    if jobs == 1:
+        return [validate(path) for path in paths]
+
+    chunksize = max(1, len(paths) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(validate, paths, chunksize=chunksize))
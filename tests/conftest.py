@@ -0,0 +1,24 @@
+import pytest
+
+VALID_CONFIG = """
+config:
+    s3_bucket: my-bucket
+    kms_key_arn: kms-key-arn
+
+sources:
+    - name: Source
+      from: CodeCommit
+      repository: my-repo
+      branch: {{ vars.BranchName }}
+
+stages:
+    - name: Build
+      actions:
+        - name: Build
+"""
+
+
+@pytest.fixture(name="valid_config")
+def fixture_valid_config():
+    """A minimal valid config, with a BranchName var"""
+    return VALID_CONFIG
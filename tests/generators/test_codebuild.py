@@ -0,0 +1,183 @@
+import os
+import subprocess
+from typing import List
+
+from strictyaml.ruamel import YAML
+
+from pipegen.generators import codebuild
+from pipegen.model import (
+    Action,
+    CodeBuildConfig,
+    DockerConfig,
+    LogGroupConfig,
+    PipelineConfig,
+)
+
+REPOSITORY = "123456789012.dkr.ecr.my-region-1.amazonaws.com/my-app"
+CACHE_REPOSITORY = "123456789012.dkr.ecr.my-region-1.amazonaws.com/my-app-cache"
+CONFIG = PipelineConfig(
+    s3_bucket="my-bucket",
+    kms_key_arn="kms-key-arn",
+    codebuild=CodeBuildConfig(log_group=LogGroupConfig(enabled=False)),
+)
+
+
+def get_environment(definition):
+    """Get a project definition's environment variables as a dictionary"""
+    environment = definition["CodeBuildBuild"]["Properties"]["Environment"]
+    return {
+        variable["Name"]: variable["Value"]
+        for variable in environment["EnvironmentVariables"]
+    }
+
+
+def test_docker_environment_variables():
+    """Tests docker_environment_variables()"""
+    assert not codebuild.docker_environment_variables(None)
+    assert codebuild.docker_environment_variables(DockerConfig()) == {
+        "DOCKER_BUILDKIT": "1"
+    }
+
+    cache_ref = "type=registry,ref=${CacheRepository}:cache"
+    assert codebuild.docker_environment_variables(
+        DockerConfig(repository=REPOSITORY, cache_repository=CACHE_REPOSITORY)
+    ) == {
+        "DOCKER_BUILDKIT": "1",
+        "DOCKER_REPOSITORY": REPOSITORY,
+        "DOCKER_CACHE_REPOSITORY": CACHE_REPOSITORY,
+        "DOCKER_CACHE_FROM": {
+            "Fn::Sub": (cache_ref, {"CacheRepository": CACHE_REPOSITORY})
+        },
+        "DOCKER_CACHE_TO": {
+            "Fn::Sub": (
+                f"{cache_ref},mode=max,image-manifest=true,oci-mediatypes=true",
+                {"CacheRepository": CACHE_REPOSITORY},
+            )
+        },
+    }
+
+
+def test_generate_source_config_docker_login():
+    """Tests generate_source_config() adds registry logins for docker actions"""
+    source = codebuild.generate_source_config(
+        Action(
+            "Build",
+            commands=("make image",),
+            docker=DockerConfig(repository=REPOSITORY),
+        )
+    )
+    buildspec = YAML(typ="safe").load(source["BuildSpec"])
+    assert list(buildspec["phases"]) == ["pre_build", "build"]
+    assert buildspec["phases"]["pre_build"]["commands"] == [
+        'ecr_region="$(expr "${DOCKER_REPOSITORY%%/*}" : '
+        "'[0-9]*\\.dkr\\.ecr\\.\\([a-z0-9-]*\\)\\.amazonaws\\.com')\"; "
+        'aws ecr get-login-password --region "${ecr_region:-$AWS_REGION}" | docker login '
+        '--username AWS --password-stdin "${DOCKER_REPOSITORY%%/*}"',
+    ]
+
+
+def test_project_privileged_mode():
+    """Tests project() only enables privileged mode for docker actions"""
+    definition, _ = codebuild.project(Action("Build"), CONFIG, "Role")
+    environment = definition["CodeBuildBuild"]["Properties"]["Environment"]
+    assert environment["PrivilegedMode"] is False
+    assert "DOCKER_BUILDKIT" not in get_environment(definition)
+
+    definition, _ = codebuild.project(
+        Action("Build", docker=DockerConfig(repository=REPOSITORY)),
+        CONFIG,
+        "Role",
+    )
+    environment = definition["CodeBuildBuild"]["Properties"]["Environment"]
+    assert environment["PrivilegedMode"] is True
+    assert get_environment(definition)["DOCKER_REPOSITORY"] == REPOSITORY
+
+    definition, _ = codebuild.project(
+        Action("Build", docker=DockerConfig(privileged=False)),
+        CONFIG,
+        "Role",
+    )
+    environment = definition["CodeBuildBuild"]["Properties"]["Environment"]
+    assert environment["PrivilegedMode"] is False
+
+
+def test_project_compact_policies_name():
+    """Tests project() names projects after the stack when compacting policies"""
+    definition, _ = codebuild.project(Action("Build"), CONFIG, "Role")
+    assert "Name" not in definition["CodeBuildBuild"]["Properties"]
+
+    definition, _ = codebuild.project(
+        Action("Build"), CONFIG._replace(compact_policies=True), "Role"
+    )
+    assert definition["CodeBuildBuild"]["Properties"]["Name"] == {
+        "Fn::Sub": "${AWS::StackName}-CodeBuildBuild"
+    }
+
+
+def test_generate_projects_jobs():
+    """Tests generate_projects() across a process pool matches generating serially"""
+    actions = [
+        Action(f"Build{index}", commands=(f"make build-{index}",))
+        for index in range(20)
+    ]
+
+    serial = list(codebuild.generate_projects(actions, CONFIG, "Role"))
+    assert list(codebuild.generate_projects(actions, CONFIG, "Role", jobs=3)) == serial
+    assert [output.logical_id for output in serial] == [
+        f"CodeBuildBuild{index}" for index in range(20)
+    ]
+
+
+def run_path_filtered_build(tmp_path, changed_file: str) -> str:
+    """Run a path filtered action's buildspec commands after changing a file"""
+    repository = tmp_path / "repository"
+    repository.mkdir(parents=True)
+    git = ["git", "-c", "user.name=test", "-c", "user.email=test@example.com"]
+    revisions: List[str] = []
+    for path in ["services/a/main.py", changed_file]:
+        (repository / path).parent.mkdir(parents=True, exist_ok=True)
+        (repository / path).write_text(f"{len(revisions)}\n")
+        if not revisions:
+            subprocess.run(["git", "init", "-q"], cwd=repository, check=True)
+        subprocess.run(["git", "add", "."], cwd=repository, check=True)
+        subprocess.run([*git, "commit", "-q", "-m", path], cwd=repository, check=True)
+        revisions.append(
+            subprocess.run(
+                ["git", "rev-parse", "HEAD"],
+                cwd=repository,
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout.strip()
+        )
+
+    # a stand-in for the AWS CLI, reporting the first commit as the last successful one
+    bin_path = tmp_path / "bin"
+    bin_path.mkdir()
+    (bin_path / "aws").write_text(f"#!/bin/sh\necho {revisions[0]}\n")
+    (bin_path / "aws").chmod(0o755)
+
+    source = codebuild.generate_source_config(
+        Action("Test", commands=("echo built",), paths=("services/a/**",)), "Source"
+    )
+    phases = YAML(typ="safe").load(source["BuildSpec"])["phases"]
+    script = "\n".join([*phases["pre_build"]["commands"], *phases["build"]["commands"]])
+    return subprocess.run(
+        ["sh", "-e", "-c", script],
+        cwd=repository,
+        check=True,
+        capture_output=True,
+        text=True,
+        env={
+            **os.environ,
+            "PATH": f"{bin_path}{os.pathsep}{os.environ['PATH']}",
+            "CODEBUILD_INITIATOR": "codepipeline/my-pipeline",
+            codebuild.SOURCE_REVISION_VARIABLE: revisions[1],
+        },
+    ).stdout
+
+
+def test_generate_source_config_paths(tmp_path):
+    """Tests actions with paths skip their commands unless matching files changed"""
+    assert "built" in run_path_filtered_build(tmp_path / "a", "services/a/lib/b.py")
+    assert "built" not in run_path_filtered_build(tmp_path / "b", "services/b/main.py")
@@ -0,0 +1,458 @@
+import json
+
+import pytest
+from strictyaml import YAMLValidationError, load
+
+from pipegen.config import parameter_vars, parse_config
+from pipegen.generators import codepipeline, generate, generate_template
+from pipegen.model import Pipeline
+
+SHARED_CONFIG = """
+config:
+    s3_bucket: my-bucket
+    kms_key_arn: kms-key-arn
+    codebuild:
+        share_projects: true
+
+sources:
+    - name: Source
+      from: CodeCommit
+      repository: my-repo
+      branch: main
+
+stages:
+    - name: Test
+      actions:
+        - name: TestServiceA
+          commands:
+            - make test
+          environment:
+            SERVICE: service-a
+        - name: TestServiceB
+          commands:
+            - make test
+          environment:
+            SERVICE: service-b
+        - name: Lint
+          commands:
+            - make lint
+"""
+
+
+def test_environment_variables_configuration():
+    """Tests environment_variables_configuration()"""
+    assert json.loads(
+        codepipeline.environment_variables_configuration({"KEY": "value"})
+    ) == [{"name": "KEY", "value": "value", "type": "PLAINTEXT"}]
+
+    assert codepipeline.environment_variables_configuration(
+        {"LITERAL": "${literal}", "IMPORTED": "import:MyImport"}
+    ) == {
+        "Fn::Sub": (
+            json.dumps(
+                [
+                    {"name": "LITERAL", "value": "${!literal}", "type": "PLAINTEXT"},
+                    {"name": "IMPORTED", "value": "${Value1}", "type": "PLAINTEXT"},
+                ]
+            ),
+            {
+                "Value1": {
+                    "Fn::Sub": ("${Value}", {"Value": {"Fn::ImportValue": "MyImport"}})
+                }
+            },
+        )
+    }
+
+
+def test_shared_projects():
+    """Tests that actions with identical build config share a project"""
+    resources = generate(parse_config(SHARED_CONFIG, {}))
+
+    projects = [
+        logical_id
+        for logical_id, resource in resources.items()
+        if resource["Type"] == "AWS::CodeBuild::Project"
+    ]
+    assert projects == ["CodeBuildTestServiceA", "CodeBuildLint"]
+
+    actions = resources["CodePipeline"]["Properties"]["Stages"][1]["Actions"]
+    assert [action["Configuration"]["ProjectName"] for action in actions] == [
+        {"Ref": "CodeBuildTestServiceA"},
+        {"Ref": "CodeBuildTestServiceA"},
+        {"Ref": "CodeBuildLint"},
+    ]
+    assert json.loads(actions[1]["Configuration"]["EnvironmentVariables"]) == [
+        {"name": "SERVICE", "value": "service-b", "type": "PLAINTEXT"}
+    ]
+    assert "EnvironmentVariables" not in actions[2]["Configuration"]
+
+    statements = resources["CodePipelinePolicy"]["Properties"]["PolicyDocument"][
+        "Statement"
+    ]
+    assert statements[2]["Resource"] == [
+        {"Fn::GetAtt": ["CodeBuildTestServiceA", "Arn"]},
+        {"Fn::GetAtt": ["CodeBuildLint", "Arn"]},
+    ]
+
+
+def test_generate_template_parameters():
+    """Tests generate_template() renders parameterised vars as parameters"""
+    template_config = SHARED_CONFIG.replace("main", "{{ vars.BranchName }}")
+    template = generate_template(
+        parse_config(template_config, parameter_vars(["BranchName"])),
+        ["BranchName"],
+        {"BranchName": "main"},
+    )
+
+    assert template["Parameters"] == {
+        "BranchName": {"Type": "String", "Default": "main"}
+    }
+    source_action = template["Resources"]["CodePipeline"]["Properties"]["Stages"][0][
+        "Actions"
+    ][0]
+    assert source_action["Configuration"]["BranchName"] == {"Ref": "BranchName"}
+
+
+def test_generate_template_literal_placeholders():
+    """Tests commands that look like parameterised vars are left alone without parameters"""
+    template_config = SHARED_CONFIG.replace(
+        "            - make lint\n",
+        '            - make lint\n            - echo "param(foo)"\n'
+        "            - echo ${HOME}\n",
+    )
+    template = generate_template(parse_config(template_config, {}))
+
+    buildspec = template["Resources"]["CodeBuildLint"]["Properties"]["Source"][
+        "BuildSpec"
+    ]
+    assert isinstance(buildspec, str)
+    assert 'echo "param(foo)"' in buildspec
+    assert "echo ${HOME}" in buildspec
+
+
+def test_generate_template_embedded_parameters():
+    """Tests generate_template() substitutes parameterised vars within other values"""
+    template_config = SHARED_CONFIG.replace(
+        "make lint", "make lint ENV={{ vars.Env }}"
+    ).replace("service-b", "{{ vars.Env }}-service-b")
+    template = generate_template(
+        parse_config(template_config, parameter_vars(["Env"])), ["Env"]
+    )
+
+    resources = template["Resources"]
+    buildspec = resources["CodeBuildLint"]["Properties"]["Source"]["BuildSpec"]
+    assert "- make lint ENV=${Env}" in buildspec["Fn::Sub"]
+
+    actions = resources["CodePipeline"]["Properties"]["Stages"][1]["Actions"]
+    _, substitutions = actions[1]["Configuration"]["EnvironmentVariables"]["Fn::Sub"]
+    assert substitutions == {"Value0": {"Fn::Sub": "${Env}-service-b"}}
+
+    with pytest.raises(ValueError) as excinfo:
+        generate_template(
+            parse_config(
+                SHARED_CONFIG.replace("name: Lint", "name: Lint{{ vars.Env }}"),
+                parameter_vars(["Env"]),
+            ),
+            ["Env"],
+        )
+
+    assert "Parameterised var 'Env' is used in a value" in str(excinfo.value)
+
+
+REGIONAL_CONFIG = """
+config:
+    s3_bucket: my-bucket
+    kms_key_arn: kms-key-arn
+    artifact_stores:
+        - region: eu-west-1
+          s3_bucket: my-eu-bucket
+          kms_key_arn: eu-kms-key-arn
+
+sources:
+    - name: Source
+      from: CodeCommit
+      repository: my-repo
+      branch: main
+
+stages:
+    - name: Deploy
+      actions:
+        - name: DeployUS
+          commands:
+            - make deploy
+        - name: DeployEU
+          region: eu-west-1
+          commands:
+            - make deploy
+"""
+
+
+def test_regional_actions():
+    """Tests that actions in other regions use regional artifact stores and projects"""
+    resources = generate(parse_config(REGIONAL_CONFIG, {}))
+    assert "CodeBuildDeployEU" not in resources
+
+    properties = resources["CodePipeline"]["Properties"]
+    assert "ArtifactStore" not in properties
+    assert [store["Region"] for store in properties["ArtifactStores"]] == [
+        {"Ref": "AWS::Region"},
+        "eu-west-1",
+    ]
+    assert properties["ArtifactStores"][1]["ArtifactStore"]["Location"] == (
+        "my-eu-bucket"
+    )
+
+    action = properties["Stages"][1]["Actions"][1]
+    assert action["Region"] == "eu-west-1"
+    assert action["Configuration"]["ProjectName"] == {
+        "Fn::Sub": "${AWS::StackName}-CodeBuildDeployEU"
+    }
+
+    statements = resources["CodePipelinePolicy"]["Properties"]["PolicyDocument"][
+        "Statement"
+    ]
+    assert statements[1]["Resource"] == ["kms-key-arn", "eu-kms-key-arn"]
+    assert statements[2]["Resource"] == [
+        {"Fn::GetAtt": ["CodeBuildDeployUS", "Arn"]},
+        {
+            "Fn::Sub": "arn:aws:codebuild:eu-west-1:${AWS::AccountId}:project/"
+            "${AWS::StackName}-CodeBuildDeployEU"
+        },
+    ]
+
+    regional_resources = generate(parse_config(REGIONAL_CONFIG, {}), "eu-west-1")
+    assert "CodePipeline" not in regional_resources
+    assert "CodeBuildDeployUS" not in regional_resources
+    project = regional_resources["CodeBuildDeployEU"]["Properties"]
+    assert project["Name"] == {"Fn::Sub": "${AWS::StackName}-CodeBuildDeployEU"}
+    assert project["EncryptionKey"] == "eu-kms-key-arn"
+
+
+CLONE_REF_CONFIG = """
+config:
+    s3_bucket: my-bucket
+    kms_key_arn: kms-key-arn
+
+sources:
+    - name: Monorepo
+      from: CodeStarConnection
+      repository: my-org/monorepo
+      branch: main
+      connection_arn: connection-arn
+      output_artifact_format: CODEBUILD_CLONE_REF
+      fetch_submodules: true
+    - name: Tools
+      from: CodeCommit
+      repository: tools
+      branch: main
+
+stages:
+    - name: Build
+      actions:
+        - name: Build
+          commands:
+            - make
+"""
+
+
+def test_clone_ref_sources():
+    """Tests clone-ref sources are fetched by CodeBuild with a shallow clone"""
+    resources = generate_template(parse_config(CLONE_REF_CONFIG, {}))["Resources"]
+
+    source_actions = resources["CodePipeline"]["Properties"]["Stages"][0]["Actions"]
+    assert source_actions[0]["Configuration"]["OutputArtifactFormat"] == (
+        "CODEBUILD_CLONE_REF"
+    )
+    assert "OutputArtifactFormat" not in source_actions[1]["Configuration"]
+
+    project_source = resources["CodeBuildBuild"]["Properties"]["Source"]
+    assert project_source["GitCloneDepth"] == 1
+    assert project_source["GitSubmodulesConfig"] == {"FetchSubmodules": True}
+
+    statements = resources["CodeBuildPolicy"]["Properties"]["PolicyDocument"][
+        "Statement"
+    ]
+    assert {
+        "Effect": "Allow",
+        "Action": ["codestar-connections:UseConnection"],
+        "Resource": ["connection-arn"],
+    } in statements
+    assert not any(
+        "codecommit:GitPull" in statement["Action"] for statement in statements
+    )
+
+
+def test_path_filtered_actions():
+    """Tests actions with paths get the revision they build from the source's variables"""
+    config = CLONE_REF_CONFIG + (
+        "        - name: TestServiceA\n"
+        "          paths:\n"
+        "            - services/a/**\n"
+        "          commands:\n"
+        "            - make test\n"
+    )
+    resources = generate_template(parse_config(config, {}))["Resources"]
+
+    stages = resources["CodePipeline"]["Properties"]["Stages"]
+    assert [action.get("Namespace") for action in stages[0]["Actions"]] == [
+        "MonorepoVariables",
+        None,
+    ]
+    assert "EnvironmentVariables" not in stages[1]["Actions"][0]["Configuration"]
+    assert json.loads(
+        stages[1]["Actions"][1]["Configuration"]["EnvironmentVariables"]
+    ) == [
+        {
+            "name": "PIPEGEN_SOURCE_REVISION",
+            "value": "#{MonorepoVariables.CommitId}",
+            "type": "PLAINTEXT",
+        }
+    ]
+    assert "codepipeline:ListPipelineExecutions" in json.dumps(
+        resources["CodeBuildPolicy"]
+    )
+
+    with pytest.raises(RuntimeError, match="CODEBUILD_CLONE_REF"):
+        generate_template(
+            parse_config(
+                config.replace("output_artifact_format: CODEBUILD_CLONE_REF", ""), {}
+            )
+        )
+
+
+ARTIFACTS_CONFIG = """
+config:
+    s3_bucket: my-bucket
+    kms_key_arn: kms-key-arn
+
+sources:
+    - name: Source
+      from: CodeCommit
+      repository: my-repo
+      branch: main
+
+stages:
+    - name: Build
+      actions:
+        - name: Build
+          commands:
+            - make
+          artifacts:
+            files:
+                - "**/*"
+            base_directory: dist
+            exclude_paths:
+                - "**/*.map"
+          secondary_artifacts:
+            - name: cli-binary
+              files:
+                - bin/cli
+              discard_paths: true
+    - name: Release
+      actions:
+        - name: Release
+          commands:
+            - make release
+          input_artifacts:
+            - cli-binary
+"""
+
+
+def test_secondary_artifacts():
+    """Tests secondary artifacts are separate output artifacts, that other actions can take"""
+    resources = generate_template(parse_config(ARTIFACTS_CONFIG, {}))["Resources"]
+
+    stages = resources["CodePipeline"]["Properties"]["Stages"]
+    assert stages[1]["Actions"][0]["OutputArtifacts"] == [
+        {"Name": "Build"},
+        {"Name": "clibinary"},
+    ]
+    assert stages[2]["Actions"][0]["InputArtifacts"] == [
+        {"Name": "Source"},
+        {"Name": "clibinary"},
+    ]
+    buildspec = load(
+        resources["CodeBuildBuild"]["Properties"]["Source"]["BuildSpec"]
+    ).data
+    assert buildspec["artifacts"] == {
+        "secondary-artifacts": {
+            "Build": {
+                "files": ["**/*"],
+                "base-directory": "dist",
+                "exclude-paths": ["**/*.map"],
+            },
+            "clibinary": {"files": ["bin/cli"], "discard-paths": "yes"},
+        }
+    }
+
+    with pytest.raises(YAMLValidationError, match="duplicate found"):
+        parse_config(ARTIFACTS_CONFIG.replace("cli-binary", "Release"), {})
+
+    # without artifacts of its own, the action only outputs its secondary artifacts
+    secondary_only_config = ARTIFACTS_CONFIG.replace(
+        ARTIFACTS_CONFIG[
+            ARTIFACTS_CONFIG.index("          artifacts:") : ARTIFACTS_CONFIG.index(
+                "          secondary_artifacts:"
+            )
+        ],
+        "",
+    )
+    stages = generate_template(parse_config(secondary_only_config, {}))["Resources"][
+        "CodePipeline"
+    ]["Properties"]["Stages"]
+    assert stages[1]["Actions"][0]["OutputArtifacts"] == [{"Name": "clibinary"}]
+
+    with pytest.raises(YAMLValidationError, match="when expecting one of"):
+        parse_config(
+            secondary_only_config.replace(
+                "            - cli-binary", "            - Build"
+            ),
+            {},
+        )
+
+
+def test_multiple_pipelines():
+    """Tests a config's pipelines have namespaced resources, and share roles and logs"""
+    config = parse_config(CLONE_REF_CONFIG, {})
+    config = config._replace(
+        sources=(),
+        stages=(),
+        pipelines=(
+            Pipeline("Api", config.sources, config.stages),
+            Pipeline("Web-App", config.sources[1:], config.stages),
+        ),
+    )
+    resources = generate_template(config)["Resources"]
+
+    assert list(resources) == [
+        "LogGroup",
+        "CodeBuildRole",
+        "CodeBuildPolicy",
+        "ApiCodeBuildBuild",
+        "WebAppCodeBuildBuild",
+        "CodePipelineRole",
+        "CodePipelinePolicy",
+        "ApiCodePipeline",
+        "WebAppCodePipeline",
+        "CloudWatchEventsRole",
+        "CloudWatchEventsPolicy",
+        "ApiToolsPushEventRule",
+        "WebAppToolsPushEventRule",
+    ]
+    pipelines = resources["WebAppCodePipeline"]["Properties"]["Stages"]
+    assert pipelines[1]["Actions"][0]["Configuration"]["ProjectName"] == {
+        "Ref": "WebAppCodeBuildBuild"
+    }
+    assert [
+        statement["Resource"]
+        for statement in resources["CloudWatchEventsPolicy"]["Properties"][
+            "PolicyDocument"
+        ]["Statement"]
+    ] == [
+        [
+            {
+                "Fn::Sub": f"arn:aws:codepipeline:${{AWS::Region}}:${{AWS::AccountId}}:${{{logical_id}}}"
+            }
+            for logical_id in ["ApiCodePipeline", "WebAppCodePipeline"]
+        ]
+    ]
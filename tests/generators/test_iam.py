@@ -0,0 +1,144 @@
+import json
+
+from pipegen.generators import iam
+from pipegen.model import (
+    Action,
+    CodeBuildConfig,
+    DockerConfig,
+    LogGroupConfig,
+    PipelineConfig,
+    Stage,
+)
+
+REPO_URI_PREFIX = "123456789012.dkr.ecr.my-region-1.amazonaws.com"
+REPO_ARN_PREFIX = "arn:aws:ecr:my-region-1:123456789012:repository"
+
+
+def configure_pipeline(*actions):
+    """Generate a config entry for a pipeline with the given actions"""
+    return PipelineConfig(
+        s3_bucket="my-bucket",
+        kms_key_arn="kms-key-arn",
+        codebuild=CodeBuildConfig(log_group=LogGroupConfig(enabled=False)),
+        stages=(Stage("Build", actions),),
+    )
+
+
+def get_statements(definition, policy_name: str):
+    """Get the statements of a managed policy"""
+    return definition[policy_name]["Properties"]["PolicyDocument"]["Statement"]
+
+
+def test_codebuild_role_docker_repositories():
+    """Tests codebuild_role() grants push access to docker repositories"""
+    definition, _ = iam.codebuild_role(
+        configure_pipeline(
+            Action(
+                "Image",
+                image=f"{REPO_URI_PREFIX}/builder:latest",
+                docker=DockerConfig(
+                    repository=f"{REPO_URI_PREFIX}/app",
+                    cache_repository=f"{REPO_URI_PREFIX}/app-cache",
+                ),
+            ),
+            Action("Test", image="aws/codebuild/standard:5.0"),
+        )
+    )
+
+    statements = get_statements(definition, "CodeBuildPolicy")
+    assert statements[:3] == [
+        iam.iam_permission(["ecr:GetAuthorizationToken"], ["*"]),
+        iam.iam_permission(iam.ECR_PULL_PERMISSIONS, [f"{REPO_ARN_PREFIX}/builder"]),
+        iam.iam_permission(
+            iam.ECR_PUSH_PERMISSIONS,
+            [f"{REPO_ARN_PREFIX}/app", f"{REPO_ARN_PREFIX}/app-cache"],
+        ),
+    ]
+
+
+def test_codebuild_role_no_ecr():
+    """Tests codebuild_role() doesn't grant ECR access without ECR repositories"""
+    definition, _ = iam.codebuild_role(
+        configure_pipeline(Action("Test", image="aws/codebuild/standard:5.0"))
+    )
+
+    for statement in get_statements(definition, "CodeBuildPolicy"):
+        assert not any(action.startswith("ecr:") for action in statement["Action"])
+
+
+def test_merge_permissions():
+    """Tests merge_permissions() merges statements with identical actions"""
+    assert iam.merge_permissions(
+        [
+            iam.iam_permission(["s3:GetObject"], ["bucket-a", "bucket-b"]),
+            iam.iam_permission(["kms:Decrypt"], [{"Ref": "Key"}]),
+            iam.iam_permission(["s3:GetObject"], ["bucket-b", "bucket-c"]),
+            iam.iam_permission(["kms:Decrypt"], [{"Ref": "Key"}, "*"]),
+        ]
+    ) == [
+        iam.iam_permission(["s3:GetObject"], ["bucket-a", "bucket-b", "bucket-c"]),
+        iam.iam_permission(["kms:Decrypt"], ["*"]),
+    ]
+
+
+def test_policy_size():
+    """Tests policy_size() measures substituted values at their worst-case size"""
+    substituted = "x" * iam.SUBSTITUTED_VALUE_SIZE
+    assert iam.substitute_worst_case(
+        [
+            {"Fn::Sub": ("arn:aws:s3:::${Bucket}/${!Literal}", {"Bucket": "b"})},
+            {"Fn::GetAtt": ["CodeBuildBuild", "Arn"]},
+            {"Ref": "Bucket"},
+            {"StringEquals": {"aws:SourceAccount": "${AWS::AccountId}"}},
+        ]
+    ) == [
+        f"arn:aws:s3:::{substituted}/${{!Literal}}",
+        substituted,
+        substituted,
+        {"StringEquals": {"aws:SourceAccount": "${AWS::AccountId}"}},
+    ]
+
+    permissions = [iam.iam_permission(["s3:GetObject"], [{"Ref": "Bucket"}])]
+    assert iam.policy_size(permissions) > len(json.dumps(permissions))
+
+
+def test_generate_managed_policies():
+    """Tests generate_managed_policies() splits compacted policies to fit IAM's limit"""
+    permissions = [
+        iam.iam_permission([f"service:Action{index}"], [f"resource-{index:0>200}"])
+        for index in range(100)
+    ]
+
+    definition, names = iam.generate_managed_policies("Policy", permissions)
+    assert names == ["Policy"]
+
+    definition, names = iam.generate_managed_policies("Policy", permissions, True)
+    assert names == ["Policy", "Policy2", "Policy3", "Policy4", "Policy5"]
+    for name in names:
+        statements = get_statements(definition, name)
+        assert iam.policy_size(statements) <= iam.MANAGED_POLICY_SIZE_LIMIT
+
+    assert [
+        statement for name in names for statement in get_statements(definition, name)
+    ] == permissions
+
+
+def test_codepipeline_role_compact_policies():
+    """Tests codepipeline_role() uses a stack-scoped wildcard for compacted policies"""
+    config = configure_pipeline()
+    projects = [f"CodeBuildProject{index}" for index in range(500)]
+
+    definition, _ = iam.codepipeline_role(config, projects)
+    statements = get_statements(definition, "CodePipelinePolicy")
+    assert len(statements[2]["Resource"]) == 500
+
+    definition, _ = iam.codepipeline_role(
+        config._replace(compact_policies=True), projects
+    )
+    statements = get_statements(definition, "CodePipelinePolicy")
+    assert statements[2]["Resource"] == [
+        {
+            "Fn::Sub": "arn:aws:codebuild:${AWS::Region}:${AWS::AccountId}:project/"
+            "${AWS::StackName}-*"
+        }
+    ]
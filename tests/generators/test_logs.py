@@ -1,26 +1,26 @@
 from typing import Optional
 
-from pipegen.generators import logs
+from pipegen.generators import codebuild, iam, logs
+from pipegen.model import (
+    Action,
+    CodeBuildConfig,
+    LogGroupConfig,
+    PipelineConfig,
+    S3LogsConfig,
+)
 
 
 def configure_log_group(
     enabled: bool, create: bool, name: str, retention: Optional[int] = None
-):
+) -> PipelineConfig:
     """Generate a config entry for a log group"""
-    log_config = {
-        "enabled": enabled,
-        "create": create,
-        "name": name,
-    }
-    if retention:
-        log_config["retention"] = retention
-
-    return {
-        "config": {
-            "kms_key_arn": "kms-key-arn",
-            "codebuild": {"log_group": log_config},
-        }
-    }
+    return PipelineConfig(
+        s3_bucket="my-bucket",
+        kms_key_arn="kms-key-arn",
+        codebuild=CodeBuildConfig(
+            log_group=LogGroupConfig(enabled, create, name, retention)
+        ),
+    )
 
 
 def test_log_group_disabled():
@@ -59,3 +59,58 @@ def test_log_group_basic_config():
             },
         }
     }
+
+
+def test_s3_logs():
+    """Tests projects log to the S3 logs prefix, which their role can only write under"""
+    config = PipelineConfig(
+        s3_bucket="my-bucket",
+        kms_key_arn="kms-key-arn",
+        codebuild=CodeBuildConfig(
+            log_group=LogGroupConfig(enabled=False),
+            s3_logs=S3LogsConfig(enabled=True, bucket="my-logs-bucket"),
+        ),
+    )
+
+    definition, _ = codebuild.project(Action("Build"), config, "CodeBuildRole")
+    assert definition["CodeBuildBuild"]["Properties"]["LogsConfig"] == {
+        "CloudWatchLogs": {"Status": "DISABLED"},
+        "S3Logs": {
+            "Status": "ENABLED",
+            "Location": {
+                "Fn::Sub": (
+                    "${BucketName}/${AWS::StackName}/codebuild-logs",
+                    {"BucketName": "my-logs-bucket"},
+                )
+            },
+            "EncryptionDisabled": False,
+        },
+    }
+
+    config = config._replace(
+        codebuild=config.codebuild._replace(
+            s3_logs=S3LogsConfig(enabled=True, prefix="logs", encrypted=False)
+        )
+    )
+    definition, _ = codebuild.project(Action("Build"), config, "CodeBuildRole")
+    assert definition["CodeBuildBuild"]["Properties"]["LogsConfig"]["S3Logs"] == {
+        "Status": "ENABLED",
+        "Location": {
+            "Fn::Sub": (
+                "${BucketName}/${Prefix}",
+                {"BucketName": "my-bucket", "Prefix": "logs"},
+            )
+        },
+        "EncryptionDisabled": True,
+    }
+    assert [statement["Resource"] for statement in iam.s3_logs_permissions(config)] == [
+        [{"Fn::Sub": ("arn:aws:s3:::${BucketName}", {"BucketName": "my-bucket"})}],
+        [
+            {
+                "Fn::Sub": (
+                    "arn:aws:s3:::${BucketName}/${Prefix}/*",
+                    {"BucketName": "my-bucket", "Prefix": "logs"},
+                )
+            }
+        ],
+    ]
@@ -0,0 +1,160 @@
+import re
+
+import pytest
+from strictyaml import YAMLValidationError
+
+from pipegen.concurrency import (
+    ProjectShare,
+    allocate,
+    apply_limits,
+    format_shares,
+    project_shares,
+)
+from pipegen.config import parse_config
+from pipegen.generators import generate_template
+from pipegen.model import Pipeline
+
+CONFIG = """
+config:
+    s3_bucket: my-bucket
+    kms_key_arn: kms-key-arn
+    codebuild:
+        queued_timeout: 30
+
+sources:
+    - name: Source
+      from: CodeCommit
+      repository: my-repo
+      branch: main
+
+stages:
+    - name: Build
+      actions:
+        - name: Build
+          weight: 3
+          commands:
+            - make
+        - name: Test
+          commands:
+            - make test
+        - name: Release
+          concurrent_build_limit: 2
+          queued_timeout: 60
+          commands:
+            - make release
+"""
+
+
+def test_project_limits():
+    """Tests projects render their configured limits, defaulting to the config's"""
+    resources = generate_template(parse_config(CONFIG, {}))["Resources"]
+
+    assert [
+        (
+            resources[logical_id]["Properties"].get("ConcurrentBuildLimit"),
+            resources[logical_id]["Properties"].get("QueuedTimeoutInMinutes"),
+        )
+        for logical_id in ["CodeBuildBuild", "CodeBuildTest", "CodeBuildRelease"]
+    ] == [(None, 30), (None, 30), (2, 60)]
+
+
+def test_allocate():
+    """Tests allocate() shares the quota left by declared limits by weight"""
+    configs = {
+        "a.yml": parse_config(CONFIG, {}),
+        "b.yml": parse_config(CONFIG.replace("weight: 3", "weight: 1"), {}),
+    }
+
+    shares = allocate(project_shares(configs), 20)
+
+    assert [(share.path, share.logical_id, share.limit) for share in shares] == [
+        ("a.yml", "CodeBuildBuild", 7),
+        ("a.yml", "CodeBuildTest", 3),
+        ("a.yml", "CodeBuildRelease", 2),
+        ("b.yml", "CodeBuildBuild", 3),
+        ("b.yml", "CodeBuildTest", 3),
+        ("b.yml", "CodeBuildRelease", 2),
+    ]
+    assert format_shares(shares, 20)[-1] == "Total: 20 of 20 concurrent builds"
+
+    config = apply_limits(configs["a.yml"], {"CodeBuildBuild": 7})
+    assert [action.concurrent_build_limit for action in config.stages[0].actions] == [
+        7,
+        None,
+        2,
+    ]
+
+
+def test_allocate_over_quota():
+    """Tests allocate() fails when every project can't have a build"""
+    with pytest.raises(ValueError, match="leaving 1 for 2 projects"):
+        allocate(
+            [
+                ProjectShare("a.yml", "CodeBuildRelease", 1, 4, True),
+                ProjectShare("a.yml", "CodeBuildBuild", 1),
+                ProjectShare("a.yml", "CodeBuildTest", 1),
+            ],
+            5,
+        )
+
+
+@pytest.mark.parametrize(
+    "shares",
+    [
+        [ProjectShare("a.yml", "CodeBuildBuild", -1), ProjectShare("a.yml", "B", 1)],
+        [ProjectShare("a.yml", "CodeBuildBuild", 0), ProjectShare("a.yml", "B", 0)],
+        [ProjectShare("a.yml", "CodeBuildBuild", 1, -2, True)],
+    ],
+)
+def test_allocate_invalid(shares):
+    """Tests allocate() rejects weights and declared limits below 1"""
+    with pytest.raises(ValueError, match="CodeBuildBuild in a.yml must have"):
+        allocate(shares, 10)
+
+
+@pytest.mark.parametrize(
+    "replacement,error",
+    [
+        ("weight: -1", "an integer of at least 1"),
+        ("weight: 0", "an integer of at least 1"),
+        ("concurrent_build_limit: -2", "an integer of at least 1"),
+        ("queued_timeout: 481", "an integer from 5 to 480"),
+        ("queued_timeout: 4", "an integer from 5 to 480"),
+    ],
+)
+def test_limits_schema(replacement, error):
+    """Tests the schema rejects weights, limits and queued timeouts out of range"""
+    key = replacement.split(":", maxsplit=1)[0]
+    config = re.sub(rf"(?m)^          {key}: .*$", f"          {replacement}", CONFIG)
+
+    with pytest.raises(YAMLValidationError, match=error):
+        parse_config(config, {})
+
+
+def test_pipelines_limits():
+    """Tests the projects of a config's pipelines are budgeted by their namespaced logical IDs"""
+    config = parse_config(CONFIG, {})
+    config = config._replace(
+        sources=(),
+        stages=(),
+        pipelines=(
+            Pipeline("Api", config.sources, config.stages),
+            Pipeline("Web", config.sources, config.stages[:1]),
+        ),
+    )
+
+    shares = project_shares({"a.yml": config})
+    assert [share.logical_id for share in shares] == [
+        "ApiCodeBuildBuild",
+        "ApiCodeBuildTest",
+        "ApiCodeBuildRelease",
+        "WebCodeBuildBuild",
+        "WebCodeBuildTest",
+        "WebCodeBuildRelease",
+    ]
+
+    config = apply_limits(config, {"WebCodeBuildTest": 4})
+    assert [
+        [action.concurrent_build_limit for action in pipeline.stages[0].actions]
+        for pipeline in config.pipelines
+    ] == [[None, None, 2], [None, 4, 2]]
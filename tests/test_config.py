@@ -1,42 +1,58 @@
 from unittest.mock import patch
 
 import pytest
-from strictyaml import Any
+from strictyaml import Any, YAMLError
 from strictyaml.exceptions import YAMLValidationError
 
 from pipegen import config
+from pipegen.model import (
+    Action,
+    ArtifactStore,
+    LogGroupConfig,
+    PipelineConfig,
+    Source,
+    Stage,
+)
 
 REPO_URI_PREFIX = "123456789012.dkr.ecr.my-region-1.amazonaws.com"
 
 
+def configure_source(provider: str, event_for_source_changes: bool) -> Source:
+    """Generate a config entry for a source"""
+    return Source(
+        "Source",
+        provider,
+        "my-repo",
+        "main",
+        event_for_source_changes=event_for_source_changes,
+    )
+
+
 def test_is_codecommit_with_event_source():
     """Tests is_codecommit_with_event_source()"""
     assert (
-        config.is_codecommit_with_event_source(
-            {"from": "CodeCommit", "event_for_source_changes": True}
-        )
+        config.is_codecommit_with_event_source(configure_source("CodeCommit", True))
         is True
     )
 
     assert (
         config.is_codecommit_with_event_source(
-            {"from": "SomethingElse", "event_for_source_changes": True}
+            configure_source("CodeStarConnection", True)
         )
         is False
     )
     assert (
-        config.is_codecommit_with_event_source(
-            {"from": "CodeCommit", "event_for_source_changes": False}
-        )
+        config.is_codecommit_with_event_source(configure_source("CodeCommit", False))
         is False
     )
 
 
 def test_contains_codecommit_with_event():
     """Tests contains_codecommit_with_event()"""
+    pipeline_config = PipelineConfig("my-bucket", "kms-key-arn")
     assert (
         config.contains_codecommit_with_event(
-            {"sources": [{"from": "CodeCommit", "event_for_source_changes": True}]}
+            pipeline_config._replace(sources=(configure_source("CodeCommit", True),))
         )
         is True
     )
@@ -44,12 +60,12 @@ def test_contains_codecommit_with_event():
     # Test multiple sources with one valid one is True
     assert (
         config.contains_codecommit_with_event(
-            {
-                "sources": [
-                    {"from": "SomethingElse", "event_for_source_changes": True},
-                    {"from": "CodeCommit", "event_for_source_changes": True},
-                ]
-            }
+            pipeline_config._replace(
+                sources=(
+                    configure_source("CodeStarConnection", True),
+                    configure_source("CodeCommit", True),
+                )
+            )
         )
         is True
     )
@@ -57,18 +73,20 @@ def test_contains_codecommit_with_event():
     # False cases
     assert (
         config.contains_codecommit_with_event(
-            {"sources": [{"from": "SomethingElse", "event_for_source_changes": True}]}
+            pipeline_config._replace(
+                sources=(configure_source("CodeStarConnection", True),)
+            )
         )
         is False
     )
     assert (
         config.contains_codecommit_with_event(
-            {
-                "sources": [
-                    {"from": "SomethingElse", "event_for_source_changes": True},
-                    {"from": "CodeCommit", "event_for_source_changes": False},
-                ]
-            }
+            pipeline_config._replace(
+                sources=(
+                    configure_source("CodeStarConnection", True),
+                    configure_source("CodeCommit", False),
+                )
+            )
         )
         is False
     )
@@ -127,18 +145,15 @@ def test_parse_config():
     assert rendered_config is not None
 
     # Test that base defaults are applied
-    assert rendered_config["config"]["codebuild"] is not None
+    assert rendered_config.codebuild is not None
+    assert rendered_config.codebuild.compute_type == "BUILD_GENERAL1_SMALL"
     assert (
-        rendered_config["config"]["codebuild"]["compute_type"] == "BUILD_GENERAL1_SMALL"
-    )
-    assert (
-        rendered_config["config"]["codebuild"]["image"]
+        rendered_config.codebuild.image
         == "aws/codebuild/amazonlinux2-x86_64-standard:3.0"
     )
-    assert rendered_config["config"]["codebuild"]["log_group"] == {
-        "enabled": True,
-        "create": True,
-    }
+    assert rendered_config.codebuild.log_group == LogGroupConfig(
+        enabled=True, create=True
+    )
 
     # Test compute_type and image defaults pass through to build stages
     check_config = """
@@ -167,10 +182,10 @@ def test_parse_config():
               buildspec: buildspecs/build.yml
     """
     rendered_config = config.parse_config(check_config, {})
-    for stage in rendered_config["stages"]:
-        for action in stage["actions"]:
-            assert action["compute_type"] == "BUILD_GENERAL1_SMALL"
-            assert action["image"] == "codebuild-image"
+    for stage in rendered_config.stages:
+        for action in stage.actions:
+            assert action.compute_type == "BUILD_GENERAL1_SMALL"
+            assert action.image == "codebuild-image"
 
     # Test that input_artifacts are validated correctly - this should exception
     check_config = """
@@ -204,6 +219,60 @@ def test_parse_config():
         config.parse_config(check_config, {})
 
 
+def test_parse_config_action_region():
+    """Tests parse_config() only allows action regions with an artifact store"""
+    check_config = """
+    config:
+        s3_bucket: my-bucket
+        kms_key_arn: kms-key-arn
+        artifact_stores:
+            - region: eu-west-1
+              s3_bucket: my-eu-bucket
+              kms_key_arn: eu-kms-key-arn
+
+    sources:
+        - name: Source
+          from: CodeCommit
+          repository: my-repo
+          branch: main
+
+    stages:
+        - name: Deploy
+          actions:
+            - name: Deploy
+              region: {{ vars.Region }}
+    """
+    rendered_config = config.parse_config(check_config, {"Region": "eu-west-1"})
+    assert rendered_config.stages[0].actions[0].region == "eu-west-1"
+
+    with pytest.raises(YAMLValidationError):
+        config.parse_config(check_config, {"Region": "ap-southeast-2"})
+
+
+def test_get_regional_config():
+    """Tests get_regional_config()"""
+    check_config = PipelineConfig(
+        s3_bucket="my-bucket",
+        kms_key_arn="kms-key-arn",
+        artifact_stores=(
+            ArtifactStore("my-eu-bucket", "eu-kms-key-arn", region="eu-west-1"),
+        ),
+        stages=(Stage("Deploy", (Action("A"), Action("B", region="eu-west-1"))),),
+    )
+
+    regional_config = config.get_regional_config(check_config, "eu-west-1")
+    assert regional_config.s3_bucket == "my-eu-bucket"
+    assert regional_config.kms_key_arn == "eu-kms-key-arn"
+    assert regional_config.stages[0].actions == (Action("B", region="eu-west-1"),)
+
+    primary_config = config.get_regional_config(check_config)
+    assert primary_config.s3_bucket == "my-bucket"
+    assert primary_config.stages[0].actions == (Action("A"),)
+
+    with pytest.raises(KeyError):
+        config.get_regional_config(check_config, "ap-southeast-2")
+
+
 def test_parse_value_single_value():
     """Tests parse_value() when passed a single value"""
     assert config.parse_value("${Value}", Value="my-value") == "my-value"
@@ -227,6 +296,67 @@ def test_parse_value_import():
     }
 
 
+def test_parse_value_parameter():
+    """Tests parse_value() when passed a parameterised var"""
+    placeholder = config.PARAMETER_PLACEHOLDER.format(name="MyParameter")
+    assert config.parse_value("${Value}", Value=placeholder) == {"Ref": "MyParameter"}
+
+    assert config.parse_value("Prefix-${Value}", Value=placeholder) == {
+        "Fn::Sub": ("Prefix-${Value}", {"Value": {"Ref": "MyParameter"}})
+    }
+
+    assert config.parse_value("${Value}", Value=f"{placeholder}-bucket") == {
+        "Fn::Sub": "${MyParameter}-bucket"
+    }
+
+    assert config.parse_value("Prefix-${Value}", Value=f"pre-{placeholder}") == {
+        "Fn::Sub": ("Prefix-${Value}", {"Value": {"Fn::Sub": "pre-${MyParameter}"}})
+    }
+
+    assert config.parse_value("${Value}", Value="echo param(MyParameter)") == (
+        "echo param(MyParameter)"
+    )
+
+
+def test_substitute_parameters():
+    """Tests substitute_parameters()"""
+    env = config.PARAMETER_PLACEHOLDER.format(name="Env")
+    name = config.PARAMETER_PLACEHOLDER.format(name="Name")
+    assert config.substitute_parameters("echo ${HOME}") == "echo ${HOME}"
+    assert config.substitute_parameters(f"echo ${{HOME}} {env}{name}") == {
+        "Fn::Sub": "echo ${!HOME} ${Env}${Name}"
+    }
+    assert config.substitute_parameters(f"echo ${{HOME}} {env}{name}", ["Env"]) == {
+        "Fn::Sub": f"echo ${{!HOME}} ${{Env}}{name}"
+    }
+    assert config.substitute_parameters(f"echo {env}", []) == f"echo {env}"
+
+
+def test_check_parameters():
+    """Tests check_parameters()"""
+    placeholder = config.PARAMETER_PLACEHOLDER.format(name="Env")
+    config.check_parameters({"Name": {"Fn::Sub": "${Env}-name"}}, ["Env"])
+    config.check_parameters({"Name": f"{placeholder}-name"}, ["Other"])
+
+    with pytest.raises(ValueError) as excinfo:
+        config.check_parameters({"Name": f"{placeholder}-name"}, ["Env"])
+
+    assert "Parameterised var 'Env' is used in a value" in str(excinfo.value)
+
+
+def test_parameter_vars():
+    """Tests parameter_vars()"""
+    assert config.parameter_vars(["BranchName", "Bucket"]) == {
+        "BranchName": config.PARAMETER_PLACEHOLDER.format(name="BranchName"),
+        "Bucket": config.PARAMETER_PLACEHOLDER.format(name="Bucket"),
+    }
+
+    with pytest.raises(ValueError) as excinfo:
+        config.parameter_vars(["Branch-Name"])
+
+    assert "must only contain alphanumeric characters" in str(excinfo.value)
+
+
 def test_get_ecr_arn():
     """Tests get_ecr_arn()"""
     assert (
@@ -249,3 +379,162 @@ def test_get_ecr_arn_exception():
         config.get_ecr_arn("something not like an ecr uri")
 
     assert "URI provided doesn't appear to be an ECR URI" in str(excinfo.value)
+
+
+INCLUDED_CONFIG = """
+{% extends "base.yml" %}
+{% import "actions.yml" as actions with context %}
+
+{% block stages %}
+    - name: Build
+      actions:
+{{ actions.make("Build", "build") }}
+{% include "lint.yml" %}
+{% endblock %}
+"""
+BASE_CONFIG = """
+config:
+    s3_bucket: my-bucket
+    kms_key_arn: kms-key-arn
+
+sources:
+    - name: Source
+      from: CodeCommit
+      repository: my-repo
+      branch: {{ vars.BranchName }}
+
+stages:
+{% block stages %}{% endblock %}
+"""
+ACTION_MACROS = """
+{% macro make(name, target) %}
+        - name: {{ name }}
+          commands:
+            - make {{ target }} BRANCH={{ vars.BranchName }}
+{%- endmacro %}
+"""
+LINT_FRAGMENT = """
+        - name: Lint
+          commands:
+            - make lint
+"""
+
+
+def test_parse_config_includes(tmp_path, monkeypatch):
+    """Tests parse_config() extends, imports and includes fragments, compiling each once"""
+    (tmp_path / "fragments").mkdir()
+    (tmp_path / "fragments" / "base.yml").write_text(BASE_CONFIG)
+    (tmp_path / "fragments" / "actions.yml").write_text(ACTION_MACROS)
+    (tmp_path / "lint.yml").write_text(LINT_FRAGMENT)
+    (tmp_path / "pipeline.yml").write_text(INCLUDED_CONFIG)
+    monkeypatch.setenv(config.INCLUDE_PATH_VARIABLE, str(tmp_path / "fragments"))
+    search_path = config.config_search_path(str(tmp_path / "pipeline.yml"))
+
+    assert search_path == (str(tmp_path), str(tmp_path / "fragments"))
+    with patch.object(
+        config.FileSystemLoader,
+        "get_source",
+        autospec=True,
+        side_effect=config.FileSystemLoader.get_source,
+    ) as get_source:
+        for branch in ["main", "develop"]:
+            # a copy, as each config in a run is a separate string
+            rendered_config = config.parse_config(
+                f"{INCLUDED_CONFIG} ",
+                {"BranchName": branch},
+                search_path=search_path,
+            )
+            assert rendered_config.sources[0].branch == branch
+            assert [
+                (action.name, action.commands)
+                for action in rendered_config.stages[0].actions
+            ] == [
+                ("Build", (f"make build BRANCH={branch}",)),
+                ("Lint", ("make lint",)),
+            ]
+
+    assert sorted(call.args[2] for call in get_source.call_args_list) == [
+        "actions.yml",
+        "base.yml",
+        "lint.yml",
+    ]
+
+
+PIPELINES_CONFIG = """
+config:
+    s3_bucket: my-bucket
+    kms_key_arn: kms-key-arn
+
+pipelines:
+    - name: Api
+      sources:
+        - name: Source
+          from: CodeCommit
+          repository: api
+          branch: main
+      stages:
+        - name: Build
+          actions:
+            - name: Build
+              commands:
+                - make
+            - name: Test
+              input_artifacts:
+                - Build
+    - name: Web
+      sources:
+        - name: Source
+          from: CodeCommit
+          repository: web
+          branch: main
+      stages:
+        - name: Build
+          actions:
+            - name: Build
+              commands:
+                - npm run build
+"""
+
+
+@pytest.mark.parametrize("backend", ["strictyaml", "libyaml"])
+def test_parse_config_pipelines(backend):
+    """Tests parse_config() checks names and input artifacts within each of the pipelines"""
+    parsed_config = config.parse_config(PIPELINES_CONFIG, {}, backend=backend)
+
+    assert [pipeline.name for pipeline in parsed_config.pipelines] == ["Api", "Web"]
+    assert [
+        (pipeline_config.namespace, pipeline_config.sources[0].repository)
+        for pipeline_config in config.get_pipeline_configs(parsed_config)
+    ] == [("Api", "api"), ("Web", "web")]
+    assert parsed_config.pipelines[1].stages[0].actions[0].compute_type == (
+        "BUILD_GENERAL1_SMALL"
+    )
+
+    with pytest.raises(YAMLError):
+        config.parse_config(
+            PIPELINES_CONFIG.replace("name: Test", "name: Build"), {}, backend=backend
+        )
+    with pytest.raises(YAMLError):
+        config.parse_config(
+            PIPELINES_CONFIG.replace(
+                "npm run build",
+                "npm run build\n"
+                "              input_artifacts:\n"
+                "                - Test",
+            ),
+            {},
+            backend=backend,
+        )
+
+
+def test_parse_config_pipelines_or_stages():
+    """Tests parse_config() needs either top-level sources and stages, or pipelines"""
+    with pytest.raises(ValueError, match="can't also have top-level stages"):
+        config.parse_config(
+            PIPELINES_CONFIG
+            + "stages:\n    - name: Build\n      actions:\n        - name: Build\n",
+            {},
+        )
+
+    with pytest.raises(KeyError, match="sources and stages, or pipelines"):
+        config.parse_config(PIPELINES_CONFIG.split("pipelines:", maxsplit=1)[0], {})
@@ -0,0 +1,197 @@
+from datetime import datetime, timedelta, timezone
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from pipegen.deployment import ChangeSetStack, Deployment, DeploymentWaiter
+
+CHANGE_SET_ARN = (
+    "arn:aws:cloudformation:eu-west-1:123456789012:changeSet/pipegen-20210101000000/abc"
+)
+STARTED = datetime(2021, 1, 1, tzinfo=timezone.utc)
+
+
+def create_client(region: str = "eu-west-1"):
+    """Create a stubbed CloudFormation client"""
+    client = boto3.client(
+        "cloudformation",
+        region_name=region,
+        aws_access_key_id="testing",
+        aws_secret_access_key="testing",
+    )
+    return client, Stubber(client)
+
+
+def change_set(status: str, reason: str = ""):
+    """Generate a DescribeChangeSet response"""
+    return {
+        "ChangeSetId": CHANGE_SET_ARN,
+        "StackName": "my-stack",
+        "Status": status,
+        "StatusReason": reason,
+        "ExecutionStatus": "AVAILABLE",
+        "CreationTime": STARTED,
+    }
+
+
+def stack_event(event_id, logical_id, status, seconds=0):
+    """Generate a stack event, some seconds after the change set was created"""
+    return {
+        "StackId": "my-stack-id",
+        "EventId": event_id,
+        "StackName": "my-stack",
+        "LogicalResourceId": logical_id,
+        "ResourceType": (
+            "AWS::CloudFormation::Stack"
+            if logical_id == "my-stack"
+            else "AWS::CodeBuild::Project"
+        ),
+        "ResourceStatus": status,
+        "Timestamp": STARTED + timedelta(seconds=seconds),
+    }
+
+
+def test_deployment_handle():
+    """Tests deployments round trip through their handles, which include the region"""
+    deployment = Deployment("my-stack", CHANGE_SET_ARN)
+
+    assert Deployment.from_handle(deployment.handle) == deployment
+    assert deployment.region == "eu-west-1"
+    with pytest.raises(ValueError):
+        Deployment.from_handle("my-stack")
+
+
+def test_deploy_executes_change_set():
+    """Tests deploy() executes an update change set without waiting for it"""
+    client, stubber = create_client()
+    stubber.add_response(
+        "describe_stacks",
+        {
+            "Stacks": [
+                {
+                    "StackName": "my-stack",
+                    "StackStatus": "UPDATE_COMPLETE",
+                    "CreationTime": STARTED,
+                }
+            ]
+        },
+        {"StackName": "my-stack"},
+    )
+    stubber.add_response("create_change_set", {"Id": CHANGE_SET_ARN})
+    stubber.add_response("describe_change_set", change_set("CREATE_IN_PROGRESS"))
+    stubber.add_response("describe_change_set", change_set("CREATE_COMPLETE"))
+    stubber.add_response("execute_change_set", {}, {"ChangeSetName": CHANGE_SET_ARN})
+
+    with stubber:
+        deployment = ChangeSetStack(client, "my-stack", wait_delay=0).deploy(
+            "template", {"BranchName": "main"}
+        )
+
+    assert deployment == Deployment("my-stack", CHANGE_SET_ARN)
+
+
+def test_deploy_no_changes():
+    """Tests deploy() deletes a change set without changes, rather than executing it"""
+    client, stubber = create_client()
+    stubber.add_client_error(
+        "describe_stacks", service_message="Stack with id my-stack does not exist"
+    )
+    stubber.add_response("create_change_set", {"Id": CHANGE_SET_ARN})
+    stubber.add_response(
+        "describe_change_set",
+        change_set("FAILED", "The submitted information didn't contain changes."),
+    )
+    stubber.add_response("delete_change_set", {}, {"ChangeSetName": CHANGE_SET_ARN})
+
+    with stubber:
+        assert (
+            ChangeSetStack(client, "my-stack", wait_delay=0).deploy("template", {})
+            is None
+        )
+
+
+def test_wait():
+    """Tests wait() polls deployments across regions until each finishes"""
+    other_arn = CHANGE_SET_ARN.replace("eu-west-1", "us-east-1")
+    eu_client, eu_stubber = create_client()
+    us_client, us_stubber = create_client("us-east-1")
+    eu_stubber.add_response("describe_change_set", change_set("CREATE_COMPLETE"))
+    us_stubber.add_response(
+        "describe_change_set",
+        {**change_set("CREATE_COMPLETE"), "ChangeSetId": other_arn},
+    )
+    eu_stubber.add_response(
+        "describe_stack_events",
+        {
+            "StackEvents": [
+                stack_event("2", "CodeBuildBuild", "UPDATE_IN_PROGRESS", 2),
+                stack_event("1", "my-stack", "UPDATE_IN_PROGRESS", 1),
+                stack_event("0", "my-stack", "UPDATE_COMPLETE", -60),
+            ]
+        },
+    )
+    us_stubber.add_client_error("describe_stack_events", "Throttling")
+    us_stubber.add_response(
+        "describe_stack_events",
+        {"StackEvents": [stack_event("3", "my-stack", "UPDATE_ROLLBACK_COMPLETE", 9)]},
+    )
+    eu_stubber.add_response(
+        "describe_stack_events",
+        {
+            "StackEvents": [
+                stack_event("4", "my-stack", "UPDATE_COMPLETE", 5),
+                stack_event("2", "CodeBuildBuild", "UPDATE_IN_PROGRESS", 2),
+                stack_event("1", "my-stack", "UPDATE_IN_PROGRESS", 1),
+            ]
+        },
+    )
+
+    deployments = [
+        Deployment("my-stack", CHANGE_SET_ARN),
+        Deployment("my-stack", other_arn),
+    ]
+    with eu_stubber, us_stubber:
+        results = DeploymentWaiter(
+            {"eu-west-1": eu_client, "us-east-1": us_client}, wait_delay=0
+        ).wait(deployments)
+
+    assert results == [
+        (deployments[0], "UPDATE_COMPLETE"),
+        (deployments[1], "UPDATE_ROLLBACK_COMPLETE"),
+    ]
+
+
+def test_stream_events_pages():
+    """Tests stream_events() reads pages back to the start of the deployment"""
+    client, stubber = create_client()
+    stubber.add_response(
+        "describe_stack_events",
+        {
+            "StackEvents": [
+                stack_event("3", "CodeBuildBuild", "UPDATE_COMPLETE", 3),
+                stack_event("2", "CodeBuildBuild", "UPDATE_IN_PROGRESS", 2),
+            ],
+            "NextToken": "page-2",
+        },
+        {"StackName": "my-stack"},
+    )
+    stubber.add_response(
+        "describe_stack_events",
+        {
+            "StackEvents": [
+                stack_event("1", "my-stack", "UPDATE_IN_PROGRESS", 1),
+                stack_event("0", "my-stack", "UPDATE_COMPLETE", -60),
+            ],
+            "NextToken": "page-3",
+        },
+        {"StackName": "my-stack", "NextToken": "page-2"},
+    )
+
+    waiter = DeploymentWaiter({"eu-west-1": client}, wait_delay=0)
+    with stubber:
+        status = waiter.stream_events(Deployment("my-stack", CHANGE_SET_ARN), STARTED)
+
+    stubber.assert_no_pending_responses()
+    assert status == "UPDATE_IN_PROGRESS"
+    assert waiter.seen_event_ids == {"1", "2", "3"}
@@ -0,0 +1,147 @@
+import boto3
+from botocore.stub import Stubber
+
+from pipegen import drift
+
+DEPLOYED_TEMPLATE = """
+Resources:
+  CodeBuildBuild:
+    Type: AWS::CodeBuild::Project
+    Properties:
+      Environment:
+        ComputeType: BUILD_GENERAL1_SMALL
+  CodePipeline:
+    Type: AWS::CodePipeline::Pipeline
+    Properties:
+      Name: my-pipeline
+"""
+
+
+def create_client():
+    """Create a stubbed CloudFormation client"""
+    client = boto3.client(
+        "cloudformation",
+        region_name="us-east-1",
+        aws_access_key_id="testing",
+        aws_secret_access_key="testing",
+    )
+    return client, Stubber(client)
+
+
+def detection_status(stack_name, status, drift_status=None):
+    """Generate a drift detection status response"""
+    response = {
+        "StackId": stack_name,
+        "StackDriftDetectionId": f"{stack_name}-detection",
+        "DetectionStatus": status,
+        "Timestamp": "2021-01-01T00:00:00Z",
+    }
+    if drift_status:
+        response["StackDriftStatus"] = drift_status
+    return response
+
+
+def test_detect():
+    """Tests detect() starts every detection before polling, and retries throttled calls"""
+    cloudformation, stubber = create_client()
+    for stack_name in ["stack-a", "stack-b"]:
+        stubber.add_response(
+            "detect_stack_drift",
+            {"StackDriftDetectionId": f"{stack_name}-detection"},
+            {"StackName": stack_name},
+        )
+    stubber.add_client_error(
+        "describe_stack_drift_detection_status", "Throttling", "Rate exceeded"
+    )
+    stubber.add_response(
+        "describe_stack_drift_detection_status",
+        detection_status("stack-a", "DETECTION_IN_PROGRESS"),
+        {"StackDriftDetectionId": "stack-a-detection"},
+    )
+    stubber.add_response(
+        "describe_stack_drift_detection_status",
+        detection_status("stack-b", "DETECTION_COMPLETE", "IN_SYNC"),
+        {"StackDriftDetectionId": "stack-b-detection"},
+    )
+    stubber.add_response(
+        "describe_stack_drift_detection_status",
+        detection_status("stack-a", "DETECTION_COMPLETE", "DRIFTED"),
+        {"StackDriftDetectionId": "stack-a-detection"},
+    )
+    stubber.add_response(
+        "describe_stack_resource_drifts",
+        {
+            "StackResourceDrifts": [
+                {
+                    "StackId": "stack-a",
+                    "LogicalResourceId": "CodeBuildBuild",
+                    "ResourceType": "AWS::CodeBuild::Project",
+                    "StackResourceDriftStatus": "MODIFIED",
+                    "PropertyDifferences": [
+                        {
+                            "PropertyPath": "/Environment/ComputeType",
+                            "ExpectedValue": "BUILD_GENERAL1_SMALL",
+                            "ActualValue": "BUILD_GENERAL1_LARGE",
+                            "DifferenceType": "NOT_EQUAL",
+                        }
+                    ],
+                    "Timestamp": "2021-01-01T00:00:00Z",
+                }
+            ]
+        },
+        {
+            "StackName": "stack-a",
+            "StackResourceDriftStatusFilters": ["MODIFIED", "DELETED"],
+        },
+    )
+    stubber.add_response(
+        "get_template", {"TemplateBody": DEPLOYED_TEMPLATE}, {"StackName": "stack-a"}
+    )
+
+    detector = drift.DriftDetector(cloudformation, wait_delay=0)
+    with stubber:
+        results = detector.detect(["stack-a", "stack-b"])
+        deployed_resources = detector.deployed_resources("stack-a")
+
+    assert results == [
+        drift.StackDrift(
+            "stack-a",
+            "DRIFTED",
+            (
+                drift.ResourceDrift(
+                    "CodeBuildBuild",
+                    "AWS::CodeBuild::Project",
+                    "MODIFIED",
+                    ("/Environment/ComputeType",),
+                ),
+            ),
+        ),
+        drift.StackDrift("stack-b", "IN_SYNC"),
+    ]
+
+    changes = drift.redeploy_changes(
+        deployed_resources,
+        {
+            "CodeBuildBuild": {
+                "Type": "AWS::CodeBuild::Project",
+                "Properties": {"Environment": {"ComputeType": "BUILD_GENERAL1_SMALL"}},
+            },
+            "CodePipeline": {
+                "Type": "AWS::CodePipeline::Pipeline",
+                "Properties": {"Name": "my-new-pipeline"},
+            },
+        },
+    )
+    assert changes == {"CodePipeline"}
+    assert drift.format_drift(results[0], changes) == [
+        "stack-a: DRIFTED",
+        "  CodeBuildBuild (AWS::CodeBuild::Project) MODIFIED: /Environment/ComputeType"
+        " - unchanged by a redeploy",
+    ]
+
+
+def test_read_manifest():
+    """Tests read_manifest() reads stack names and optional config paths"""
+    assert drift.read_manifest(
+        ["# pipelines\n", "stack-a pipelines/a.yml\n", "\n", "stack-b  # no config\n"]
+    ) == [("stack-a", "pipelines/a.yml"), ("stack-b", None)]
@@ -0,0 +1,180 @@
+from datetime import datetime, timedelta, timezone
+from typing import Literal
+
+import boto3
+from botocore.stub import Stubber
+
+from pipegen import executions
+
+STARTED = datetime(2021, 1, 1, tzinfo=timezone.utc)
+
+
+def create_client(service: Literal["cloudformation", "codebuild", "codepipeline"]):
+    """Create a stubbed client"""
+    client = boto3.client(
+        service,
+        region_name="us-east-1",
+        aws_access_key_id="testing",
+        aws_secret_access_key="testing",
+    )
+    return client, Stubber(client)
+
+
+def action_execution(execution_id, stage, action, times, build_id=None):
+    """Generate a ListActionExecutions detail, starting and ending at offsets in seconds"""
+    start, end = times
+    detail = {
+        "pipelineExecutionId": execution_id,
+        "stageName": stage,
+        "actionName": action,
+        "startTime": STARTED + timedelta(seconds=start),
+        "lastUpdateTime": STARTED + timedelta(seconds=end),
+        "status": "Succeeded",
+        "input": {
+            "actionTypeId": {
+                "category": "Build" if build_id else "Source",
+                "owner": "AWS",
+                "provider": "CodeBuild" if build_id else "CodeCommit",
+                "version": "1",
+            }
+        },
+    }
+    if build_id:
+        detail["output"] = {"executionResult": {"externalExecutionId": build_id}}
+
+    return detail
+
+
+def build_detail(build_id, queued, running):
+    """Generate a BatchGetBuilds build with queued and running phases"""
+    return {
+        "id": build_id,
+        "phases": [
+            {"phaseType": "SUBMITTED", "durationInSeconds": 0},
+            {"phaseType": "PROVISIONING", "durationInSeconds": queued},
+            {"phaseType": "DOWNLOAD_SOURCE", "durationInSeconds": 2},
+            {"phaseType": "BUILD", "durationInSeconds": running - 2},
+            {"phaseType": "COMPLETED"},
+        ],
+    }
+
+
+def test_get_pipeline_name():
+    """Tests get_pipeline_name()"""
+    client, stubber = create_client("cloudformation")
+    stubber.add_response(
+        "describe_stack_resource",
+        {
+            "StackResourceDetail": {
+                "LogicalResourceId": "CodePipeline",
+                "PhysicalResourceId": "my-pipeline",
+                "ResourceType": "AWS::CodePipeline::Pipeline",
+                "LastUpdatedTimestamp": STARTED,
+                "ResourceStatus": "CREATE_COMPLETE",
+            }
+        },
+        {"StackName": "my-stack", "LogicalResourceId": "CodePipeline"},
+    )
+
+    with stubber:
+        assert executions.get_pipeline_name(client, "my-stack") == "my-pipeline"
+
+
+def test_get_action_timings():
+    """Tests get_action_timings() reads succeeded executions and their builds' phases"""
+    codepipeline, codepipeline_stubber = create_client("codepipeline")
+    codebuild, codebuild_stubber = create_client("codebuild")
+    codepipeline_stubber.add_response(
+        "list_pipeline_executions",
+        {
+            "pipelineExecutionSummaries": [
+                {"pipelineExecutionId": "exec-3", "status": "InProgress"},
+                {"pipelineExecutionId": "exec-2", "status": "Succeeded"},
+                {"pipelineExecutionId": "exec-1", "status": "Failed"},
+                {"pipelineExecutionId": "exec-0", "status": "Succeeded"},
+            ]
+        },
+        {"pipelineName": "my-pipeline"},
+    )
+    for execution_id, build_time in [("exec-2", 100), ("exec-0", 60)]:
+        codepipeline_stubber.add_response(
+            "list_action_executions",
+            {
+                "actionExecutionDetails": [
+                    action_execution(execution_id, "Source", "Source", (0, 5)),
+                    action_execution(
+                        execution_id,
+                        "Build",
+                        "Build",
+                        (10, 10 + build_time),
+                        f"build:{execution_id}",
+                    ),
+                    action_execution(
+                        execution_id, "Build", "Lint", (10, 40), f"lint:{execution_id}"
+                    ),
+                ]
+            },
+            {
+                "pipelineName": "my-pipeline",
+                "filter": {"pipelineExecutionId": execution_id},
+            },
+        )
+    codebuild_stubber.add_response(
+        "batch_get_builds",
+        {
+            "builds": [
+                build_detail("build:exec-0", 10, 45),
+                build_detail("build:exec-2", 30, 65),
+                build_detail("lint:exec-0", 5, 20),
+                build_detail("lint:exec-2", 5, 20),
+            ]
+        },
+        {"ids": ["build:exec-0", "build:exec-2", "lint:exec-0", "lint:exec-2"]},
+    )
+
+    with codepipeline_stubber, codebuild_stubber:
+        timings = executions.get_action_timings(
+            {"codepipeline": codepipeline, "codebuild": codebuild}, "my-pipeline", 2
+        )
+
+    assert [(timing.execution_id, timing.action) for timing in timings] == [
+        ("exec-2", "Source"),
+        ("exec-2", "Build"),
+        ("exec-2", "Lint"),
+        ("exec-0", "Source"),
+        ("exec-0", "Build"),
+        ("exec-0", "Lint"),
+    ]
+    assert (timings[1].duration, timings[1].queued, timings[1].running) == (
+        100,
+        35,
+        65,
+    )
+    assert (timings[0].duration, timings[0].queued, timings[0].running) == (5, 0, 5)
+
+    lines = executions.format_execution_stats(timings)
+    assert lines[:4] == [
+        "Executions: 2",
+        "Stages (p50 / p95):",
+        "  Source: 5.0s / 5.0s",
+        "  Build: 60.0s / 100.0s",
+    ]
+    assert (
+        "  Build/Build: 60.0s / 100.0s, queued 15.0s / 35.0s, running 45.0s / 65.0s"
+        in lines
+    )
+    assert "  PROVISIONING: 5.0s / 30.0s" in lines
+    assert lines[-3:] == [
+        "Critical path (p50 65.0s):",
+        "  Source/Source: last to finish in 2 of 2 executions",
+        "  Build/Build: last to finish in 2 of 2 executions",
+    ]
+
+
+def test_percentile():
+    """Tests percentile() uses the nearest rank"""
+    values = [float(value) for value in range(1, 21)]
+
+    assert executions.percentile(values, 50) == 10
+    assert executions.percentile(values, 95) == 19
+    assert executions.percentile([3.0], 95) == 3
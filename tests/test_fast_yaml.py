@@ -0,0 +1,129 @@
+from unittest.mock import patch
+
+import pytest
+from strictyaml import YAMLError
+from strictyaml.exceptions import YAMLValidationError
+
+from pipegen import config, fast_yaml
+
+pytestmark = pytest.mark.skipif(
+    not fast_yaml.FAST_YAML_AVAILABLE, reason="libyaml is not available"
+)
+
+CONFIG = """
+config:
+    s3_bucket: my-bucket
+    kms_key_arn: kms-key-arn
+    codebuild:
+        share_projects: yes
+        log_group:
+            retention: 1_4
+    artifact_stores:
+        - region: eu-west-1
+          s3_bucket: my-eu-bucket
+          kms_key_arn: eu-kms-key-arn
+
+sources:
+    - name: Source
+      from: CodeCommit
+      repository: my-repo
+      branch: {{ vars.BranchName }}
+      poll_for_source_changes: TRUE
+
+stages:
+    - name: Build
+      actions:
+        - name: Build
+          buildspec: buildspecs/build.yml
+          environment:
+            COUNT: 1
+            ENABLED: no
+          docker:
+            repository: my-repo
+    - name: Deploy
+      actions:
+        - name: Deploy
+          region: eu-west-1
+          input_artifacts:
+            - Build
+          environment:
+"""
+
+
+def test_parse_config_libyaml():
+    """Tests parse_config_data() returns the same data with libyaml as strictyaml"""
+    no_codebuild = CONFIG.replace(
+        "    codebuild:\n        share_projects: yes\n"
+        "        log_group:\n            retention: 1_4\n",
+        "",
+    )
+    assert "codebuild" not in no_codebuild
+    for check_config in [
+        CONFIG,
+        CONFIG + "          compute_type: BUILD_GENERAL1_LARGE\n",
+        no_codebuild,
+    ]:
+        strict_config = config.parse_config_data(
+            check_config, {"BranchName": "main"}, backend="strictyaml"
+        )
+        fast_config = config.parse_config_data(
+            check_config, {"BranchName": "main"}, backend="libyaml"
+        )
+
+        assert fast_config == strict_config
+        # key order matters too, as it is the order configs are dumped in
+        assert repr(fast_config) == repr(strict_config)
+
+    assert fast_config["stages"][0]["actions"][0]["environment"] == {
+        "COUNT": "1",
+        "ENABLED": "no",
+    }
+
+
+@pytest.mark.parametrize(
+    "extra,line,problem",
+    [
+        ("        - name: Deploy\n", 38, "duplicate found"),
+        ("          unknown: value\n", 38, "unexpected key not in schema 'unknown'"),
+        ("          category: Other\n", 38, "found 'Other'"),
+        ("          docker:\n            privileged: maybe\n", 39, "arbitrary text"),
+        ("          commands: [a, b]\n", 38, "found flow style"),
+        ("          environment:\n", 38, "found duplicate key 'environment'"),
+        ("          image: !!str image\n", 38, "found a tag"),
+        ("          queued_timeout: 481\n", 38, "found 481"),
+        ("  - not a mapping\n", 38, "did not find expected key"),
+    ],
+)
+def test_parse_config_libyaml_errors(extra, line, problem):
+    """Tests parse_config_data() rejects what strictyaml does with libyaml, with the line"""
+    check_config = CONFIG + extra
+
+    with pytest.raises(YAMLError):
+        config.parse_config_data(
+            check_config, {"BranchName": "main"}, backend="strictyaml"
+        )
+
+    with pytest.raises(fast_yaml.ConfigValidationError) as error:
+        config.parse_config_data(
+            check_config,
+            {"BranchName": "main"},
+            label="my-config.yml",
+            backend="libyaml",
+        )
+
+    assert problem in error.value.problem
+    assert error.value.line == line
+    assert f'in "my-config.yml", line {line}' in str(error.value)
+
+
+def test_parse_config_libyaml_fallback(monkeypatch):
+    """Tests parse_config_data() selects libyaml by environment, and falls back to strictyaml"""
+    check_config = CONFIG + "          unknown: value\n"
+    monkeypatch.setenv(config.YAML_BACKEND_VARIABLE, config.LIBYAML_BACKEND)
+
+    with pytest.raises(fast_yaml.ConfigValidationError):
+        config.parse_config_data(check_config, {"BranchName": "main"})
+
+    with patch("pipegen.fast_yaml.FAST_YAML_AVAILABLE", False):
+        with pytest.raises(YAMLValidationError):
+            config.parse_config_data(check_config, {"BranchName": "main"})
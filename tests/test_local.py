@@ -0,0 +1,159 @@
+import pytest
+
+from pipegen import local
+from pipegen.model import Action, Artifact, PipelineConfig, Source, Stage
+
+SOURCES = (
+    Source(name="Source", provider="CodeCommit", repository="my-repo", branch="main"),
+    Source(name="Tools", provider="CodeCommit", repository="tools", branch="main"),
+)
+
+
+def make_config(*stages):
+    """Make a pipeline config with two sources and the stages"""
+    return PipelineConfig(
+        s3_bucket="my-bucket",
+        kms_key_arn="kms-key-arn",
+        sources=SOURCES,
+        stages=stages,
+    )
+
+
+@pytest.fixture(name="source_paths")
+def fixture_source_paths(tmp_path):
+    """Make a primary and a secondary source directory"""
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "app.txt").write_text("app")
+    (tmp_path / "tools").mkdir()
+    (tmp_path / "tools" / "tool.txt").write_text("tool")
+
+    return {"Source": str(tmp_path / "src"), "Tools": str(tmp_path / "tools")}
+
+
+def test_local_runner(tmp_path, source_paths):
+    """Tests LocalRunner.run() passes artifacts between stages, and times actions"""
+    config = make_config(
+        Stage(
+            name="Build",
+            actions=(
+                Action(
+                    name="Build",
+                    commands=(
+                        "mkdir dist",
+                        'cat app.txt "$CODEBUILD_SRC_DIR_Tools/tool.txt" > dist/out.txt',
+                        "echo $GREETING > dist/greeting.txt",
+                    ),
+                    artifacts=Artifact(("dist/**/*",)),
+                    environment=(("GREETING", "hello"),),
+                ),
+                Action(name="Lint", buildspec="buildspecs/lint.yml"),
+            ),
+        ),
+        Stage(name="Skipped", enabled=False, actions=(Action(name="Fail"),)),
+        Stage(
+            name="Test",
+            actions=(
+                Action(
+                    name="Test",
+                    commands=('grep apptool "$CODEBUILD_SRC_DIR_Build/dist/out.txt"',),
+                    input_artifacts=("Build",),
+                ),
+            ),
+        ),
+    )
+
+    results = local.LocalRunner(config, str(tmp_path / "work"), source_paths).run()
+
+    assert [(result.stage, result.action, result.status) for result in results] == [
+        ("Build", "Build", local.SUCCEEDED),
+        ("Build", "Lint", local.SKIPPED),
+        ("Test", "Test", local.SUCCEEDED),
+    ]
+    assert all(result.duration >= 0 for result in results)
+    artifact_path = tmp_path / "work" / "artifacts" / "Build" / "dist"
+    assert (artifact_path / "greeting.txt").read_text() == "hello\n"
+    # the source is copied, so builds don't change it
+    assert not (tmp_path / "src" / "dist").exists()
+
+
+def test_local_runner_failure(tmp_path, source_paths):
+    """Tests LocalRunner.run() stops after a stage with a failed action, in the source's workspace"""
+    config = make_config(
+        Stage(
+            name="Build",
+            actions=(
+                Action(name="Build", commands=("echo broken", "false", "echo never")),
+                Action(name="Test", commands=("true",)),
+            ),
+        ),
+        Stage(name="Deploy", actions=(Action(name="Deploy", commands=("true",)),)),
+    )
+
+    workspace = str(tmp_path / "src" / ".pipegen")
+    results = local.LocalRunner(config, workspace, source_paths).run()
+
+    assert [(result.action, result.status) for result in results] == [
+        ("Build", local.FAILED),
+        ("Test", local.SUCCEEDED),
+    ]
+    with open(results[0].log_path, encoding="utf-8") as log_file:
+        assert log_file.read() == "broken\n"
+
+
+def test_local_runner_artifacts(tmp_path, source_paths):
+    """Tests LocalRunner.collect_artifacts() packages each artifact as CodeBuild does"""
+    runner = local.LocalRunner(make_config(), str(tmp_path / "work"), source_paths)
+    build_path = tmp_path / "build"
+    (build_path / "dist" / "bin").mkdir(parents=True)
+    for name in ["dist/app.js", "dist/app.js.map", "dist/bin/cli"]:
+        (build_path / name).write_text(name)
+
+    runner.collect_artifacts(
+        Action(
+            name="Build",
+            artifacts=Artifact(
+                ("**/*",), base_directory="dist", exclude_paths=("**/*.map",)
+            ),
+            secondary_artifacts=(
+                Artifact(("dist/bin/*",), name="cli-binary", discard_paths=True),
+            ),
+        ),
+        str(build_path),
+    )
+
+    artifacts_path = tmp_path / "work" / "artifacts"
+    assert sorted(
+        str(path.relative_to(artifacts_path))
+        for path in artifacts_path.rglob("*")
+        if path.is_file()
+    ) == ["Build/app.js", "Build/bin/cli", "clibinary/cli"]
+
+
+def test_local_runner_docker(tmp_path, source_paths):
+    """Tests LocalRunner.command() runs an action's commands in its image"""
+    config = make_config()
+    runner = local.LocalRunner(config, str(tmp_path), source_paths, docker=True)
+    action = Action(
+        name="Test",
+        image="my-image",
+        commands=("make", "make test"),
+        environment=(("KEY", "value"),),
+        input_artifacts=("Build",),
+    )
+
+    command = runner.command(action, "/build")
+
+    assert command[:3] == ["docker", "run", "--rm"]
+    assert command[-5:] == ["my-image", "sh", "-e", "-c", "make\nmake test"]
+    assert f"/build:{local.CONTAINER_DIRECTORY}/src" in command
+    assert f"{source_paths['Tools']}:{local.CONTAINER_DIRECTORY}/Tools:ro" in command
+    assert f"CODEBUILD_SRC_DIR_Build={local.CONTAINER_DIRECTORY}/Build" in command
+    assert "KEY=value" in command
+
+
+def test_local_runner_missing_source(tmp_path, source_paths):
+    """Tests LocalRunner() requires a directory for every source"""
+    with pytest.raises(ValueError, match="Tools"):
+        local.LocalRunner(
+            make_config(), str(tmp_path), {"Source": source_paths["Source"]}
+        )
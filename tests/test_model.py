@@ -0,0 +1,62 @@
+import pickle
+
+from pipegen.config import parse_config, parse_config_data
+from pipegen.generators import generate
+from pipegen.model import Action, DockerConfig, PipelineConfig, PolicyStatement
+
+CONFIG = """
+config:
+    s3_bucket: my-bucket
+    kms_key_arn: kms-key-arn
+    iam:
+        - Action:
+            - s3:GetObject
+          Resource:
+            - my-resource
+
+sources:
+    - name: Source
+      from: CodeCommit
+      repository: my-repo
+      branch: main
+
+stages:
+    - name: Build
+      actions:
+        - name: Build
+          commands:
+            - make image
+          environment:
+            MY_VAR: my-value
+          docker:
+            repository: my-repository
+"""
+
+
+def test_pipeline_config_from_dict():
+    """Tests PipelineConfig.from_dict() builds the model with the config's defaults"""
+    config = PipelineConfig.from_dict(parse_config_data(CONFIG, {}))
+
+    assert config.s3_bucket == "my-bucket"
+    assert config.codebuild.log_group.enabled is True
+    assert config.iam == (PolicyStatement(("s3:GetObject",), ("my-resource",)),)
+    assert config.sources[0].provider == "CodeCommit"
+    assert config.stages[0].actions == (
+        Action(
+            "Build",
+            commands=("make image",),
+            environment=(("MY_VAR", "my-value"),),
+            input_artifacts=(),
+            docker=DockerConfig(repository="my-repository"),
+        ),
+    )
+
+
+def test_generate_leaves_config_unchanged():
+    """Tests generating resources doesn't modify the config, so results can be reused"""
+    config = parse_config(CONFIG, {})
+    copied_config = pickle.loads(pickle.dumps(config))
+
+    assert generate(config) == generate(config)
+    assert config == copied_config
+    assert config.stages[0].actions[0].environment == (("MY_VAR", "my-value"),)
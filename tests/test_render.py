@@ -0,0 +1,105 @@
+import os
+import stat
+from io import StringIO
+
+import pytest
+
+from pipegen import render
+from pipegen.config import parameter_vars, parse_config
+from pipegen.generators import generate_template, iter_resources
+
+
+def test_stream_template(valid_config):
+    """Tests stream_template() matches dumping the whole template at once"""
+    config = parse_config(valid_config, {"BranchName": "main"})
+
+    expected = StringIO()
+    render.dump_yaml(
+        generate_template(config, ["Bucket"], {"Bucket": "my-bucket"}), expected
+    )
+
+    output = StringIO()
+    render.stream_template(
+        iter_resources(config),
+        output,
+        {"Bucket": {"Type": "String", "Default": "my-bucket"}},
+    )
+    assert output.getvalue() == expected.getvalue()
+
+
+def test_render_files(tmp_path, valid_config):
+    """Tests render_files() only rewrites templates that changed"""
+    (tmp_path / "configs").mkdir()
+    (tmp_path / "configs" / "first.yml").write_text(valid_config)
+    (tmp_path / "configs" / "second.yml").write_text(valid_config)
+    (tmp_path / "configs" / "invalid.yml").write_text("config: {}\n")
+    paths = sorted(str(path) for path in (tmp_path / "configs").iterdir())
+    out_dir = str(tmp_path / "templates")
+
+    results = render.render_files(paths, out_dir, {"BranchName": "main"}, 2)
+    assert [(result.changed, result.error is None) for result in results] == [
+        (True, True),
+        (False, False),
+        (True, True),
+    ]
+    assert sorted(os.listdir(out_dir)) == ["first.yml", "second.yml"]
+
+    first_stat = os.stat(f"{out_dir}/first.yml")
+    results = render.render_files(paths, out_dir, {"BranchName": "main"}, 1)
+    assert [result.changed for result in results] == [False, False, False]
+    assert os.stat(f"{out_dir}/first.yml").st_mtime_ns == first_stat.st_mtime_ns
+
+    umask = os.umask(0o022)
+    os.umask(umask)
+    assert stat.S_IMODE(first_stat.st_mode) == 0o666 & ~umask
+
+    os.chmod(f"{out_dir}/first.yml", 0o640)
+    results = render.render_files(paths, out_dir, {"BranchName": "develop"}, 1)
+    assert [result.changed for result in results] == [True, False, True]
+    assert "develop" in (tmp_path / "templates" / "first.yml").read_text()
+    assert sorted(os.listdir(out_dir)) == ["first.yml", "second.yml"]
+    assert stat.S_IMODE(os.stat(f"{out_dir}/first.yml").st_mode) == 0o640
+
+
+def test_render_file_failure(tmp_path, valid_config, monkeypatch):
+    """Tests render_file() removes its temporary file when rendering fails"""
+    (tmp_path / "config.yml").write_text(valid_config)
+
+    def fail(*_):
+        raise TypeError("unexpected")
+
+    monkeypatch.setattr(render, "stream_template", fail)
+
+    with pytest.raises(TypeError):
+        render.render_file(
+            str(tmp_path / "config.yml"), str(tmp_path), {"BranchName": "main"}
+        )
+    assert os.listdir(tmp_path) == ["config.yml"]
+
+
+def test_stream_template_parameters(valid_config):
+    """Tests stream_template() rejects parameterised vars it can't reference"""
+    config = parse_config(
+        valid_config.replace("- name: Build\n", "- name: Build{{ vars.Env }}\n"),
+        {"BranchName": "main", **parameter_vars(["Env"])},
+    )
+
+    with pytest.raises(ValueError, match="Parameterised var 'Env'"):
+        render.stream_template(
+            iter_resources(config), StringIO(), {"Env": {"Type": "String"}}
+        )
+
+
+def test_stream_template_jobs(valid_config):
+    """Tests generating projects across a process pool renders an identical template"""
+    config = parse_config(
+        valid_config
+        + "".join(f"        - name: Build{index}\n" for index in range(10)),
+        {"BranchName": "main"},
+    )
+
+    serial = StringIO()
+    render.stream_template(iter_resources(config), serial)
+    parallel = StringIO()
+    render.stream_template(iter_resources(config, jobs=2), parallel)
+    assert parallel.getvalue() == serial.getvalue()
@@ -0,0 +1,126 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+
+from pipegen.config import parse_config
+from pipegen.generators import generate_template
+from pipegen.server import RenderServer
+
+CONFIG = """
+config:
+    s3_bucket: my-bucket
+    kms_key_arn: kms-key-arn
+
+sources:
+    - name: Source
+      from: CodeCommit
+      repository: my-repo
+      branch: {{ vars.BranchName }}
+
+stages:
+    - name: Build
+      actions:
+        - name: Build
+          buildspec: buildspecs/build.yml
+"""
+
+
+@pytest.fixture(name="server_url")
+def fixture_server_url():
+    """Run a render server on a free port"""
+    server = RenderServer(("127.0.0.1", 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+
+    server.shutdown()
+    server.server_close()
+
+
+def post(url, request):
+    """Post a JSON request, and return the status and JSON response"""
+    try:
+        with urlopen(
+            Request(url, data=json.dumps(request).encode("utf-8"), method="POST")
+        ) as response:
+            return response.status, json.load(response)
+    except HTTPError as error:
+        return error.code, json.load(error)
+
+
+def test_serve_template(server_url):
+    """Tests the server renders the same template as generate_template(), concurrently"""
+    request = {"config": CONFIG, "vars": {"BranchName": "main"}}
+    expected = json.loads(
+        json.dumps(generate_template(parse_config(CONFIG, {"BranchName": "main"})))
+    )
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        responses = list(
+            pool.map(lambda _: post(f"{server_url}/template", request), range(8))
+        )
+
+    assert responses == [(200, {"template": expected})] * 8
+    status, response = post(f"{server_url}/template", {**request, "format": "yaml"})
+    assert status == 200
+    assert response["template"].startswith("Resources:\n")
+
+    status, response = post(f"{server_url}/config", request)
+    assert status == 200
+    assert response["config"]["sources"][0]["branch"] == "main"
+
+    with urlopen(f"{server_url}/metrics") as metrics_response:
+        metrics = json.load(metrics_response)
+    assert metrics["paths"]["/template"]["requests"] == 9
+    assert metrics["paths"]["/template"]["errors"] == 0
+    assert metrics["paths"]["/template"]["p95_ms"] >= 0
+    assert metrics["response_cache"]["hits"] >= 1
+
+
+@pytest.mark.parametrize(
+    "request_body,status,error,line",
+    [
+        ({"config": CONFIG + "          unknown: value\n"}, 400, "unexpected key", 16),
+        ({"config": CONFIG + "{% if %}\n"}, 400, "Expected an expression", 17),
+        ({"config": CONFIG, "vars": {}}, 400, "BranchName", None),
+        ({"config": CONFIG, "format": "xml"}, 400, "format must be", None),
+        ({"vars": {}}, 400, "config string", None),
+        ({"config": CONFIG, "parameter_vars": [1]}, 400, "parameter_vars", None),
+        ({"config": CONFIG, "parameter_vars": "ab"}, 400, "parameter_vars", None),
+        ({"config": CONFIG, "action_region": ["a"]}, 400, "action_region", None),
+    ],
+)
+def test_serve_errors(server_url, request_body, status, error, line):
+    """Tests the server reports invalid configs and requests, with the line at fault"""
+    request_body = {"vars": {"BranchName": "main"}, **request_body}
+    response_status, response = post(f"{server_url}/validate", request_body)
+
+    assert response_status == status
+    assert error in response["error"]
+    assert response.get("line") == line
+
+
+def test_serve_not_found(server_url):
+    """Tests the server responds 404 to unknown paths"""
+    assert post(f"{server_url}/unknown", {"config": CONFIG})[0] == 404
+
+
+def test_serve_internal_error(server_url, monkeypatch):
+    """Tests the server responds 500 to unexpected failures, and counts them"""
+
+    def fail(*_):
+        raise TypeError("unexpected")
+
+    monkeypatch.setattr("pipegen.server.render_response", fail)
+
+    assert post(f"{server_url}/template", {"config": CONFIG}) == (
+        500,
+        {"error": "internal error: unexpected"},
+    )
+    with urlopen(f"{server_url}/metrics") as metrics_response:
+        assert json.load(metrics_response)["paths"]["/template"]["errors"] == 1
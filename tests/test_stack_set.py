@@ -0,0 +1,219 @@
+from typing import Any, Dict, Optional
+
+import boto3
+import click
+import pytest
+from botocore.stub import Stubber
+
+from pipegen.cli import deploy_stack_set
+from pipegen.stack_set import StackSet, operation_preferences
+
+PREFERENCES = operation_preferences(50, 10, "PARALLEL", ["us-east-1"])
+
+
+def create_client():
+    """Create a stubbed CloudFormation client"""
+    client = boto3.client(
+        "cloudformation",
+        region_name="us-east-1",
+        aws_access_key_id="testing",
+        aws_secret_access_key="testing",
+    )
+    return client, Stubber(client)
+
+
+def instance_summary(
+    account: str,
+    region: str,
+    status: str = "CURRENT",
+    detailed_status: Optional[str] = "SUCCEEDED",
+):
+    """Generate a ListStackInstances summary"""
+    summary: Dict[str, Any] = {
+        "StackSetId": "my-stack-set:id",
+        "Account": account,
+        "Region": region,
+        "Status": status,
+    }
+    if detailed_status:
+        summary["StackInstanceStatus"] = {"DetailedStatus": detailed_status}
+
+    return summary
+
+
+def test_operation_preferences():
+    """Tests operation_preferences()"""
+    assert PREFERENCES == {
+        "RegionConcurrencyType": "PARALLEL",
+        "RegionOrder": ["us-east-1"],
+        "MaxConcurrentPercentage": 50,
+        "FailureTolerancePercentage": 10,
+    }
+
+
+def test_deploy_creates_stack_set():
+    """Tests deploy() creates a StackSet and all of its instances in one operation"""
+    client, stubber = create_client()
+    stubber.add_client_error(
+        "describe_stack_set", service_error_code="StackSetNotFoundException"
+    )
+    stubber.add_response(
+        "create_stack_set",
+        {"StackSetId": "my-stack-set:id"},
+        {
+            "StackSetName": "my-stack-set",
+            "TemplateBody": "template",
+            "Parameters": [],
+            "Capabilities": ["CAPABILITY_IAM"],
+        },
+    )
+    stubber.add_response("list_stack_instances", {"Summaries": []})
+    stubber.add_response(
+        "create_stack_instances",
+        {"OperationId": "create-op"},
+        {
+            "StackSetName": "my-stack-set",
+            "Accounts": ["111111111111", "222222222222"],
+            "Regions": ["us-east-1", "eu-west-1"],
+            "OperationPreferences": PREFERENCES,
+        },
+    )
+    stubber.add_response(
+        "describe_stack_set_operation",
+        {"StackSetOperation": {"OperationId": "create-op", "Status": "SUCCEEDED"}},
+    )
+    stubber.add_response(
+        "list_stack_instances",
+        {
+            "Summaries": [
+                instance_summary("111111111111", "us-east-1"),
+                instance_summary("111111111111", "eu-west-1"),
+                instance_summary("222222222222", "us-east-1"),
+                instance_summary("222222222222", "eu-west-1"),
+            ]
+        },
+    )
+
+    with stubber:
+        stack_set = StackSet(client, "my-stack-set", wait_delay=0)
+        stack_set.set_capabilities(["CAPABILITY_IAM"])
+        instances = stack_set.deploy(
+            "template",
+            {},
+            (["111111111111", "222222222222"], ["us-east-1", "eu-west-1"]),
+            PREFERENCES,
+        )
+
+    stubber.assert_no_pending_responses()
+    assert [(instance["Account"], instance["Region"]) for instance in instances] == [
+        ("111111111111", "us-east-1"),
+        ("111111111111", "eu-west-1"),
+        ("222222222222", "us-east-1"),
+        ("222222222222", "eu-west-1"),
+    ]
+
+
+def test_deploy_updates_stack_set():
+    """Tests deploy() updates an existing StackSet and only adds new instances"""
+    client, stubber = create_client()
+    stubber.add_response(
+        "describe_stack_set",
+        {"StackSet": {"StackSetName": "my-stack-set", "Status": "ACTIVE"}},
+    )
+    stubber.add_response(
+        "update_stack_set",
+        {"OperationId": "update-op"},
+        {
+            "StackSetName": "my-stack-set",
+            "TemplateBody": "template",
+            "Parameters": [{"ParameterKey": "Branch", "ParameterValue": "main"}],
+            "Capabilities": [],
+            "OperationPreferences": PREFERENCES,
+        },
+    )
+    stubber.add_response(
+        "describe_stack_set_operation",
+        {"StackSetOperation": {"OperationId": "update-op", "Status": "RUNNING"}},
+    )
+    stubber.add_response(
+        "describe_stack_set_operation",
+        {"StackSetOperation": {"OperationId": "update-op", "Status": "SUCCEEDED"}},
+    )
+    stubber.add_response(
+        "list_stack_instances",
+        {"Summaries": [instance_summary("111111111111", "us-east-1")]},
+    )
+    stubber.add_response(
+        "create_stack_instances",
+        {"OperationId": "create-op"},
+        {
+            "StackSetName": "my-stack-set",
+            "Accounts": ["222222222222"],
+            "Regions": ["us-east-1"],
+            "OperationPreferences": PREFERENCES,
+        },
+    )
+    stubber.add_response(
+        "describe_stack_set_operation",
+        {"StackSetOperation": {"OperationId": "create-op", "Status": "FAILED"}},
+    )
+    stubber.add_response(
+        "list_stack_instances",
+        {
+            "Summaries": [
+                instance_summary("111111111111", "us-east-1"),
+                instance_summary("222222222222", "us-east-1", "INOPERABLE"),
+                instance_summary("333333333333", "us-east-1"),
+            ]
+        },
+    )
+
+    with stubber:
+        instances = StackSet(client, "my-stack-set", wait_delay=0).deploy(
+            "template",
+            {"Branch": "main"},
+            (["111111111111", "222222222222"], ["us-east-1"]),
+            PREFERENCES,
+        )
+
+    stubber.assert_no_pending_responses()
+    assert [(instance["Account"], instance["Status"]) for instance in instances] == [
+        ("111111111111", "CURRENT"),
+        ("222222222222", "INOPERABLE"),
+    ]
+
+
+def test_deploy_stack_set_report(capsys):
+    """Tests deploy_stack_set() reports instances without a detailed status"""
+    client, stubber = create_client()
+    stubber.add_response(
+        "describe_stack_set",
+        {"StackSet": {"StackSetName": "my-stack-set", "Status": "ACTIVE"}},
+    )
+    stubber.add_response("update_stack_set", {"OperationId": "update-op"})
+    stubber.add_response(
+        "describe_stack_set_operation",
+        {"StackSetOperation": {"OperationId": "update-op", "Status": "SUCCEEDED"}},
+    )
+    summaries = {
+        "Summaries": [
+            instance_summary("111111111111", "us-east-1"),
+            instance_summary("222222222222", "us-east-1", "OUTDATED", None),
+        ]
+    }
+    stubber.add_response("list_stack_instances", summaries)
+    stubber.add_response("list_stack_instances", summaries)
+
+    with stubber, pytest.raises(click.ClickException, match="1 of 2 StackSet"):
+        deploy_stack_set(
+            StackSet(client, "my-stack-set", wait_delay=0),
+            "template",
+            {},
+            (["111111111111", "222222222222"], ["us-east-1"]),
+            PREFERENCES,
+        )
+
+    assert capsys.readouterr().out.splitlines() == [
+        "111111111111 us-east-1 - SUCCEEDED",
+        "222222222222 us-east-1 - OUTDATED",
+    ]
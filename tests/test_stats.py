@@ -0,0 +1,66 @@
+from pipegen import stats
+from pipegen.config import parse_config
+from pipegen.generators import generate_template
+
+CONFIG = """
+config:
+    s3_bucket: my-bucket
+    kms_key_arn: kms-key-arn
+
+sources:
+    - name: Source
+      from: CodeCommit
+      repository: my-repo
+      branch: main
+
+stages:
+    - name: Build
+      actions:
+        - name: Build
+          buildspec: buildspecs/build.yml
+        - name: Test
+          commands:
+            - make test
+"""
+
+
+def test_template_stats():
+    """Tests template_stats() measures the template, its policies and buildspecs"""
+    config = parse_config(CONFIG, {})
+    template = generate_template(config)
+    template_stats = stats.template_stats(template, config)
+
+    assert template_stats.resource_count == len(template["Resources"])
+    assert template_stats.json_size == stats.serialized_size(template)
+    assert template_stats.yaml_size > template_stats.json_size
+    assert template_stats.resource_sizes[0][0] == "CodePipeline"
+    assert [name for name, _ in template_stats.policy_sizes] == [
+        "CodePipelinePolicy",
+        "CodeBuildPolicy",
+        "CloudWatchEventsPolicy",
+    ]
+    assert [name for name, _ in template_stats.buildspec_sizes] == ["CodeBuildTest"]
+
+    assert not stats.budget_failures(template_stats)
+    failures = stats.budget_failures(template_stats, percentage=1)
+    assert failures[0].startswith("Template YAML size of ")
+    assert failures[0].endswith("exceeds its budget of 512 (1% of 51,200)")
+
+
+def test_buildspec_sizes_paths():
+    """Tests buildspec_sizes() measures the buildspecs of path filtered actions as generated"""
+    config = parse_config(
+        CONFIG.replace(
+            "      branch: main\n",
+            "      branch: main\n      output_artifact_format: CODEBUILD_CLONE_REF\n",
+        ).replace(
+            "            - make test\n",
+            "            - make test\n          paths:\n            - src/**\n",
+        ),
+        {},
+    )
+    buildspec = generate_template(config)["Resources"]["CodeBuildTest"]["Properties"][
+        "Source"
+    ]["BuildSpec"]
+
+    assert stats.buildspec_sizes(config) == {"CodeBuildTest": len(buildspec)}
@@ -0,0 +1,258 @@
+import json
+from datetime import datetime, timezone
+from io import StringIO
+from typing import Literal
+
+import boto3
+from botocore.stub import Stubber
+
+from pipegen import tune
+from pipegen.config import parse_config, render_config
+
+CONFIG = """
+config:
+    s3_bucket: my-bucket
+    kms_key_arn: kms-key-arn
+
+sources:
+    - name: Source
+      from: CodeCommit
+      repository: my-repo
+      branch: {{ vars.BranchName }}
+
+stages:
+    - name: Build
+      actions:
+        # compiles everything
+        - name: Build
+          commands:
+            - make
+        - name: Lint
+          compute_type: BUILD_GENERAL1_MEDIUM
+          commands:
+            - make lint
+        - name: Test
+          commands:
+            - make test
+        - name: Package
+          commands:
+            - make package
+        - name: Release
+          compute_type: BUILD_GENERAL1_2XLARGE
+          commands:
+            - make release
+"""
+
+
+def phases(build_seconds):
+    """Generate recorded phases with a BUILD phase"""
+    return {"PROVISIONING": 20, "DOWNLOAD_SOURCE": 5, "BUILD": build_seconds}
+
+
+HISTORY = {
+    "projects": {
+        "CodeBuildBuild": [
+            {"phases": phases(60), "cpu_percent": 98.0, "memory_percent": 50.0},
+            {"phases": phases(70), "cpu_percent": 95.0, "memory_percent": 40.0},
+            {"phases": phases(65), "cpu_percent": 20.0, "memory_percent": 40.0},
+        ],
+        "CodeBuildLint": [
+            {"phases": phases(30), "cpu_percent": 12.0, "memory_percent": 10.0},
+            {"phases": phases(30), "cpu_percent": 15.0, "memory_percent": 12.0},
+            {"phases": phases(30), "cpu_percent": 80.0, "memory_percent": 12.0},
+        ],
+        "CodeBuildTest": [{"phases": phases(900)}, {"phases": phases(800)}],
+        "CodeBuildPackage": [
+            {"phases": phases(900)},
+            {"phases": phases(800)},
+            {"phases": phases(700)},
+        ],
+        "CodeBuildRelease": [{"phases": phases(1)}] * 3,
+    }
+}
+
+
+def test_recommend():
+    """Tests recommend() resizes actions by their utilization, or slow builds without it"""
+    config = parse_config(CONFIG, {"BranchName": "main"})
+    history = tune.load_history(StringIO(json.dumps(HISTORY)))
+
+    assert [
+        (recommendation.action, recommendation.recommended)
+        for recommendation in tune.recommend(config, history)
+    ] == [
+        ("Build", "BUILD_GENERAL1_MEDIUM"),
+        ("Lint", "BUILD_GENERAL1_SMALL"),
+        ("Test", "BUILD_GENERAL1_SMALL"),
+        ("Package", "BUILD_GENERAL1_MEDIUM"),
+        ("Release", "BUILD_GENERAL1_2XLARGE"),
+    ]
+    assert tune.recommend(config, history)[1].reason == (
+        "peak CPU p50 is 15%, peak memory p50 is 12%"
+    )
+    assert tune.recommend(config, history)[2].reason == "only 2 builds, of 3 needed"
+
+
+def test_patch_compute_types():
+    """Tests patch_compute_types() replaces or adds actions' compute types, keeping the rest"""
+    patched, unpatched = tune.patch_compute_types(
+        CONFIG,
+        render_config(CONFIG, {"BranchName": "main"}),
+        {"Build": "BUILD_GENERAL1_MEDIUM", "Lint": "BUILD_GENERAL1_SMALL"},
+    )
+
+    assert not unpatched
+    assert patched == CONFIG.replace(
+        "        - name: Build\n",
+        "        - name: Build\n          compute_type: BUILD_GENERAL1_MEDIUM\n",
+    ).replace(
+        "compute_type: BUILD_GENERAL1_MEDIUM\n          commands:\n            - make lint",
+        "compute_type: BUILD_GENERAL1_SMALL\n          commands:\n            - make lint",
+    )
+    config = parse_config(patched, {"BranchName": "main"})
+    assert [action.compute_type for action in config.stages[0].actions[:2]] == [
+        "BUILD_GENERAL1_MEDIUM",
+        "BUILD_GENERAL1_SMALL",
+    ]
+
+
+def test_patch_compute_types_positions():
+    """Tests patch_compute_types() finds actions by their keys, and reports templated ones"""
+    config_text = (
+        CONFIG.replace("    - name: Source\n", "    - name: Test\n")
+        .replace(
+            "        - name: Package\n          commands:\n            - make package\n",
+            "        - commands:\n            - make package\n          name: Package\n",
+        )
+        .replace(
+            "        - name: Release\n          compute_type: BUILD_GENERAL1_2XLARGE\n",
+            "        - name: Release\n          compute_type: {{ vars.Size }}\n",
+        )
+    )
+    compute_types = {
+        "Test": "BUILD_GENERAL1_MEDIUM",
+        "Package": "BUILD_GENERAL1_LARGE",
+        "Release": "BUILD_GENERAL1_SMALL",
+    }
+    config_vars = {"BranchName": "main", "Size": "BUILD_GENERAL1_2XLARGE"}
+
+    patched, unpatched = tune.patch_compute_types(
+        config_text, render_config(config_text, config_vars), compute_types
+    )
+
+    assert unpatched == ["Release"]
+    config = parse_config(patched, config_vars)
+    assert config.sources[0].name == "Test"
+    assert [action.compute_type for action in config.stages[0].actions[2:]] == [
+        "BUILD_GENERAL1_MEDIUM",
+        "BUILD_GENERAL1_LARGE",
+        "BUILD_GENERAL1_2XLARGE",
+    ]
+
+    # a loop moves the lines of the actions after it
+    looped = config_text.replace(
+        "stages:\n",
+        "stages:\n{% for name in ['Check', 'Scan'] %}\n"
+        "    - name: {{ name }}\n      actions:\n"
+        "        - name: {{ name }}Action\n          commands:\n            - make\n"
+        "{% endfor %}\n",
+    )
+    assert tune.patch_compute_types(
+        looped, render_config(looped, config_vars), compute_types
+    ) == (looped, ["Test", "Package", "Release"])
+
+
+def create_client(service: Literal["cloudformation", "cloudwatch", "codebuild"]):
+    """Create a stubbed client"""
+    client = boto3.client(
+        service,
+        region_name="us-east-1",
+        aws_access_key_id="testing",
+        aws_secret_access_key="testing",
+    )
+    return client, Stubber(client)
+
+
+def test_record_history():
+    """Tests record_history() records succeeded builds' phases and peak utilization"""
+    started = datetime(2021, 1, 1, tzinfo=timezone.utc)
+    cloudformation, cloudformation_stubber = create_client("cloudformation")
+    codebuild, codebuild_stubber = create_client("codebuild")
+    cloudwatch, cloudwatch_stubber = create_client("cloudwatch")
+    cloudformation_stubber.add_response(
+        "list_stack_resources",
+        {
+            "StackResourceSummaries": [
+                {
+                    "LogicalResourceId": logical_id,
+                    "PhysicalResourceId": physical_id,
+                    "ResourceType": resource_type,
+                    "LastUpdatedTimestamp": started,
+                    "ResourceStatus": "CREATE_COMPLETE",
+                }
+                for logical_id, physical_id, resource_type in [
+                    ("CodePipeline", "my-pipeline", "AWS::CodePipeline::Pipeline"),
+                    ("CodeBuildBuild", "CodeBuildBuild-abc", "AWS::CodeBuild::Project"),
+                ]
+            ]
+        },
+        {"StackName": "my-stack"},
+    )
+    codebuild_stubber.add_response(
+        "list_builds_for_project",
+        {"ids": ["build:2", "build:1"]},
+        {"projectName": "CodeBuildBuild-abc", "sortOrder": "DESCENDING"},
+    )
+    codebuild_stubber.add_response(
+        "batch_get_builds",
+        {
+            "builds": [
+                {
+                    "id": build_id,
+                    "buildStatus": status,
+                    "startTime": started,
+                    "endTime": started,
+                    "phases": [
+                        {"phaseType": "BUILD", "durationInSeconds": 60},
+                        {"phaseType": "COMPLETED"},
+                    ],
+                }
+                for build_id, status in [
+                    ("build:2", "SUCCEEDED"),
+                    ("build:1", "FAILED"),
+                ]
+            ]
+        },
+        {"ids": ["build:2"]},
+    )
+    cloudwatch_stubber.add_response(
+        "get_metric_data",
+        {
+            "MetricDataResults": [
+                {"Id": "cpu", "Values": [50.0, 90.0]},
+                {"Id": "memory", "Values": []},
+            ]
+        },
+    )
+
+    with cloudformation_stubber, codebuild_stubber, cloudwatch_stubber:
+        history = tune.record_history(
+            {
+                "cloudformation": cloudformation,
+                "codebuild": codebuild,
+                "cloudwatch": cloudwatch,
+            },
+            "my-stack",
+            1,
+        )
+
+    assert history == {
+        "CodeBuildBuild": [
+            tune.BuildRecord(
+                phases=(("BUILD", 60.0), ("COMPLETED", 0.0)), cpu_percent=90.0
+            )
+        ]
+    }
+    output = StringIO()
+    tune.dump_history(history, output)
+    assert tune.load_history(StringIO(output.getvalue())) == history
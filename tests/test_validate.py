@@ -0,0 +1,76 @@
+from pipegen import validate
+
+
+def write_configs(tmp_path, valid_config):
+    """Write a set of valid and invalid configs"""
+    (tmp_path / "nested").mkdir()
+    (tmp_path / "valid.yml").write_text(valid_config)
+    (tmp_path / "nested" / "valid.yml").write_text(valid_config)
+    (tmp_path / "invalid.yml").write_text("config:\n    s3_bucket: my-bucket\n")
+    (tmp_path / "syntax.yml").write_text("config:\n    s3_bucket: {{ oops\n")
+
+
+def test_expand_paths(tmp_path, valid_config):
+    """Tests expand_paths()"""
+    write_configs(tmp_path, valid_config)
+
+    assert validate.expand_paths(
+        [f"{tmp_path}/**/valid.yml", f"{tmp_path}/valid.yml", "missing.yml"]
+    ) == [
+        f"{tmp_path}/nested/valid.yml",
+        f"{tmp_path}/valid.yml",
+        "missing.yml",
+    ]
+
+
+def test_validate_files(tmp_path, valid_config):
+    """Tests validate_files() reports errors with file and line context"""
+    write_configs(tmp_path, valid_config)
+    paths = validate.expand_paths([f"{tmp_path}/*.yml", f"{tmp_path}/missing.yml"])
+
+    for jobs in [1, 2]:
+        results = validate.validate_files(paths, {"BranchName": "main"}, jobs)
+        assert [result.path for result in results] == paths
+
+        errors = {result.path: result.error for result in results}
+        assert errors[f"{tmp_path}/valid.yml"] is None
+        assert (
+            f'in "{tmp_path}/invalid.yml", line 1' in errors[f"{tmp_path}/invalid.yml"]
+        )
+        assert errors[f"{tmp_path}/syntax.yml"].startswith(f"{tmp_path}/syntax.yml:2: ")
+        assert errors[f"{tmp_path}/missing.yml"].startswith(
+            f"{tmp_path}/missing.yml: FileNotFoundError"
+        )
+
+    results = validate.validate_files([f"{tmp_path}/valid.yml"], {})
+    assert "UndefinedError" in results[0].error
+
+
+def test_validate_files_includes(tmp_path, valid_config):
+    """Tests validate_files() loads includes from each config's own directory"""
+    (tmp_path / "configs").mkdir()
+    (tmp_path / "configs" / "base.yml").write_text(valid_config)
+    (tmp_path / "configs" / "pipeline.yml").write_text('{% include "base.yml" %}\n')
+
+    results = validate.validate_files(
+        [f"{tmp_path}/configs/pipeline.yml"], {"BranchName": "main"}, 2
+    )
+
+    assert results[0].error is None
+
+
+def test_validate_files_internal_error(tmp_path, valid_config, monkeypatch):
+    """Tests validate_files() reports unexpected failures per file"""
+    (tmp_path / "valid.yml").write_text(valid_config)
+
+    def fail_generate(_):
+        raise TypeError("unexpected")
+
+    monkeypatch.setattr(validate, "generate", fail_generate)
+    paths = [f"{tmp_path}/valid.yml", f"{tmp_path}/missing.yml"]
+    results = validate.validate_files(paths, {"BranchName": "main"}, 1)
+
+    assert results[0].error == (
+        f"{tmp_path}/valid.yml: internal error: TypeError: unexpected"
+    )
+    assert results[1].error.startswith(f"{tmp_path}/missing.yml: FileNotFoundError")